@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""Compare the generated NetHSM client with pynitrokey.nethsm.codec.
+
+For every endpoint, the request body is serialized and a response body is
+deserialized, once with the generated schema classes and once with the lean
+codec.  No NetHSM is required.
+
+    python benchmarks/nethsm_codec.py [-n ITERATIONS]
+"""
+
+import argparse
+import base64
+import json
+import timeit
+
+import urllib3
+
+from pynitrokey.nethsm import codec
+from pynitrokey.nethsm.client import Configuration
+from pynitrokey.nethsm.client.model.base64 import Base64
+from pynitrokey.nethsm.client.model.decrypt_mode import DecryptMode
+from pynitrokey.nethsm.client.model.decrypt_request_data import DecryptRequestData
+from pynitrokey.nethsm.client.model.encrypt_mode import EncryptMode
+from pynitrokey.nethsm.client.model.encrypt_request_data import EncryptRequestData
+from pynitrokey.nethsm.client.model.random_request_data import RandomRequestData
+from pynitrokey.nethsm.client.model.sign_mode import SignMode
+from pynitrokey.nethsm.client.model.sign_request_data import SignRequestData
+from pynitrokey.nethsm.client.paths.keys_key_id_decrypt import post as decrypt_post
+from pynitrokey.nethsm.client.paths.keys_key_id_encrypt import post as encrypt_post
+from pynitrokey.nethsm.client.paths.keys_key_id_sign import post as sign_post
+from pynitrokey.nethsm.client.paths.random import post as random_post
+
+CONFIGURATION = Configuration(host="https://nethsm/api/v1")
+MESSAGE = base64.b64encode(bytes(32)).decode()
+IV = base64.b64encode(bytes(16)).decode()
+SIGNATURE = base64.b64encode(bytes(64)).decode()
+
+
+def _response(body):
+    return urllib3.HTTPResponse(
+        body=json.dumps(body).encode(),
+        headers={"Content-Type": "application/json"},
+        status=200,
+    )
+
+
+def _path(module, key_id):
+    return module.request_path_key_id.serialize(key_id)
+
+
+def generated_sign():
+    _path(sign_post, "key")
+    body = SignRequestData(message=Base64(MESSAGE), mode=SignMode("EdDSA"))
+    sign_post.request_body_sign_request_data.serialize(body, "application/json")
+    response = sign_post._response_for_200.deserialize(
+        _response({"signature": SIGNATURE}), CONFIGURATION
+    )
+    return response.body["signature"]
+
+
+def codec_sign():
+    codec.encode_sign_request(MESSAGE, "EdDSA")
+    return codec.decode_sign_response(json.dumps({"signature": SIGNATURE}))
+
+
+def generated_encrypt():
+    _path(encrypt_post, "key")
+    body = EncryptRequestData(
+        message=Base64(MESSAGE), mode=EncryptMode("AES_CBC"), iv=Base64(IV)
+    )
+    encrypt_post.request_body_encrypt_request_data.serialize(body, "application/json")
+    response = encrypt_post._response_for_200.deserialize(
+        _response({"encrypted": MESSAGE, "iv": IV}), CONFIGURATION
+    )
+    return (response.body["encrypted"], response.body["iv"])
+
+
+def codec_encrypt():
+    codec.encode_encrypt_request(MESSAGE, "AES_CBC", IV)
+    return codec.decode_encrypt_response(json.dumps({"encrypted": MESSAGE, "iv": IV}))
+
+
+def generated_decrypt():
+    _path(decrypt_post, "key")
+    body = DecryptRequestData(encrypted=Base64(MESSAGE), mode=DecryptMode("RAW"))
+    decrypt_post.request_body_decrypt_request_data.serialize(body, "application/json")
+    response = decrypt_post._response_for_200.deserialize(
+        _response({"decrypted": MESSAGE}), CONFIGURATION
+    )
+    return response.body["decrypted"]
+
+
+def codec_decrypt():
+    codec.encode_decrypt_request(MESSAGE, "RAW")
+    return codec.decode_decrypt_response(json.dumps({"decrypted": MESSAGE}))
+
+
+def generated_random():
+    body = RandomRequestData(length=32)
+    random_post.request_body_random_request_data.serialize(body, "application/json")
+    response = random_post._response_for_200.deserialize(
+        _response({"random": MESSAGE}), CONFIGURATION
+    )
+    return response.body["random"]
+
+
+def codec_random():
+    codec.encode_random_request(32)
+    return codec.decode_random_response(json.dumps({"random": MESSAGE}))
+
+
+BENCHMARKS = [
+    ("sign", generated_sign, codec_sign),
+    ("encrypt", generated_encrypt, codec_encrypt),
+    ("decrypt", generated_decrypt, codec_decrypt),
+    ("random", generated_random, codec_random),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'endpoint':<10}{'generated':>14}{'codec':>14}{'speedup':>10}")
+    for name, generated, lean in BENCHMARKS:
+        assert generated() == lean()
+        results = []
+        for func in (generated, lean):
+            seconds = min(timeit.repeat(func, number=args.iterations, repeat=3))
+            results.append(seconds / args.iterations * 1e6)
+        print(
+            f"{name:<10}{results[0]:>11.1f} us{results[1]:>11.1f} us"
+            f"{results[0] / results[1]:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
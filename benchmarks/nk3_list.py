@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""Measure the enumeration of Nitrokey 3 devices with simulated HID devices.
+
+The HID layer is replaced with fake CTAPHID connections that answer every
+packet after a fixed latency, so the measured time is dominated by the USB
+round trips like on a host with many keys.  The previous implementation of
+Nitrokey3Device.list, which opened every CTAPHID device and queried the
+admin status of each Nitrokey 3 device one after the other, is compared to
+the current one.  No device is required.
+
+    python benchmarks/nk3_list.py [-d DEVICES] [-o OTHER] [-l LATENCY_MS]
+"""
+
+import argparse
+import struct
+import time
+
+from fido2.hid import CTAPHID, TYPE_INIT, CtapHidDevice, HidDescriptor
+
+import pynitrokey.nk3.device
+from pynitrokey.nk3 import PID_NITROKEY3_DEVICE, VID_NITROKEY
+from pynitrokey.nk3.device import Command, Nitrokey3Device
+
+PACKET_SIZE = 64
+CHANNEL = 0x01020304
+
+
+class FakeConnection:
+    """A CTAPHID connection that answers INIT and ADMIN requests."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.response = b""
+
+    def write_packet(self, packet):
+        (channel, cmd, length) = struct.unpack_from(">IBH", packet)
+        data = packet[7 : 7 + length]
+        if cmd == TYPE_INIT | CTAPHID.INIT:
+            # nonce, channel, protocol and device version, capabilities
+            data = data + struct.pack(">IBBBBB", CHANNEL, 2, 1, 0, 0, 0x0C)
+        elif cmd == TYPE_INIT | Command.ADMIN.value:
+            # status: init status, free internal and external blocks, variant
+            data = bytes([0, 80, 0, 250, 1])
+        else:
+            (cmd, data) = (TYPE_INIT | CTAPHID.ERROR, bytes([0x01]))
+        header = struct.pack(">IBH", channel, cmd, len(data))
+        self.response = (header + data).ljust(PACKET_SIZE, b"\0")
+
+    def read_packet(self):
+        time.sleep(self.latency)
+        return self.response
+
+    def close(self):
+        pass
+
+
+def descriptors(devices, other):
+    result = []
+    for i in range(devices + other):
+        (vid, pid) = (
+            (VID_NITROKEY, PID_NITROKEY3_DEVICE) if i < devices else (0x1050, 0x0407)
+        )
+        path = f"/dev/hidraw{i}"
+        result.append(
+            HidDescriptor(path, vid, pid, PACKET_SIZE, PACKET_SIZE, None, None)
+        )
+    return result
+
+
+def list_serial(all_descriptors, latency):
+    # the previous implementation of Nitrokey3Device.list
+    devices = []
+    for descriptor in all_descriptors:
+        device = CtapHidDevice(descriptor, FakeConnection(latency))
+        try:
+            nk3 = Nitrokey3Device(device)
+            nk3.status()
+            devices.append(nk3)
+        except ValueError:
+            pass
+    return devices
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-d", "--devices", type=int, default=30)
+    parser.add_argument("-o", "--other", type=int, default=5)
+    parser.add_argument("-l", "--latency-ms", type=float, default=4.0)
+    args = parser.parse_args()
+
+    latency = args.latency_ms / 1000
+    all_descriptors = descriptors(args.devices, args.other)
+    pynitrokey.nk3.device.list_descriptors = lambda: all_descriptors
+    pynitrokey.nk3.device.open_connection = lambda d: FakeConnection(latency)
+
+    print(
+        f"{args.devices} Nitrokey 3 and {args.other} other devices, "
+        f"{args.latency_ms} ms per packet"
+    )
+    print(f"{'mode':<12}{'enumeration':>14}")
+    results = []
+    for (name, fn) in [
+        ("serial", lambda: list_serial(all_descriptors, latency)),
+        ("parallel", Nitrokey3Device.list),
+    ]:
+        start = time.perf_counter()
+        devices = fn()
+        results.append(time.perf_counter() - start)
+        assert len(devices) == args.devices
+        print(f"{name:<12}{results[-1] * 1000:>11.1f} ms")
+    print(f"speedup {results[0] / results[1]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
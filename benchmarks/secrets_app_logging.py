@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""Measure the host overhead of a Secrets App exchange with and without trace.
+
+A fake device answers a List request with a multi-packet response, so only
+the host side of SecretsApp._send_receive is measured.  With trace, every
+APDU is formatted and decoded for a log function that discards it, which is
+what every exchange did before the trace was made optional.  No device is
+required.
+
+    python benchmarks/secrets_app_logging.py [-n ITERATIONS] [-c CREDENTIALS]
+"""
+
+import argparse
+import logging
+import timeit
+
+from pynitrokey.nk3.secrets_app import Instruction, SecretsApp, Tag
+
+PACKET_SIZE = 1024
+
+
+class FakeDevice:
+    """Answers every request with the next packet of a fixed response."""
+
+    def __init__(self, response):
+        self.packets = [
+            response[i : i + PACKET_SIZE] for i in range(0, len(response), PACKET_SIZE)
+        ]
+        self.index = 0
+
+    def otp(self, data=b""):
+        if data[1] != Instruction.SendRemaining.value:
+            self.index = 0
+        packet = self.packets[self.index]
+        self.index += 1
+        remaining = len(self.packets) - self.index
+        status = bytes([0x61, 0xFF]) if remaining else bytes([0x90, 0x00])
+        return status + packet
+
+
+def list_response(credentials):
+    # encoded manually because tlv8.encode separates entries with the same tag
+    response = b""
+    for i in range(credentials):
+        data = bytes([0x21]) + f"credential{i:04}".encode()
+        response += bytes([Tag.NameList.value, len(data)]) + data
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--iterations", type=int, default=2000)
+    parser.add_argument("-c", "--credentials", type=int, default=100)
+    args = parser.parse_args()
+
+    response = list_response(args.credentials)
+    device = FakeDevice(response)
+    # a logger that discards the messages like an unconfigured one
+    logger = logging.getLogger("secrets_app_logging")
+    logger.setLevel(logging.WARNING)
+
+    print(
+        f"{len(response)} bytes in {len(device.packets)} packets, "
+        f"{args.iterations} exchanges"
+    )
+    print(f"{'mode':<10}{'per exchange':>16}")
+    results = []
+    for (name, trace) in [("trace", True), ("default", False)]:
+        app = SecretsApp(device, logfn=logger.info, trace=trace)  # type: ignore
+        assert len(app.list()) == args.credentials
+
+        def exchange():
+            return app._send_receive(Instruction.List)
+
+        seconds = min(timeit.repeat(exchange, number=args.iterations, repeat=3))
+        results.append(seconds / args.iterations * 1e6)
+        print(f"{name:<10}{results[-1]:>13.1f} us")
+    print(f"speedup {results[0] / results[1]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,29 +7,29 @@
 # http://opensource.org/licenses/MIT>, at your option. This file may not be
 # copied, modified, or distributed except according to those terms.
 
+import base64
 import contextlib
 import datetime
 import mimetypes
 import os.path
+import sys
+import time
 
 import click
-import requests
 import urllib3
 
 import pynitrokey.nethsm
-from pynitrokey.helpers import prompt
+from pynitrokey.helpers import ProgressBar, prompt
+from pynitrokey.nethsm.bench import BENCHMARK_NAMES
 
 
 def make_enum_type(enum_cls):
     return click.Choice([variant.value for variant in enum_cls], case_sensitive=False)
 
 
+DEFAULT_PARALLEL_HOSTS = 16
 API_CERTIFICATE_MIME_TYPE = "application/x-pem-file"
-KEY_CERTIFICATE_MIME_TYPES = [
-    "application/x-pem-file",
-    "application/x-x509-ca-cert",
-    "application/pgp-keys",
-]
+KEY_CERTIFICATE_MIME_TYPES = pynitrokey.nethsm.KEY_CERTIFICATE_MIME_TYPES
 
 
 DATETIME_TYPE = click.DateTime(formats=["%Y-%m-%dT%H:%M:%S%z"])
@@ -44,27 +44,90 @@ DECRYPT_MODE_TYPE = make_enum_type(pynitrokey.nethsm.DecryptMode)
 SIGN_MODE_TYPE = make_enum_type(pynitrokey.nethsm.SignMode)
 
 
-def print_row(values, widths):
+def workers_option(help):
+    return click.option(
+        "-j",
+        "--workers",
+        type=click.IntRange(min=1),
+        default=pynitrokey.nethsm.DEFAULT_WORKERS,
+        show_default=True,
+        help=help,
+    )
+
+
+def print_row(values, widths, file=None):
     row = [value.ljust(width) for (value, width) in zip(values, widths)]
-    print(*row, sep="\t")
+    print(*row, sep="\t", file=file)
 
 
-def print_table(headers, data):
+def print_table(headers, data, file=None):
     widths = [len(header) for header in headers]
     for row in data:
         for i in range(len(widths)):
             row[i] = str(row[i])
             widths[i] = max(widths[i], len(row[i]))
 
-    print_row(headers, widths)
-    print_row(["-" * width for width in widths], widths)
+    print_row(headers, widths, file)
+    print_row(["-" * width for width in widths], widths, file)
     for row in data:
-        print_row(row, widths)
+        print_row(row, widths, file)
+
+
+def print_stats(stats):
+    def format_ms(seconds):
+        return f"{seconds * 1000:.2f}"
+
+    data = []
+    for name, phases in stats.summary().items():
+        endpoint = stats.endpoints[name]
+        throughput = endpoint.throughput
+        for phase, (count, percentiles) in phases.items():
+            data.append(
+                [
+                    name,
+                    phase,
+                    count,
+                    *[format_ms(p) for p in percentiles],
+                    f"{throughput:.1f}" if throughput and phase == "total" else "",
+                    endpoint.errors if phase == "total" else "",
+                ]
+            )
+
+    if data:
+        headers = ["Endpoint", "Phase", "Count", "p50 ms", "p95 ms", "p99 ms"]
+        headers += ["Calls/s", "Errors"]
+        print(file=sys.stderr)
+        print_table(headers, data, file=sys.stderr)
 
 
 @click.group()
 @click.option(
-    "-h", "--host", "host", required=True, help="Set the host of the NetHSM API"
+    "-h",
+    "--host",
+    "hosts",
+    multiple=True,
+    help="Set the host of the NetHSM API.  Read-only and crypto commands accept "
+    "several hosts that share the same keys and users, administrative commands "
+    "are executed on every host.",
+)
+@click.option(
+    "--hosts-file",
+    type=click.File("r"),
+    help="Read additional hosts from a file with one host per line",
+)
+@click.option(
+    "--parallel",
+    type=click.IntRange(min=1),
+    default=DEFAULT_PARALLEL_HOSTS,
+    show_default=True,
+    help="The maximum number of hosts that administrative commands are executed "
+    "on concurrently",
+)
+@click.option(
+    "--json",
+    "json_output",
+    is_flag=True,
+    help="Print the per-host results of administrative commands as JSON",
 )
 @click.option(
     "-v",
@@ -80,32 +143,85 @@ def print_table(headers, data):
     default=True,
     help="Whether to verify the TLS certificate of the NetHSM",
 )
+@click.option(
+    "--timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    help="The timeout for requests to the NetHSM in seconds",
+)
+@click.option(
+    "--stats",
+    is_flag=True,
+    help="Print latency statistics for the NetHSM API calls to stderr at exit",
+)
 @click.pass_context
-def nethsm(ctx, host, version, username, password, verify_tls):
+def nethsm(
+    ctx,
+    hosts,
+    hosts_file,
+    parallel,
+    json_output,
+    version,
+    username,
+    password,
+    verify_tls,
+    timeout,
+    stats,
+):
     """Interact with NetHSM devices, see subcommands."""
     ctx.ensure_object(dict)
 
-    ctx.obj["NETHSM_HOST"] = host
+    hosts = list(hosts)
+    if hosts_file:
+        hosts += read_hosts_file(hosts_file)
+    if not hosts:
+        raise click.UsageError("Missing option '-h' / '--host' or '--hosts-file'")
+
+    ctx.obj["NETHSM_HOSTS"] = hosts
+    ctx.obj["NETHSM_PARALLEL"] = parallel
+    ctx.obj["NETHSM_JSON"] = json_output
     ctx.obj["NETHSM_VERSION"] = version
     ctx.obj["NETHSM_USERNAME"] = username
     ctx.obj["NETHSM_PASSWORD"] = password
     ctx.obj["NETHSM_VERIFY_TLS"] = verify_tls
+    ctx.obj["NETHSM_TIMEOUT"] = timeout
+    ctx.obj["NETHSM_STATS"] = None
+
+    if stats:
+        from pynitrokey.nethsm.stats import RequestStats
+
+        request_stats = RequestStats()
+        ctx.obj["NETHSM_STATS"] = request_stats
+        ctx.call_on_close(lambda: print_stats(request_stats))
 
     if not verify_tls:
         urllib3.disable_warnings()
 
 
 @contextlib.contextmanager
-def connect(ctx, require_auth=True):
-    host = ctx.obj["NETHSM_HOST"]
+def connect_each(hosts, *args, **kwargs):
+    with contextlib.ExitStack() as stack:
+        yield [
+            stack.enter_context(pynitrokey.nethsm.connect(host, *args, **kwargs))
+            for host in hosts
+        ]
+
+
+def connect_args(ctx, require_auth, pool_size, username=None, password=None):
+    """Return the arguments for pynitrokey.nethsm.connect except the host and
+    prompt for missing credentials."""
+    host = ", ".join(ctx.obj["NETHSM_HOSTS"])
     version = ctx.obj["NETHSM_VERSION"]
-    username = None
-    password = None
     verify_tls = ctx.obj["NETHSM_VERIFY_TLS"]
+    timeout = ctx.obj["NETHSM_TIMEOUT"]
 
-    if require_auth:
+    if not require_auth:
+        username = None
+        password = None
+    elif not username:
         username = ctx.obj["NETHSM_USERNAME"]
         password = ctx.obj["NETHSM_PASSWORD"]
+
+    if require_auth:
         if not username:
             username = prompt(f"[auth] User name for NetHSM {host}")
         if not password:
@@ -113,9 +229,37 @@ def connect(ctx, require_auth=True):
                 f"[auth] Password for user {username} on NetHSM {host}", hide_input=True
             )
 
-    with pynitrokey.nethsm.connect(
-        host, version, username, password, verify_tls
-    ) as nethsm:
+    args = (version, username, password, verify_tls, pool_size, timeout)
+    kwargs = {"stats": ctx.obj["NETHSM_STATS"]}
+    return (args, kwargs)
+
+
+@contextlib.contextmanager
+def connect(
+    ctx,
+    require_auth=True,
+    pool_size=pynitrokey.nethsm.DEFAULT_POOL_SIZE,
+    cluster=False,
+    each=False,
+    username=None,
+    password=None,
+):
+    hosts = ctx.obj["NETHSM_HOSTS"]
+    (args, kwargs) = connect_args(ctx, require_auth, pool_size, username, password)
+    if each:
+        manager = connect_each(hosts, *args, **kwargs)
+    elif cluster:
+        from pynitrokey.nethsm.cluster import connect as connect_cluster
+
+        manager = connect_cluster(hosts, *args, **kwargs)
+    elif len(hosts) == 1:
+        manager = pynitrokey.nethsm.connect(hosts[0], *args, **kwargs)
+    else:
+        raise click.ClickException(
+            f"The {ctx.info_name} command can only be used with a single host"
+        )
+
+    with manager as nethsm:
         import urllib3.exceptions
 
         try:
@@ -129,10 +273,88 @@ def connect(ctx, require_auth=True):
                 )
             else:
                 raise e
-        except requests.exceptions.SSLError as e:
-            raise click.ClickException(
-                f"Could not connect to the NetHSM: {e}\nIf you use a self-signed certificate, please set the --no-verify-tls option."
-            )
+
+
+def read_hosts_file(f):
+    """Read a host inventory with one host per line; empty lines and comments
+    starting with # are ignored."""
+    hosts = []
+    for line in f:
+        host = line.split("#", 1)[0].strip()
+        if host:
+            hosts.append(host)
+    return hosts
+
+
+def format_host_error(e):
+    if isinstance(e, urllib3.exceptions.MaxRetryError) and e.reason:
+        e = e.reason
+    if isinstance(e, urllib3.exceptions.NewConnectionError):
+        # strip the connection object from the message
+        return str(e).split(": ", 1)[-1]
+    return str(e).strip().splitlines()[0]
+
+
+def fan_out(ctx, func, require_auth=True):
+    """Execute an administrative command on every host.
+
+    func is called with a NetHSM instance and returns a message and a dict with
+    the results for the host.  With a single host, only the message is printed.
+    With several hosts, func is called concurrently for up to --parallel hosts
+    and the results and errors are printed as a table with one row per host,
+    or as JSON if the --json option is set."""
+    import concurrent.futures
+    import json
+
+    hosts = ctx.obj["NETHSM_HOSTS"]
+    json_output = ctx.obj["NETHSM_JSON"]
+    if len(hosts) == 1 and not json_output:
+        with connect(ctx, require_auth=require_auth) as nethsm:
+            (message, _) = func(nethsm)
+            print(message)
+        return
+
+    (args, kwargs) = connect_args(ctx, require_auth, pool_size=1)
+
+    def run(host):
+        try:
+            with pynitrokey.nethsm.connect(host, *args, **kwargs) as nethsm:
+                (_, result) = func(nethsm)
+            return (host, result, None)
+        except (pynitrokey.nethsm.NetHSMError, urllib3.exceptions.HTTPError) as e:
+            return (host, {}, format_host_error(e))
+
+    workers = min(ctx.obj["NETHSM_PARALLEL"], len(hosts))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(run, hosts))
+
+    if json_output:
+        data = [
+            {
+                "host": host,
+                "status": "failed" if error else "ok",
+                "error": error,
+                "result": result,
+            }
+            for (host, result, error) in results
+        ]
+        print(json.dumps(data, indent=2, default=str))
+    else:
+        fields = []
+        for (_, result, _) in results:
+            fields += [field for field in result if field not in fields]
+        data = [
+            [host, f"failed: {error}" if error else "ok"]
+            + [result.get(field, "") for field in fields]
+            for (host, result, error) in results
+        ]
+        print_table(["Host", "Status"] + fields, data)
+
+    failed = len([error for (_, _, error) in results if error])
+    if failed:
+        raise click.ClickException(
+            f"{ctx.info_name} failed on {failed} of {len(hosts)} hosts"
+        )
 
 
 @nethsm.command()
@@ -204,13 +426,14 @@ def provision(ctx, unlock_passphrase, admin_passphrase, system_time):
     default=True,
     help="Also query the real name and role of the user",
 )
+@workers_option("The maximum number of concurrent requests for the details")
 @click.pass_context
-def list_users(ctx, details):
+def list_users(ctx, details, workers):
     """List all users on the NetHSM.
 
     This command requires authentication as a user with the Administrator
     role."""
-    with connect(ctx) as nethsm:
+    with connect(ctx, pool_size=workers, cluster=True) as nethsm:
         user_ids = nethsm.list_users()
 
         print(f"Users on NetHSM {nethsm.host}:")
@@ -219,10 +442,8 @@ def list_users(ctx, details):
         headers = ["User ID"]
         if details:
             headers += ["Real name", "Role"]
-            data = []
-            for user_id in user_ids:
-                user = nethsm.get_user(user_id=user_id)
-                data.append([user_id, user.real_name, user.role.value])
+            users = nethsm.get_users(user_ids, workers=workers)
+            data = [[user.user_id, user.real_name, user.role.value] for user in users]
         else:
             data = [[user_id] for user_id in user_ids]
 
@@ -237,7 +458,7 @@ def get_user(ctx, user_id):
 
     This command requires authentication as a user with the Administrator or
     Operator role."""
-    with connect(ctx) as nethsm:
+    with connect(ctx, cluster=True) as nethsm:
         user = nethsm.get_user(user_id=user_id)
         print(f"User {user_id} on NetHSM {nethsm.host}")
         print(f"Real name:  {user.real_name}")
@@ -268,9 +489,13 @@ def add_user(ctx, real_name, role, passphrase, user_id):
 
     This command requires authentication as a user with the Administrator
     role."""
-    with connect(ctx) as nethsm:
-        user_id = nethsm.add_user(real_name, role, passphrase, user_id)
-        print(f"User {user_id} added to NetHSM {nethsm.host}")
+
+    def run(nethsm):
+        new_user_id = nethsm.add_user(real_name, role, passphrase, user_id)
+        message = f"User {new_user_id} added to NetHSM {nethsm.host}"
+        return (message, {"User ID": new_user_id})
+
+    fan_out(ctx, run)
 
 
 @nethsm.command()
@@ -281,9 +506,12 @@ def delete_user(ctx, user_id):
 
     This command requires authentication as a user with the Administrator
     role."""
-    with connect(ctx) as nethsm:
+
+    def run(nethsm):
         nethsm.delete_user(user_id)
-        print(f"User {user_id} deleted on NetHSM {nethsm.host}")
+        return (f"User {user_id} deleted on NetHSM {nethsm.host}", {})
+
+    fan_out(ctx, run)
 
 
 @nethsm.command()
@@ -317,7 +545,7 @@ def list_operator_tags(ctx, user_id):
     """List the tags for an operator user ID on the NetHSM.
 
     This command requires authentication as a user with the Administrator role."""
-    with connect(ctx) as nethsm:
+    with connect(ctx, cluster=True) as nethsm:
         tags = nethsm.list_operator_tags(user_id=user_id)
         if tags:
             print(f"Tags for user {user_id}:")
@@ -336,9 +564,12 @@ def add_operator_tag(ctx, user_id, tag):
 
     This command requires authentication as a user with the Administrator
     role."""
-    with connect(ctx) as nethsm:
+
+    def run(nethsm):
         nethsm.add_operator_tag(user_id=user_id, tag=tag)
-        print(f"Added tag {tag} for user {user_id} on the NetHSM {nethsm.host}")
+        return (f"Added tag {tag} for user {user_id} on the NetHSM {nethsm.host}", {})
+
+    fan_out(ctx, run)
 
 
 @nethsm.command()
@@ -350,9 +581,13 @@ def delete_operator_tag(ctx, user_id, tag):
 
     This command requires authentication as a user with the Administrator
     role."""
-    with connect(ctx) as nethsm:
+
+    def run(nethsm):
         nethsm.delete_operator_tag(user_id=user_id, tag=tag)
-        print(f"Deleted tag {tag} for user {user_id} on the NetHSM {nethsm.host}")
+        message = f"Deleted tag {tag} for user {user_id} on the NetHSM {nethsm.host}"
+        return (message, {})
+
+    fan_out(ctx, run)
 
 
 @nethsm.command()
@@ -387,45 +622,151 @@ def delete_key_tag(ctx, key_id, tag):
 @click.pass_context
 def info(ctx):
     """Query the vendor and product information for a NetHSM."""
-    with connect(ctx, require_auth=False) as nethsm:
+
+    def run(nethsm):
         (vendor, product) = nethsm.get_info()
-        print(f"Host:    {nethsm.host}")
-        print(f"Vendor:  {vendor}")
-        print(f"Product: {product}")
+        message = f"Host:    {nethsm.host}\n"
+        message += f"Vendor:  {vendor}\n"
+        message += f"Product: {product}"
+        return (message, {"Vendor": vendor, "Product": product})
+
+    fan_out(ctx, run, require_auth=False)
 
 
 @nethsm.command()
 @click.pass_context
 def state(ctx):
     """Query the state of a NetHSM."""
-    with connect(ctx, require_auth=False) as nethsm:
+
+    def run(nethsm):
         state = nethsm.get_state()
-        print(f"NetHSM {nethsm.host} is {state.value}")
+        return (f"NetHSM {nethsm.host} is {state.value}", {"State": state.value})
+
+    fan_out(ctx, run, require_auth=False)
 
 
 @nethsm.command()
-@click.argument("length", type=int)
+@click.argument("length", type=click.IntRange(min=1), required=False)
+@click.option(
+    "-n",
+    "--bytes",
+    "n_bytes",
+    type=click.IntRange(min=1),
+    help="The number of random bytes (alternative to the LENGTH argument)",
+)
+@click.option("--raw", is_flag=True, help="Write the raw bytes instead of Base64")
+@click.option(
+    "-o",
+    "--output",
+    type=click.File("wb"),
+    default="-",
+    help="The file to write the random data to (default: stdout)",
+)
+@workers_option("The maximum number of concurrent requests")
 @click.pass_context
-def random(ctx, length):
+def random(ctx, length, n_bytes, raw, output, workers):
     """Retrieve random bytes from the NetHSM as a Base64 string.
 
+    Large amounts of data are requested in chunks with concurrent requests.
+    With the --raw option, the binary data is written instead of a Base64
+    string.  If the global --stats option is set, the throughput is reported
+    on stderr.
+
     This command requires authentication as a user with the Operator role."""
-    with connect(ctx) as nethsm:
-        print(nethsm.get_random_data(length))
+    if length and n_bytes:
+        raise click.ClickException("LENGTH and -n/--bytes are mutually exclusive")
+    length = length or n_bytes
+    if not length:
+        raise click.ClickException("The number of random bytes is required")
+
+    with connect(ctx, pool_size=workers, cluster=True) as nethsm:
+        start = time.monotonic()
+        data = nethsm.get_random_bytes(length, workers=workers)
+        duration = time.monotonic() - start
+
+    if raw:
+        output.write(data)
+    else:
+        output.write(base64.b64encode(data) + b"\n")
+    output.flush()
+
+    if ctx.obj["NETHSM_STATS"] is not None:
+        rate = length / duration if duration > 0 else 0
+        print(
+            f"Retrieved {length} bytes in {duration:.2f} s ({rate:.0f} bytes/s)",
+            file=sys.stderr,
+        )
 
 
 @nethsm.command()
+@click.option(
+    "--serve",
+    "address",
+    metavar="[HOST]:PORT",
+    help="Serve the metrics in the OpenMetrics format at this address",
+)
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=1),
+    default=15,
+    show_default=True,
+    help="The interval for polling the metrics in seconds if --serve is set",
+)
+@click.option(
+    "--jitter",
+    type=click.FloatRange(min=0, max=1),
+    default=0.1,
+    show_default=True,
+    help="The random variation of the polling interval as a fraction of it",
+)
 @click.pass_context
-def metrics(ctx):
+def metrics(ctx, address, interval, jitter):
     """Query the metrics of a NetHSM.
 
+    If the --serve option is set, the metrics of all hosts are polled
+    periodically and served in the OpenMetrics format on /metrics at the
+    given address until the command is interrupted.
+
     This command requires authentication as a user with the Metrics role."""
+    if address:
+        serve_metrics(ctx, address, interval, jitter)
+        return
+
     with connect(ctx) as nethsm:
         headers = ["Metric", "Value"]
         data = nethsm.get_metrics()
         print_table(headers, [list(row) for row in sorted(data.items())])
 
 
+def parse_address(address):
+    (host, sep, port) = address.rpartition(":")
+    if not sep or not port.isdigit():
+        raise click.BadParameter(f"Invalid address {address}, expected [HOST]:PORT")
+    return (host.strip("[]"), int(port))
+
+
+def serve_metrics(ctx, address, interval, jitter):
+    from pynitrokey.nethsm.exporter import MetricsExporter
+
+    (host, port) = parse_address(address)
+    with connect(ctx, pool_size=1, each=True) as nethsms:
+        exporter = MetricsExporter(nethsms, interval=interval, jitter=jitter)
+        server = exporter.serve((host, port))
+        exporter.start()
+        print(
+            f"Serving metrics for {len(nethsms)} NetHSM(s) on "
+            f"http://{host or '0.0.0.0'}:{port}/metrics",
+            file=sys.stderr,
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            exporter.stop()
+
+
 @nethsm.command()
 @click.option(
     "--details/--no-details",
@@ -438,13 +779,14 @@ def metrics(ctx):
     type=str,
     help="Filter keys by tags for respective user",
 )
+@workers_option("The maximum number of concurrent requests for the key data")
 @click.pass_context
-def list_keys(ctx, details, filter):
+def list_keys(ctx, details, filter, workers):
     """List all keys on the NetHSM.
 
     This command requires authentication as a user with the Administrator or
     Operator role."""
-    with connect(ctx) as nethsm:
+    with connect(ctx, pool_size=workers, cluster=True) as nethsm:
         key_ids = nethsm.list_keys(filter)
 
         print(f"Keys on NetHSM {nethsm.host}:")
@@ -454,11 +796,10 @@ def list_keys(ctx, details, filter):
         if details:
             headers += ["Type", "Mechanisms", "Operations", "Tags"]
             data = []
-            for key_id in key_ids:
-                key = nethsm.get_key(key_id=key_id)
+            for key in nethsm.get_keys(key_ids, workers=workers):
                 data.append(
                     [
-                        key_id,
+                        key.key_id,
                         key.type,
                         ", ".join(key.mechanisms),
                         key.operations,
@@ -480,7 +821,7 @@ def get_key(ctx, key_id, public_key):
 
     This command requires authentication as a user with the Administrator or
     Operator role."""
-    with connect(ctx) as nethsm:
+    with connect(ctx, cluster=True) as nethsm:
         if public_key:
             print(nethsm.get_key_public_key(key_id))
         else:
@@ -702,6 +1043,59 @@ def generate_key(ctx, type, mechanisms, length, key_id):
         print(f"Key {key_id} generated on NetHSM {nethsm.host}")
 
 
+@nethsm.command()
+@workers_option("The number of keys to provision concurrently")
+@click.option(
+    "-n",
+    "--dry-run",
+    is_flag=True,
+    help="Only show the changes without applying them",
+)
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+@click.pass_context
+def apply_keys(ctx, workers, dry_run, manifest):
+    """Provision the keys described in a manifest file.
+
+    The manifest is a YAML or JSON file with a list of keys.  Keys that do not
+    exist on the NetHSM are generated or imported from a PEM file, missing
+    tags and certificates are added.  Existing keys are never modified
+    otherwise.  Example:
+
+    \b
+    keys:
+      - id: webserver
+        type: EC_P256
+        mechanisms: [ECDSA_Signature]
+        length: 256
+        tags: [web]
+        certificate: webserver.pem
+      - id: imported
+        mechanisms: [RSA_Signature_PKCS1]
+        private_key: imported.key
+
+    This command requires authentication as a user with the Administrator
+    role."""
+    from pynitrokey.nethsm.manifest import apply_manifest, load_manifest
+
+    try:
+        specs = load_manifest(manifest)
+    except ValueError as e:
+        raise click.ClickException(f"Invalid manifest {manifest}: {e}")
+
+    with connect(ctx, pool_size=workers) as nethsm:
+        results = apply_manifest(nethsm, specs, workers=workers, dry_run=dry_run)
+
+    data = [
+        [result.key_id, result.status, result.error or ", ".join(result.actions)]
+        for result in results
+    ]
+    print_table(["Key ID", "Status", "Details"], data)
+
+    failed = [result for result in results if result.error]
+    if failed:
+        raise click.ClickException(f"Failed to provision {len(failed)} key(s)")
+
+
 @nethsm.command()
 @click.option("--logging", is_flag=True, help="Query the logging configuration")
 @click.option("--network", is_flag=True, help="Query the network configuration")
@@ -826,9 +1220,12 @@ def set_logging_config(ctx, ip_address, port, log_level):
 
     This command requires authentication as a user with the Administrator
     role."""
-    with connect(ctx) as nethsm:
+
+    def run(nethsm):
         nethsm.set_logging_config(ip_address, port, log_level)
-        print(f"Updated the logging configuration for NetHSM {nethsm.host}")
+        return (f"Updated the logging configuration for NetHSM {nethsm.host}", {})
+
+    fan_out(ctx, run)
 
 
 @nethsm.command()
@@ -877,9 +1274,12 @@ def set_time(ctx, time):
     role."""
     if not time:
         time = datetime.datetime.now(datetime.timezone.utc)
-    with connect(ctx) as nethsm:
+
+    def run(nethsm):
         nethsm.set_time(time)
-        print(f"Updated the system time for NetHSM {nethsm.host}")
+        return (f"Updated the system time for NetHSM {nethsm.host}", {})
+
+    fan_out(ctx, run)
 
 
 @nethsm.command()
@@ -893,9 +1293,13 @@ def set_unattended_boot(ctx, status):
 
     This command requires authentication as a user with the Administrator
     role."""
-    with connect(ctx) as nethsm:
+
+    def run(nethsm):
         nethsm.set_unattended_boot(status)
-        print(f"Updated the unattended boot configuration for NetHSM {nethsm.host}")
+        message = f"Updated the unattended boot configuration for NetHSM {nethsm.host}"
+        return (message, {})
+
+    fan_out(ctx, run)
 
 
 def get_api_or_key_id(api, key_id):
@@ -986,7 +1390,7 @@ def get_certificate(ctx, api, key_id):
     The certificate for a key can also be queried by a user with the Operator
     role."""
     (api, key_id) = get_api_or_key_id(api, key_id)
-    with connect(ctx) as nethsm:
+    with connect(ctx, cluster=bool(key_id)) as nethsm:
         if key_id:
             cert = nethsm.get_key_certificate(key_id)
         else:
@@ -1115,29 +1519,85 @@ def system_info(ctx):
 
     This command requires authentication as a user with the Administrator
     role."""
-    with connect(ctx) as nethsm:
+
+    def run(nethsm):
         info = nethsm.get_system_info()
-        print(f"Host:             {nethsm.host}")
-        print(f"Firmware version: {info.firmware_version}")
-        print(f"Software version: {info.software_version}")
-        print(f"Hardware version: {info.hardware_version}")
-        print(f"Build tag:        {info.build_tag}")
+        result = {
+            "Firmware version": info.firmware_version,
+            "Software version": info.software_version,
+            "Hardware version": info.hardware_version,
+            "Build tag": info.build_tag,
+        }
+        message = f"Host:             {nethsm.host}"
+        for (name, value) in result.items():
+            message += f"\n{name + ':':<17} {value}"
+        return (message, result)
+
+    fan_out(ctx, run)
 
 
 @nethsm.command()
-@click.argument("filename")
+@click.option(
+    "-s",
+    "--archive",
+    type=click.Path(file_okay=False),
+    help="Store the backup in this deduplicating backup archive",
+)
+@click.argument("filename", required=False)
 @click.pass_context
-def backup(ctx, filename):
+def backup(ctx, archive, filename):
     """Make a backup of a NetHSM instance and write it to a file.
 
+    If the --archive option is set, the backup is stored as a snapshot in a
+    backup archive instead.  The archive splits the backups into chunks and
+    stores every chunk only once, compressed, so that similar backups of
+    several runs and hosts share the storage.  FILENAME is the name of the
+    snapshot and defaults to the host and the current time.  The snapshots
+    are stored in the snapshots directory of the archive.
+
     This command requires authentication as a user with the Backup role."""
+    if archive:
+        backup_to_archive(ctx, archive, filename)
+        return
+    if not filename:
+        raise click.UsageError("Missing argument 'FILENAME'")
     if os.path.exists(filename):
         raise click.ClickException(f"Backup file {filename} already exists")
     with connect(ctx) as nethsm:
-        data = nethsm.backup()
-        with open(filename, "xb") as f:
-            f.write(data)
-            print(f"Backup for {nethsm.host} written to {filename}")
+        try:
+            f = open(filename, "xb")
+        except FileExistsError:
+            raise click.ClickException(f"Backup file {filename} already exists")
+        # only remove the file if we created it
+        try:
+            with f, ProgressBar(
+                desc="Download backup", unit="B", unit_scale=True
+            ) as bar:
+                nethsm.write_backup(f, callback=bar.update)
+        except BaseException:
+            os.remove(filename)
+            raise
+        print(f"Backup for {nethsm.host} written to {filename}")
+
+
+def backup_to_archive(ctx, path, name):
+    from pynitrokey.nethsm.archive import BackupArchive, snapshot_name
+
+    archive = BackupArchive(path)
+    with connect(ctx) as nethsm:
+        name = name or snapshot_name(nethsm.host)
+        try:
+            with ProgressBar(desc="Download backup", unit="B", unit_scale=True) as bar:
+                info = archive.add(
+                    name, nethsm.host, nethsm.iter_backup(callback=bar.update)
+                )
+        except (OSError, ValueError) as e:
+            raise click.ClickException(f"Could not store backup: {e}")
+        print(f"Backup for {nethsm.host} stored as snapshot {name} in {path}")
+        print(
+            f"{info.size} bytes in {info.chunks} chunks, {info.new_chunks} new "
+            f"chunks with {info.stored} bytes stored"
+        )
 
 
 @nethsm.command()
@@ -1154,17 +1614,40 @@ def backup(ctx, filename):
     type=DATETIME_TYPE,
     help="The system time to set (default: the time of this system)",
 )
+@click.option(
+    "-s",
+    "--archive",
+    type=click.Path(exists=True, file_okay=False),
+    help="Restore the snapshot FILENAME from this backup archive",
+)
 @click.argument("filename")
 @click.pass_context
-def restore(ctx, backup_passphrase, system_time, filename):
+def restore(ctx, backup_passphrase, system_time, archive, filename):
     """Restore a backup of a NetHSM instance from a file.
 
-    If the system time is not set, the current system time is used."""
+    If the --archive option is set, FILENAME is the name of a snapshot in the
+    backup archive, see the backup command.  If the system time is not set,
+    the current system time is used."""
     if not system_time:
         system_time = datetime.datetime.now(datetime.timezone.utc)
     with connect(ctx, require_auth=False) as nethsm:
-        with open(filename, "rb") as f:
-            nethsm.restore(f, backup_passphrase, system_time)
+        if archive:
+            from pynitrokey.nethsm.archive import BackupArchive
+
+            try:
+                f = BackupArchive(archive).open(filename)
+            except ValueError as e:
+                raise click.ClickException(str(e))
+        else:
+            f = open(filename, "rb")
+        with f, ProgressBar(desc="Upload backup", unit="B", unit_scale=True) as bar:
+            try:
+                nethsm.restore(f, backup_passphrase, system_time, callback=bar.update)
+            except ValueError as e:
+                if not archive:
+                    raise
+                # the upload is aborted before the corrupted data is completed
+                raise click.ClickException(f"Could not read snapshot: {e}")
         print(f"Backup restored on NetHSM {nethsm.host}")
 
 
@@ -1177,8 +1660,10 @@ def update(ctx, filename):
     This command requires authentication as a user with the Administrator
     role."""
     with connect(ctx) as nethsm:
-        with open(filename, "rb") as f:
-            release_notes = nethsm.update(f)
+        with open(filename, "rb") as f, ProgressBar(
+            desc="Upload image", unit="B", unit_scale=True
+        ) as bar:
+            release_notes = nethsm.update(f, callback=bar.update)
         print(f"Image {filename} uploaded to NetHSM {nethsm.host}")
         if release_notes:
             print("Release notes:")
@@ -1315,7 +1800,7 @@ def encrypt(ctx, key_id, data, mode, iv):
     """Encrypt data with an asymmetric secret key on the NetHSM and print the encrypted message.
 
     This command requires authentication as a user with the Operator role."""
-    with connect(ctx) as nethsm:
+    with connect(ctx, cluster=True) as nethsm:
         encrypted = nethsm.encrypt(key_id, data, mode, iv)
         print(f"Encrypted: {encrypted[0]}")
         print(f"Initialization vector: {encrypted[1]}")
@@ -1346,7 +1831,7 @@ def decrypt(ctx, key_id, data, mode):
     """Decrypt data with a secret key on the NetHSM and print the decrypted message.
 
     This command requires authentication as a user with the Operator role."""
-    with connect(ctx) as nethsm:
+    with connect(ctx, cluster=True) as nethsm:
         print(nethsm.decrypt(key_id, data, mode))
 
 
@@ -1375,6 +1860,248 @@ def sign(ctx, key_id, data, mode):
     """Sign data with a secret key on the NetHSM and print the signature.
 
     This command requires authentication as a user with the Operator role."""
-    with connect(ctx) as nethsm:
+    with connect(ctx, cluster=True) as nethsm:
         signature = nethsm.sign(key_id, data, mode)
         print(signature)
+
+
+@nethsm.command()
+@click.option(
+    "-k",
+    "--key-id",
+    prompt=True,
+    help="The ID of the key to verify the signature with",
+)
+@click.option(
+    "-d",
+    "--data",
+    prompt=True,
+    help="The signed data encoded using Base64",
+)
+@click.option(
+    "-s",
+    "--signature",
+    prompt=True,
+    help="The signature encoded using Base64",
+)
+@click.option(
+    "-m",
+    "--mode",
+    type=SIGN_MODE_TYPE,
+    prompt=True,
+    help="The sign mode",
+)
+@click.pass_context
+def verify(ctx, key_id, data, signature, mode):
+    """Verify a signature locally using the public key from the NetHSM.
+
+    This command requires authentication as a user with the Administrator or
+    Operator role."""
+    with connect(ctx, cluster=True) as nethsm:
+        if not nethsm.verify(key_id, data, signature, mode):
+            raise click.ClickException("Invalid signature")
+        print("Valid signature")
+
+
+def read_base64_messages(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield line.decode("ascii")
+
+
+def read_framed_messages(f):
+    while True:
+        header = f.read(4)
+        if not header:
+            return
+        if len(header) != 4:
+            raise click.ClickException("Truncated frame header in input")
+        length = int.from_bytes(header, "big")
+        data = f.read(length)
+        if len(data) != length:
+            raise click.ClickException("Truncated frame in input")
+        yield base64.b64encode(data).decode("ascii")
+
+
+@nethsm.command()
+@click.option(
+    "-k",
+    "--key-id",
+    prompt=True,
+    help="The ID of the key to sign the data with",
+)
+@click.option(
+    "-m",
+    "--mode",
+    type=SIGN_MODE_TYPE,
+    prompt=True,
+    help="The sign mode",
+)
+@click.option(
+    "-f",
+    "--format",
+    type=click.Choice(["base64", "binary"], case_sensitive=False),
+    default="base64",
+    show_default=True,
+    help="The format of the input and output data",
+)
+@click.option(
+    "-i",
+    "--input",
+    type=click.File("rb"),
+    default="-",
+    help="The file to read the messages from (default: stdin)",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.File("wb"),
+    default="-",
+    help="The file to write the signatures to (default: stdout)",
+)
+@workers_option("The maximum number of signing requests in flight")
+@click.pass_context
+def sign_batch(ctx, key_id, mode, format, input, output, workers):
+    """Sign many messages with the same key on the NetHSM.
+
+    With the base64 format, the input contains one Base64 encoded message per
+    line and one Base64 encoded signature per line is written.  With the
+    binary format, every message and every signature is prefixed with its
+    length as a four-byte big-endian integer.  The signatures are written in
+    the order of the messages as soon as they are available.  The throughput
+    is reported on stderr.
+
+    This command requires authentication as a user with the Operator role."""
+    if format == "binary":
+        messages = read_framed_messages(input)
+    else:
+        messages = read_base64_messages(input)
+
+    with connect(ctx, pool_size=workers, cluster=True) as nethsm:
+        count = 0
+        start = time.monotonic()
+        for signature in nethsm.sign_many(key_id, messages, mode, workers=workers):
+            if format == "binary":
+                data = base64.b64decode(signature)
+                output.write(len(data).to_bytes(4, "big") + data)
+            else:
+                output.write(signature.encode("ascii") + b"\n")
+            output.flush()
+            count += 1
+        duration = time.monotonic() - start
+
+    rate = count / duration if duration > 0 else 0
+    print(
+        f"Signed {count} messages in {duration:.2f} s ({rate:.1f} signatures/s)",
+        file=sys.stderr,
+    )
+
+
+@nethsm.command()
+@click.option(
+    "-b",
+    "--benchmark",
+    "benchmarks",
+    type=click.Choice(BENCHMARK_NAMES),
+    multiple=True,
+    help="The benchmark to run, can be repeated  [default: all]",
+)
+@click.option(
+    "-k",
+    "--key-id",
+    help="Use this key instead of the generated benchmark key, requires a "
+    "single --benchmark option",
+)
+@click.option(
+    "-d",
+    "--duration",
+    type=click.FloatRange(min=0, min_open=True),
+    default=10,
+    show_default=True,
+    help="The duration of every benchmark in seconds",
+)
+@workers_option("The number of concurrent requests")
+@click.option(
+    "--generate/--no-generate",
+    default=True,
+    help="Generate the benchmark keys that do not exist yet",
+)
+@click.option(
+    "--admin-username",
+    help="The user name for generating the keys if it differs from the operator",
+)
+@click.option(
+    "--admin-password",
+    help="The password for generating the keys, requires --admin-username",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="The file to write the JSON report to",
+)
+@click.pass_context
+def bench(
+    ctx,
+    benchmarks,
+    key_id,
+    duration,
+    workers,
+    generate,
+    admin_username,
+    admin_password,
+    output,
+):
+    """Measure the throughput and latency of crypto operations.
+
+    Every benchmark executes one operation with a dedicated key for the given
+    duration and reports the operations per second, the latency percentiles
+    and the error rate as JSON.  The connections are opened before the
+    first benchmark is started.  Benchmarks with the same key type share a key
+    that is named after the key type with the prefix "bench", e. g.
+    benchRSA2048.  The keys are generated if they do not exist yet.
+
+    This command requires authentication as a user with the Operator role.
+    Generating keys requires authentication as a user with the Administrator
+    role, see the --admin-username option."""
+    import json
+
+    from pynitrokey.nethsm.bench import BENCHMARKS, ensure_keys, get_benchmark, run
+
+    selected = [get_benchmark(name) for name in benchmarks] or BENCHMARKS
+    if admin_password and not admin_username:
+        # otherwise, the password of the operator would be used
+        raise click.BadParameter(
+            "--admin-password requires --admin-username",
+            param_hint="--admin-password",
+        )
+    if key_id and len(selected) != 1:
+        raise click.BadParameter(
+            "--key-id requires a single --benchmark option", param_hint="--key-id"
+        )
+
+    if generate and not key_id:
+        with connect(ctx, username=admin_username, password=admin_password) as nethsm:
+            for generated in ensure_keys(nethsm, selected):
+                print(f"Generated key {generated}", file=sys.stderr)
+
+    results = []
+    with connect(ctx, pool_size=workers) as nethsm:
+        # open the connections in advance so that the connection setup is
+        # not included in the latencies
+        nethsm.warm_up(workers)
+        for benchmark in selected:
+            print(f"Running {benchmark.name} for {duration} s ...", file=sys.stderr)
+            result = run(nethsm, benchmark, workers, duration, key_id)
+            print(
+                f"{result['ops_per_second']} operations/s, "
+                f"{result['errors']} errors",
+                file=sys.stderr,
+            )
+            results.append(result)
+
+    report = {"host": ctx.obj["NETHSM_HOSTS"][0], "results": results}
+    json.dump(report, output, indent=2)
+    output.write("\n")
@@ -24,6 +24,7 @@ from pynitrokey.helpers import (
     local_print,
     require_windows_admin,
 )
+from pynitrokey.nk3 import hotplug
 from pynitrokey.nk3 import list as list_nk3
 from pynitrokey.nk3 import open as open_nk3
 from pynitrokey.nk3.admin_app import AdminApp
@@ -88,19 +89,26 @@ class Context:
         retries: int,
         callback: Optional[Callable[[int, int], None]] = None,
     ) -> T:
-        for t in Retries(retries):
-            logger.debug(f"Searching {name} device ({t})")
-            devices = [device for device in self.list() if isinstance(device, ty)]
-            if len(devices) == 0:
+        # wake up as soon as a device node appears instead of polling only
+        watcher = hotplug.watch()
+        try:
+            wait = watcher.wait if watcher else None
+            for t in Retries(retries, wait=wait):
+                logger.debug(f"Searching {name} device ({t})")
+                devices = [device for device in self.list() if isinstance(device, ty)]
+                if len(devices) == 0:
+                    if callback:
+                        callback(int((t.i / retries) * 100), 100)
+                    logger.debug(f"No {name} device found, continuing")
+                    continue
+                if len(devices) > 1:
+                    raise CliException(f"Multiple {name} devices found")
                 if callback:
-                    callback(int((t.i / retries) * 100), 100)
-                logger.debug(f"No {name} device found, continuing")
-                continue
-            if len(devices) > 1:
-                raise CliException(f"Multiple {name} devices found")
-            if callback:
-                callback(100, 100)
-            return devices[0]
+                    callback(100, 100)
+                return devices[0]
+        finally:
+            if watcher:
+                watcher.close()
 
         raise CliException(f"No {name} device found")
 
@@ -416,6 +424,13 @@ def validate_update(image: str) -> None:
     help="Allow to execute experimental features",
     hidden=True,
 )
+@click.option(
+    "--all",
+    "all_devices",
+    default=False,
+    is_flag=True,
+    help="Update all connected Nitrokey 3 devices concurrently",
+)
 @click.pass_obj
 def update(
     ctx: Context,
@@ -423,6 +438,7 @@ def update(
     version: Optional[str],
     ignore_pynitrokey_version: bool,
     experimental: bool,
+    all_devices: bool,
 ) -> None:
     """
     Update the firmware of the device using the given image.
@@ -437,11 +453,22 @@ def update(
 
     If the connected Nitrokey 3 device is in firmware mode, the user is prompted to touch the
     device’s button to confirm rebooting to bootloader mode.
+
+    If the --all option is set, all connected Nitrokey 3 devices are updated concurrently.  The
+    firmware is downloaded once and the update is confirmed once for all devices.  The devices
+    are identified by their UUID across reboots.  Devices that already have the new firmware
+    version are skipped.  A summary of the results is printed at the end.
     """
 
     if experimental:
         "The --experimental switch is not required to run this command anymore and can be safely removed."
 
+    if all_devices:
+        from .update import update_all
+
+        update_all(ctx, image, version, ignore_pynitrokey_version)
+        return
+
     from .update import update as exec_update
 
     exec_update(ctx, image, version, ignore_pynitrokey_version)
@@ -460,7 +487,7 @@ def status(ctx: Context) -> None:
         version = admin.version()
         local_print(f"Firmware version:   {version}")
 
-        status = admin.status()
+        status = device.status()
         if status.init_status is not None:
             local_print(f"Init status:        {status.init_status}")
         if status.ifs_blocks is not None:
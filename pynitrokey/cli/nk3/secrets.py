@@ -1,16 +1,20 @@
+import contextlib
+import copy
 import csv
 import io
 import json
+import os
 import sys
 import typing
 from base64 import b32decode
-from typing import Callable, List, Optional
+from typing import Callable, Iterator, List, Optional
 
 import click
 from click_aliases import ClickAliasedGroup
 
 from pynitrokey.cli.nk3 import Context, nk3
 from pynitrokey.helpers import AskUser, local_critical, local_print
+from pynitrokey.nk3.device import Nitrokey3Device
 from pynitrokey.nk3.secrets_app import (
     ALGORITHM_TO_KIND,
     STRING_TO_KIND,
@@ -20,15 +24,52 @@ from pynitrokey.nk3.secrets_app import (
     SecretsAppHealthCheckException,
 )
 
+PIN_ENVVAR = "NITROPY_SECRETS_PASSWORD"
+
 
 @nk3.group(cls=ClickAliasedGroup)
 @click.pass_context
 def secrets(ctx: click.Context) -> None:
     """Nitrokey Secrets App. Manage OTP and Password Safe secrets on the device.
-    Use NITROPY_SECRETS_PASSWORD to pass password for the scripted execution."""
+    Use NITROPY_SECRETS_PASSWORD to pass password for the scripted execution.
+    Set NITROPY_SECRETS_TRACE=1 to write every exchanged command to the log file."""
     pass
 
 
+class SecretsSession(Context):
+    """Context for the shell command: all commands use the same device
+    connection and SecretsApp instance, so the device is only enumerated and
+    the application status is only requested once.
+
+    If the session is not interactive, the commands are read from the
+    standard input, so the commands must not prompt for input."""
+
+    def __init__(
+        self, path: Optional[str], device: Nitrokey3Device, interactive: bool = True
+    ) -> None:
+        super().__init__(path)
+        self.device = device
+        self.app = SecretsApp(device)
+        self.interactive = interactive
+
+
+def can_prompt() -> bool:
+    """Return False if the current command runs in a non-interactive shell
+    session, where a prompt would read the next command as its answer."""
+    ctx = click.get_current_context(silent=True)
+    session = ctx.find_object(SecretsSession) if ctx else None
+    return session is None or session.interactive
+
+
+@contextlib.contextmanager
+def connect_app(ctx: Context) -> Iterator[SecretsApp]:
+    if isinstance(ctx, SecretsSession):
+        yield ctx.app
+        return
+    with ctx.connect_device() as device:
+        yield SecretsApp(device)
+
+
 def repeat_if_pin_needed(func) -> Callable:  # type: ignore[no-untyped-def]
     """
     Repeat the call of the decorated function, if PIN is required.
@@ -92,8 +133,7 @@ def rename(
     """
     Rename credential.
     """
-    with ctx.connect_device() as device:
-        app = SecretsApp(device)
+    with connect_app(ctx) as app:
         ask_to_touch_if_needed()
 
         @repeat_if_pin_needed
@@ -153,8 +193,7 @@ def update(
     """
     Update credential. Change Static Password fields, or touch button requirement attribute.
     """
-    with ctx.connect_device() as device:
-        app = SecretsApp(device)
+    with connect_app(ctx) as app:
         ask_to_touch_if_needed()
 
         @repeat_if_pin_needed
@@ -248,8 +287,7 @@ def add_otp(
     secret_bytes = b32decode(secret)
     hash_algorithm = ALGORITHM_TO_KIND[hash.upper()]
 
-    with ctx.connect_device() as device:
-        app = SecretsApp(device)
+    with connect_app(ctx) as app:
         ask_to_touch_if_needed()
 
         @repeat_if_pin_needed
@@ -325,8 +363,7 @@ def add_password(
 
     """
 
-    with ctx.connect_device() as device:
-        app = SecretsApp(device)
+    with connect_app(ctx) as app:
         abort_if_not_supported(app.feature_pws_support(), "Password Safe")
         ask_to_touch_if_needed()
 
@@ -363,8 +400,7 @@ def add_challenge_response(ctx: Context, slot: str, secret: str) -> None:
     if sl != 20:
         local_critical(f"Secret has to be exactly 20 bytes in length (got {sl})")
 
-    with ctx.connect_device() as device:
-        app = SecretsApp(device)
+    with connect_app(ctx) as app:
         abort_if_not_supported(app.feature_pws_support(), "Password Safe")
         ask_to_touch_if_needed()
 
@@ -415,17 +451,8 @@ def ask_to_touch_if_needed() -> None:
 )
 def list(ctx: Context, hexa: bool) -> None:
     """List registered OTP credentials."""
-    with ctx.connect_device() as device:
-        app = SecretsApp(device)
-        if app.is_pin_healthy():
-            local_print(
-                "Please provide PIN to show PIN-protected entries (if any), or press ENTER to skip"
-            )
-            try:
-                ask_to_touch_if_needed()
-                authenticate_if_needed(app)
-            except click.Abort:
-                pass
+    with connect_app(ctx) as app:
+        authenticate_optionally(app)
 
         credentials_list = sorted(app.list_with_properties(), key=lambda x: x.label)
         for i, credential in enumerate(credentials_list):
@@ -442,8 +469,7 @@ def list(ctx: Context, hexa: bool) -> None:
 )
 def remove(ctx: Context, name: str) -> None:
     """Remove OTP credential."""
-    with ctx.connect_device() as device:
-        app = SecretsApp(device)
+    with connect_app(ctx) as app:
         ask_to_touch_if_needed()
 
         @repeat_if_pin_needed
@@ -463,11 +489,12 @@ def remove(ctx: Context, name: str) -> None:
 )
 def reset(ctx: Context, force: bool) -> None:
     """Remove all OTP credentials from the device."""
+    if not force and not can_prompt():
+        raise click.ClickException("Use --force to reset in a non-interactive shell")
     confirmed = force or click.confirm("Do you want to continue?")
     if not confirmed:
         raise click.Abort()
-    with ctx.connect_device() as device:
-        app = SecretsApp(device)
+    with connect_app(ctx) as app:
         ask_to_touch_if_needed()
         app.reset()
         local_print("Done")
@@ -478,6 +505,13 @@ def reset(ctx: Context, force: bool) -> None:
 @click.argument(
     "name",
     type=click.STRING,
+    required=False,
+)
+@click.option(
+    "--all",
+    "all_",
+    is_flag=True,
+    help="Generate the codes of all TOTP credentials with a single request",
 )
 @click.option(
     "--timestamp",
@@ -495,27 +529,49 @@ def reset(ctx: Context, force: bool) -> None:
 )
 def get_otp(
     ctx: Context,
-    name: str,
+    name: Optional[str],
+    all_: bool,
     timestamp: int,
     period: int,
 ) -> None:
-    """Generate OTP code from registered credential."""
+    """Generate OTP code from registered credential.
+
+    With --all, the codes of all TOTP credentials are generated at once.
+    HOTP credentials are skipped with --all so that their counters do not
+    change."""
     # TODO: for TOTP get the time from a timeserver via NTP, instead of the local clock
 
     from datetime import datetime
 
+    if all_ == bool(name):
+        raise click.UsageError("Either NAME or --all must be given")
+
     timestamp = timestamp if timestamp else int(datetime.timestamp(datetime.now()))
-    with ctx.connect_device() as device:
-        app = SecretsApp(device)
+    with connect_app(ctx) as app:
+        if all_:
+            authenticate_optionally(app)
         ask_to_touch_if_needed()
 
         @repeat_if_pin_needed
         def call(app: SecretsApp) -> None:
-            code = app.calculate(name.encode(), timestamp // period)
             local_print(
                 f"Timestamp: {datetime.isoformat(datetime.fromtimestamp(timestamp), timespec='seconds')} ({timestamp}), period: {period}"
             )
-            local_print(code.decode())
+            if name:
+                code = app.calculate(name.encode(), timestamp // period)
+                local_print(code.decode())
+                return
+
+            codes = app.calculate_all(timestamp // period)
+            totp_codes = sorted(
+                (label.decode(), code.decode())
+                for (label, code) in codes.items()
+                if code is not None
+            )
+            if not totp_codes:
+                local_print("No TOTP credentials found")
+            for (label, totp_code) in totp_codes:
+                local_print(f"{label}\t{totp_code}")
 
         try:
             call(app)
@@ -550,8 +606,7 @@ def get_password(
     format: str,
 ) -> None:
     """Get Password Safe Entry"""
-    with ctx.connect_device() as device:
-        app = SecretsApp(device)
+    with connect_app(ctx) as app:
         abort_if_not_supported(app.feature_pws_support(), "Password Safe")
         ask_to_touch_if_needed()
 
@@ -610,8 +665,7 @@ def verify(ctx: Context, name: str, code: int) -> None:
     """Proceed with the incoming OTP code verification (aka reverse HOTP).
     Use the "register" command to create the credential for this action.
     """
-    with ctx.connect_device() as device:
-        app = SecretsApp(device)
+    with connect_app(ctx) as app:
         ask_to_touch_if_needed()
 
         @repeat_if_pin_needed
@@ -628,6 +682,11 @@ def verify(ctx: Context, name: str, code: int) -> None:
 
 
 def ask_for_passphrase_if_needed(app: SecretsApp) -> Optional[str]:
+    if PIN_ENVVAR not in os.environ and not can_prompt():
+        raise click.ClickException(
+            f"The PIN is required, but cannot be requested in a non-interactive "
+            f"shell.  Set {PIN_ENVVAR} to provide it."
+        )
     health_check = helper_secrets_app_health_check(app)
     if health_check:
         local_print(*health_check)
@@ -635,7 +694,7 @@ def ask_for_passphrase_if_needed(app: SecretsApp) -> Optional[str]:
         raise SecretsAppHealthCheckException("PIN not available to use")
     passphrase = AskUser(
         f"Current PIN ({app.select().pin_attempt_counter} attempts left)",
-        envvar="NITROPY_SECRETS_PASSWORD",
+        envvar=PIN_ENVVAR,
         hide_input=True,
     ).ask()
     return passphrase
@@ -655,6 +714,8 @@ def authenticate_if_needed(
             local_print("No PIN provided")
     except SecretsAppHealthCheckException:
         raise click.Abort()
+    except click.ClickException:
+        raise
     except Exception as e:
         local_print(
             f'Authentication failed with error: "{e}" \n'
@@ -664,6 +725,29 @@ def authenticate_if_needed(
     return passphrase
 
 
+def authenticate_optionally(app: SecretsApp) -> None:
+    """Ask for the PIN to include the PIN-protected entries, unless a PIN was
+    already provided in this session."""
+    cached_PIN = getattr(repeat_if_pin_needed, "cached_PIN", None)
+    if cached_PIN is not None:
+        authenticate_if_needed(app, cached_PIN)
+        return
+    if PIN_ENVVAR not in os.environ and not can_prompt():
+        local_print(f"PIN-protected entries are skipped, set {PIN_ENVVAR} to show them")
+        return
+    if app.is_pin_healthy():
+        local_print(
+            "Please provide PIN to show PIN-protected entries (if any), or press ENTER to skip"
+        )
+        try:
+            ask_to_touch_if_needed()
+            passphrase = authenticate_if_needed(app)
+            if passphrase:
+                repeat_if_pin_needed.cached_PIN = passphrase  # type: ignore[attr-defined]
+        except click.Abort:
+            pass
+
+
 @secrets.command()
 @click.pass_obj
 @click.password_option()
@@ -671,9 +755,8 @@ def set_pin(ctx: Context, password: str) -> None:
     """Set or change the PIN used to authenticate to other commands."""
     new_password = password
 
-    with ctx.connect_device() as device:
+    with connect_app(ctx) as app:
         try:
-            app = SecretsApp(device)
             ask_to_touch_if_needed()
 
             if app.select().pin_attempt_counter is None:
@@ -696,13 +779,239 @@ def set_pin(ctx: Context, password: str) -> None:
 @click.pass_obj
 def status(ctx: Context) -> None:
     """Show application status"""
-    with ctx.connect_device() as device:
-        app = SecretsApp(device)
+    with connect_app(ctx) as app:
         r = app.select()
         local_print(f"{r}")
         local_print(*helper_secrets_app_health_check(app))
 
 
+@secrets.command("import")
+@click.pass_obj
+@click.argument("file", type=click.File("r"))
+@click.option(
+    "--format",
+    type=click.Choice(["uri", "csv", "json"]),
+    help="The format of the file  [default: guessed from the file extension]",
+)
+@click.option(
+    "--protect-with-pin",
+    "pin_protection",
+    is_flag=True,
+    help="Protect all imported credentials with the PIN",
+)
+def import_(
+    ctx: Context, file: typing.TextIO, format: Optional[str], pin_protection: bool
+) -> None:
+    """Register the OTP credentials from a file.
+
+    FILE is a list of otpauth:// URIs, one per line, a CSV file with a header
+    or a JSON file with a list of objects.  The CSV and JSON files use the
+    fields name, issuer, secret (base32), kind (TOTP or HOTP), algorithm (SHA1
+    or SHA256), digits (6 or 8), counter (HOTP only), period (30 only),
+    touch_button and protect_with_pin.  Other fields are ignored.
+
+    The PIN is requested once.  Credentials with a name that already exists
+    on the device are skipped.  The result is printed for every entry."""
+    from pynitrokey.nk3.secrets_file import guess_format, read_credentials
+
+    format = format or guess_format(file.name)
+    try:
+        (entries, errors, warnings) = read_credentials(file, format)
+    except ValueError as e:
+        raise click.ClickException(f"Could not read {file.name}: {e}")
+    for warning in warnings:
+        local_print(f"{file.name}: warning: {warning}")
+    for error in errors:
+        local_print(f"{file.name}:{error.position}: skipped: {error.message}")
+    if not entries:
+        raise click.ClickException("No valid credentials found")
+
+    counts = {"added": 0, "exists": 0, "failed": len(errors)}
+    with connect_app(ctx) as app:
+        # includes the PIN-protected credentials if the PIN is provided
+        authenticate_optionally(app)
+        existing: typing.Set[bytes] = set()
+
+        @repeat_if_pin_needed
+        def list_credentials(app: SecretsApp) -> None:
+            existing.update(item.label for item in app.list_with_properties())
+
+        list_credentials(app)
+
+        for (i, entry) in enumerate(entries, start=1):
+            name = entry.name.encode()
+            if name in existing:
+                result = "exists"
+            else:
+
+                @repeat_if_pin_needed
+                def call(app: SecretsApp) -> None:
+                    app.register(
+                        name,
+                        entry.secret,
+                        entry.digits,
+                        kind=entry.kind,
+                        algo=entry.algorithm,
+                        initial_counter_value=entry.counter,
+                        touch_button_required=entry.touch_button,
+                        pin_based_encryption=entry.protect_with_pin or pin_protection,
+                    )
+
+                try:
+                    if entry.touch_button:
+                        ask_to_touch_if_needed()
+                    call(app)
+                    existing.add(name)
+                    result = "added"
+                except SecretsAppException as e:
+                    result = "failed"
+                    local_print(f"Device returns error for {entry.name}: {e}")
+            counts[result] += 1
+            local_print(f"[{i}/{len(entries)}] {entry.name}: {result}")
+
+    local_print(
+        f"{counts['added']} added, {counts['exists']} already existing, "
+        f"{counts['failed']} failed"
+    )
+    if counts["failed"]:
+        raise click.ClickException("Some credentials could not be imported")
+
+
+@secrets.command()
+@click.pass_obj
+@click.argument("file", type=click.File("w"), default="-")
+@click.option(
+    "--format",
+    type=click.Choice(["csv", "json"]),
+    default="json",
+    show_default=True,
+    help="The format of the file",
+)
+def export(ctx: Context, file: typing.TextIO, format: str) -> None:
+    """Write the names and properties of the credentials to a file.
+
+    The secrets cannot be read from the device and are not exported, so the
+    file cannot be imported again.  FILE defaults to the standard output."""
+    from pynitrokey.nk3.secrets_file import write_credentials
+
+    with connect_app(ctx) as app:
+        authenticate_optionally(app)
+        credentials = sorted(app.list_with_properties(), key=lambda x: x.label)
+    file.write(write_credentials(credentials, format))
+
+
+@secrets.command()
+@click.pass_context
+@click.option(
+    "--stop-on-error",
+    is_flag=True,
+    help="Stop at the first failing command",
+)
+def shell(ctx: click.Context, stop_on_error: bool) -> None:
+    """Run several commands over one device connection.
+
+    The commands are read from the standard input, one per line with the
+    same syntax as the secrets subcommands, e. g. "get-otp mycred".  Empty
+    lines and lines starting with # are ignored.  The device is connected
+    and the application status is requested only once, and the PIN is only
+    requested once for all commands.  Enter "help" to list the commands and
+    "exit" to end the session.  If a command fails, the exit status is 1.
+
+    If the commands are not entered on a terminal, they cannot prompt for
+    input: set NITROPY_SECRETS_PASSWORD to provide the PIN, and use the
+    options of the commands instead of prompts, e. g. reset --force."""
+    import shlex
+
+    interactive = sys.stdin.isatty()
+    obj: Context = ctx.obj
+    failed = 0
+    with obj.connect_device() as device:
+        session = SecretsSession(obj.path, device, interactive)
+        while True:
+            try:
+                line = input("secrets> " if interactive else "")
+            except EOFError:
+                break
+            try:
+                args = shlex.split(line, comments=True)
+            except ValueError as e:
+                local_print(f"Invalid command: {e}")
+                failed += 1
+                continue
+            if not args:
+                continue
+            (name, args) = (args[0], args[1:])
+            if name in ["exit", "quit"]:
+                break
+            if name == "help":
+                commands = [c for c in secrets.list_commands(ctx) if c != "shell"]
+                local_print("Commands: " + ", ".join(commands) + ", exit")
+                continue
+
+            command = secrets.get_command(ctx, name)
+            if command is None or command is shell:
+                local_print(f"Unknown command: {name}")
+                failed += 1
+            elif not run_in_session(ctx, session, name, command, args):
+                failed += 1
+            if failed and stop_on_error:
+                break
+
+    if failed:
+        raise click.ClickException(f"{failed} command(s) failed")
+
+
+def without_prompts(command: click.Command) -> click.Command:
+    """Return a copy of the command with required options instead of options
+    that prompt for missing values."""
+    params: List[click.Parameter] = []
+    for param in command.params:
+        if isinstance(param, click.Option) and param.prompt:
+            param = copy.copy(param)
+            param.prompt = None
+            param.required = True
+        params.append(param)
+    command = copy.copy(command)
+    command.params = params
+    return command
+
+
+def run_in_session(
+    ctx: click.Context,
+    session: SecretsSession,
+    name: str,
+    command: click.Command,
+    args: List[str],
+) -> bool:
+    stdin = sys.stdin
+    if not session.interactive:
+        # the remaining commands must not be read as the answer to a prompt
+        command = without_prompts(command)
+        sys.stdin = io.StringIO()
+    try:
+        parent = ctx.parent or ctx
+        with command.make_context(name, args, parent=parent, obj=session) as sub_ctx:
+            command.invoke(sub_ctx)
+        return True
+    except click.exceptions.Exit as e:
+        # e. g. after --help
+        return e.exit_code == 0
+    except click.ClickException as e:
+        e.show()
+    except click.Abort:
+        if session.interactive:
+            local_print("Aborted")
+        else:
+            local_print("Aborted: cannot prompt for input in a non-interactive shell")
+    except SecretsAppException as e:
+        local_print(f"Device returns error: {e}")
+    except SystemExit as e:
+        return not e.code
+    finally:
+        sys.stdin = stdin
+    return False
+
+
 def helper_secrets_app_health_check(app: SecretsApp) -> List[str]:
     messages = []
     r = app.select()
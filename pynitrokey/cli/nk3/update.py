@@ -8,16 +8,24 @@
 # copied, modified, or distributed except according to those terms.
 
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Any, Callable, Iterator, List, Optional
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
 
 from click import Abort
+from tqdm import tqdm
 
 from pynitrokey.cli.exceptions import CliException
 from pynitrokey.cli.nk3 import Context
 from pynitrokey.helpers import DownloadProgressBar, ProgressBar, confirm, local_print
+from pynitrokey.nk3 import bootloader
+from pynitrokey.nk3.base import Nitrokey3Base
+from pynitrokey.nk3.bootloader import FirmwareContainer, Nitrokey3Bootloader
+from pynitrokey.nk3.device import Nitrokey3Device
 from pynitrokey.nk3.updates import Updater, UpdateUi
-from pynitrokey.nk3.utils import Version
+from pynitrokey.nk3.utils import Uuid, Version
 
 logger = logging.getLogger(__name__)
 
@@ -138,3 +146,241 @@ def update(
     with ctx.connect() as device:
         updater = Updater(UpdateCli(), ctx.await_bootloader, ctx.await_device)
         return updater.update(device, image, version, ignore_pynitrokey_version)
+
+
+class SkipUpdate(Exception):
+    pass
+
+
+class BatchUpdateCli(UpdateCli):
+    """
+    The user interface for one of several concurrent updates.  The update is
+    confirmed once for all devices, so the per-device confirmations are only
+    shown if they are required for safety, one at a time.
+    """
+
+    def __init__(self, label: str, position: int, prompt_lock: threading.Lock):
+        super().__init__()
+        self.label = label
+        self.position = position
+        self.prompt_lock = prompt_lock
+
+    def abort_downgrade(self, current: Version, image: Version) -> Exception:
+        return self.abort(
+            f"The firmware image is older than the firmware on the device ({current})."
+        )
+
+    def confirm_update_same_version(self, version: Version) -> None:
+        raise SkipUpdate(f"Firmware version {version} is already installed")
+
+    def confirm_extra_information(self, txt: List[str]) -> None:
+        if txt:
+            with self.prompt_lock:
+                tqdm.write(f"{self.label}:")
+                super().confirm_extra_information(txt)
+
+    def request_bootloader_confirmation(self) -> None:
+        tqdm.write(
+            f"{self.label}: Please press the touch button to reboot the device into "
+            "bootloader mode ..."
+        )
+
+    @contextmanager
+    def update_progress_bar(self) -> Iterator[Callable[[int, int], None]]:
+        with ProgressBar(
+            desc=f"{self.label} update",
+            unit="B",
+            unit_scale=True,
+            position=self.position,
+        ) as bar:
+            yield bar.update_sum
+
+    @contextmanager
+    def finalization_progress_bar(self) -> Iterator[Callable[[int, int], None]]:
+        with ProgressBar(
+            desc=f"{self.label} finalize",
+            unit="%",
+            unit_scale=False,
+            position=self.position,
+        ) as bar:
+            yield bar.update_sum
+
+
+class DeviceClaims:
+    """
+    The paths of the devices that are in use by the update workers, indexed
+    by the UUID of the device.  A worker does not open a device that is in use
+    by another worker.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.paths: Dict[Uuid, str] = {}
+
+
+def _read_uuid(device: Nitrokey3Base) -> Optional[Uuid]:
+    try:
+        if isinstance(device, Nitrokey3Bootloader):
+            # the LPC55 bootloader has to be opened to query the UUID
+            with device:
+                return device.uuid()
+        return device.uuid()
+    except Exception:
+        logger.debug(f"Failed to query UUID of {device.path}", exc_info=True)
+        return None
+
+
+class UuidContext(Context):
+    """A context that only finds the device with the given UUID."""
+
+    def __init__(self, uuid: Uuid, claims: DeviceClaims) -> None:
+        super().__init__(None)
+        self.uuid = uuid
+        self.claims = claims
+
+    def _busy_paths(self) -> Set[str]:
+        return {path for (uuid, path) in self.claims.paths.items() if uuid != self.uuid}
+
+    def list(self) -> List[Nitrokey3Base]:
+        # enumerating and probing the devices is slow, so the lock is only
+        # held to read and update the claims
+        with self.claims.lock:
+            busy = self._busy_paths()
+
+        candidates: List[Nitrokey3Base] = []
+        candidates.extend(bootloader.list())
+        candidates.extend(Nitrokey3Device.list(exclude=busy))
+
+        devices = []
+        for device in candidates:
+            if device.path not in busy and _read_uuid(device) == self.uuid:
+                devices.append(device)
+            elif isinstance(device, Nitrokey3Device):
+                device.close()
+
+        with self.claims.lock:
+            # another worker may have claimed a path in the meantime
+            busy = self._busy_paths()
+            for device in devices:
+                if device.path in busy and isinstance(device, Nitrokey3Device):
+                    device.close()
+            devices = [device for device in devices if device.path not in busy]
+            if len(devices) == 1:
+                self.claims.paths[self.uuid] = devices[0].path
+        return devices
+
+
+@dataclass
+class UpdateResult:
+    uuid: Uuid
+    before: Optional[Version]
+    after: Optional[Version] = None
+    result: str = ""
+
+
+def _update_device(
+    device: Nitrokey3Base,
+    result: UpdateResult,
+    container: FirmwareContainer,
+    ui: BatchUpdateCli,
+    claims: DeviceClaims,
+) -> None:
+    ctx = UuidContext(result.uuid, claims)
+    updater = Updater(ui, ctx.await_bootloader, ctx.await_device)
+    try:
+        with device:
+            updater.validate_version(result.before, container.version)
+            result.after = updater.install_update(device, container, result.before)
+        result.result = "updated"
+    except SkipUpdate as e:
+        result.after = result.before
+        result.result = f"skipped: {e}"
+    except CliException as e:
+        result.result = "failed: " + " ".join(str(e).splitlines())
+    except Abort:
+        result.result = "aborted"
+    except Exception as e:
+        logger.debug(f"Failed to update {result.uuid}", exc_info=True)
+        result.result = f"failed: {e}"
+    finally:
+        with claims.lock:
+            claims.paths.pop(result.uuid, None)
+    tqdm.write(f"{ui.label}: {result.result}")
+
+
+def update_all(
+    ctx: Context,
+    image: Optional[str],
+    version: Optional[str],
+    ignore_pynitrokey_version: bool,
+) -> None:
+    if ctx.path:
+        raise CliException("The --path option cannot be used to update all devices")
+
+    devices = ctx.list()
+    if not devices:
+        raise CliException("No Nitrokey 3 device found")
+
+    # the devices are closed by the update workers once they are started
+    try:
+        claims = DeviceClaims()
+        results: List[UpdateResult] = []
+        for device in devices:
+            uuid = _read_uuid(device)
+            if uuid is None or uuid in claims.paths:
+                raise CliException(
+                    f"Failed to query a unique UUID for the device at {device.path}, "
+                    "so it cannot be tracked during the update.  Please update it "
+                    "separately."
+                )
+            before = device.version() if isinstance(device, Nitrokey3Device) else None
+            claims.paths[uuid] = device.path
+            results.append(UpdateResult(uuid, before))
+
+        updater = Updater(UpdateCli(), ctx.await_bootloader, ctx.await_device)
+        container = updater.prepare_update(
+            image, version, ignore_pynitrokey_version=ignore_pynitrokey_version
+        )
+
+        local_print(
+            f"Updating {len(devices)} device(s) to firmware version "
+            f"{container.version}:"
+        )
+        for result in results:
+            local_print(f"  {result.uuid}  {result.before or '[unknown]'}")
+        local_print("")
+        local_print(
+            "Please do not remove any Nitrokey 3 or insert other Nitrokey 3 devices "
+            "during the update. Doing so may damage the Nitrokey 3."
+        )
+        if not confirm("Do you want to perform the firmware update now?"):
+            logger.info("Update cancelled by user")
+            raise Abort()
+    except BaseException:
+        for device in devices:
+            if isinstance(device, Nitrokey3Device):
+                device.close()
+        raise
+
+    # only one device may ask the user for a confirmation at the same time
+    prompt_lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=len(devices)) as executor:
+        for (i, (device, result)) in enumerate(zip(devices, results)):
+            ui = BatchUpdateCli(str(result.uuid), i, prompt_lock)
+            executor.submit(_update_device, device, result, container, ui, claims)
+
+    local_print("")
+    local_print(f"{'UUID':<34}{'Before':<16}{'After':<16}Result")
+    for result in results:
+        before_str = str(result.before or "[unknown]")
+        after_str = str(result.after or "-")
+        local_print(
+            f"{str(result.uuid):<34}{before_str:<16}{after_str:<16}{result.result}"
+        )
+
+    failed = [result for result in results if result.result.startswith("failed")]
+    if failed:
+        raise CliException(
+            f"The update failed for {len(failed)} of {len(results)} device(s)",
+            support_hint=False,
+        )
@@ -4,6 +4,7 @@ import pathlib
 import secrets
 from enum import Enum, IntEnum, auto
 from functools import partial
+from typing import TYPE_CHECKING, Any, ContextManager, Iterator
 
 import pytest
 from _pytest.fixtures import FixtureRequest
@@ -12,6 +13,10 @@ from pynitrokey.cli import CliException
 from pynitrokey.cli.nk3 import Context
 from pynitrokey.nk3.secrets_app import Instruction, SecretsApp
 
+if TYPE_CHECKING:
+    from pynitrokey.nethsm import NetHSM
+    from pynitrokey.nethsm.mock import MockServer
+
 CORPUS_PATH = "/tmp/corpus"
 
 
@@ -48,6 +53,13 @@ def pytest_addoption(parser):
     )
 
 
+def pytest_configure(config):
+    # the mock NetHSM server uses a self-signed certificate
+    config.addinivalue_line(
+        "filterwarnings", "ignore::urllib3.exceptions.InsecureRequestWarning"
+    )
+
+
 @pytest.fixture(scope="session")
 def generate_corpus_args(request: FixtureRequest):
     return request.config.getoption(
@@ -81,6 +93,24 @@ def dev():
             pytest.skip(f"Cannot connect to the Nitrokey 3 device. Error: {e}")
 
 
+@pytest.fixture
+def server() -> Iterator["MockServer"]:
+    """A mock NetHSM server with the default users."""
+    from pynitrokey.nethsm.mock import serve
+
+    with serve() as server:
+        yield server
+
+
+def _connect(host: str, user_id: str, **kwargs: Any) -> ContextManager["NetHSM"]:
+    """Connect to a mock NetHSM server as one of the default users."""
+    from pynitrokey.nethsm import connect
+    from pynitrokey.nethsm.mock import DEFAULT_USERS, VERSION
+
+    (_, passphrase) = DEFAULT_USERS[user_id]
+    return connect(host, VERSION, user_id, passphrase, verify_tls=False, **kwargs)
+
+
 class CredEncryptionType(Enum):
     # This requires providing PIN for encryption to work
     PinBased = auto()
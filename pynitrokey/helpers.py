@@ -177,12 +177,25 @@ class Try:
 
 
 class Retries:
-    """Utility class for repeating an action multiple times until it succeeds."""
+    """Utility class for repeating an action multiple times until it succeeds.
 
-    def __init__(self, retries: int, timeout: float = 0.5) -> None:
+    If a wait function is given, it is used instead of sleeping between the
+    tries.  It is called with the remaining time and returns True if it was
+    woken up early, e. g. by a hotplug event.  Then the action is repeated
+    immediately without using up a try, so the total time does not change.
+    """
+
+    def __init__(
+        self,
+        retries: int,
+        timeout: float = 0.5,
+        wait: Optional[Callable[[float], bool]] = None,
+    ) -> None:
         self.retries = retries
         self.i = 0
         self.timeout = timeout
+        self.wait = wait
+        self._deadline: Optional[float] = None
 
     def __iter__(self) -> "Retries":
         return self
@@ -191,7 +204,15 @@ class Retries:
         if self.i >= self.retries:
             raise StopIteration
         if self.i > 0:
-            time.sleep(self.timeout)
+            if self.wait:
+                if self._deadline is None:
+                    self._deadline = time.monotonic() + self.timeout
+                remaining = self._deadline - time.monotonic()
+                if remaining > 0 and self.wait(remaining):
+                    return Try(self.i - 1, self.retries)
+                self._deadline = None
+            else:
+                time.sleep(self.timeout)
         t = Try(self.i, self.retries)
         self.i += 1
         return t
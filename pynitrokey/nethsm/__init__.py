@@ -7,17 +7,46 @@
 # http://opensource.org/licenses/MIT>, at your option. This file may not be
 # copied, modified, or distributed except according to those terms.
 
+import base64
+import collections
+import concurrent.futures
 import contextlib
 import enum
+import http.client
+import io
 import json
+import os
+import queue
 import re
+import ssl
+import threading
+import time
+import weakref
+from urllib.parse import quote, urlencode
 
+import certifi
 import click
-import requests
+import urllib3
+from urllib3.util.connection import is_connection_dropped
 
-from . import client
-from .client import ApiException
-from .client.model.passphrase import Passphrase
+from .stats import current_scope
+
+# The generated API client is expensive to import.  It is only loaded by
+# _import_client once a NetHSM instance is created so that other nitropy
+# commands do not have to pay for it.
+client = None
+ApiException = None
+
+DEFAULT_WORKERS = 8
+DEFAULT_POOL_SIZE = 16
+DEFAULT_KEEPALIVE_INTERVAL = 30
+STREAM_CHUNK_SIZE = 64 * 1024
+RANDOM_CHUNK_SIZE = 1024
+KEY_CERTIFICATE_MIME_TYPES = [
+    "application/x-pem-file",
+    "application/x-x509-ca-cert",
+    "application/pgp-keys",
+]
 
 
 class Role(enum.Enum):
@@ -199,57 +228,533 @@ def _handle_api_exception(e, messages={}, roles=[], state=None):
         except json.JSONDecodeError:
             pass
 
-    raise NetHSMError(message)
+    raise NetHSMError(message, status=e.status)
+
+
+def _key_endpoint(key_id, operation=None):
+    endpoint = f"keys/{quote(key_id, safe='')}"
+    if operation:
+        endpoint += f"/{operation}"
+    return endpoint
+
+
+def _json_dumps(data):
+    return json.dumps(data).encode("utf-8")
 
 
 class NetHSMError(Exception):
-    def __init__(self, message):
+    def __init__(self, message, status=None):
         super().__init__(message)
+        self.status = status
+
+
+class _TlsSessionContext(ssl.SSLContext):
+    """SSL context that tries to resume the TLS session of the most recent
+    connection when opening a new connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._last_socket = None
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        with self._lock:
+            last_socket = self._last_socket and self._last_socket()
+        session = last_socket.session if last_socket else None
+        if session and session.has_ticket and "session" not in kwargs:
+            kwargs["session"] = session
+        ssl_socket = super().wrap_socket(sock, *args, **kwargs)
+        with self._lock:
+            self._last_socket = weakref.ref(ssl_socket)
+        return ssl_socket
+
+
+def _make_timeout(timeout):
+    if timeout is None or isinstance(timeout, urllib3.Timeout):
+        return timeout
+    if isinstance(timeout, tuple):
+        (connect, read) = timeout
+        return urllib3.Timeout(connect=connect, read=read)
+    return urllib3.Timeout(total=timeout)
+
+
+def _content_length(data):
+    if isinstance(data, str):
+        return len(data.encode("utf-8"))
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    if hasattr(data, "fileno"):
+        try:
+            return os.fstat(data.fileno()).st_size - data.tell()
+        except (OSError, ValueError):
+            pass
+    if hasattr(data, "seekable") and data.seekable():
+        position = data.tell()
+        end = data.seek(0, io.SEEK_END)
+        data.seek(position)
+        return end - position
+    return None
+
+
+class _ProgressReader:
+    """File-like wrapper for request bodies that reports the number of bytes
+    read to a callback(n, total)."""
+
+    def __init__(self, data, total, callback):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if isinstance(data, (bytes, bytearray)):
+            data = io.BytesIO(data)
+        self.f = data
+        self.total = total
+        self.callback = callback
+        self.callback(0, total)
+
+    def read(self, size=-1):
+        chunk = self.f.read(size)
+        if chunk:
+            self.callback(len(chunk), self.total)
+        return chunk
+
+    def tell(self):
+        return self.f.tell()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.f.seek(offset, whence)
+
+
+def _import_client():
+    global client, ApiException
+
+    # importing a submodule of the client package elsewhere already sets
+    # the client attribute of this module
+    if ApiException is None:
+        from . import client
+        from .client import ApiException
+
+
+class _HTTPSConnection(urllib3.connection.HTTPSConnection):
+    """HTTPSConnection that reports its timings to the current stats scope
+    and reconnects to its pool."""
+
+    pool = None
+    connected = False
+    last_used = 0.0
+
+    def _new_conn(self):
+        start = time.perf_counter()
+        conn = super()._new_conn()
+        self._connect_time = time.perf_counter() - start
+        return conn
+
+    def connect(self):
+        if self.connected and self.pool is not None:
+            self.pool.count_reconnect()
+        self.connected = True
+        self.last_used = time.monotonic()
+
+        scope = current_scope()
+        if scope is None:
+            return super().connect()
+        self._connect_time = 0.0
+        start = time.perf_counter()
+        super().connect()
+        scope.add("connect", self._connect_time)
+        scope.add("tls", time.perf_counter() - start - self._connect_time)
+
+    def request(self, *args, **kwargs):
+        self.last_used = time.monotonic()
+        super().request(*args, **kwargs)
+        scope = current_scope()
+        if scope is not None:
+            scope.request_sent()
+
+    def request_chunked(self, *args, **kwargs):
+        self.last_used = time.monotonic()
+        super().request_chunked(*args, **kwargs)
+        scope = current_scope()
+        if scope is not None:
+            scope.request_sent()
+
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        scope = current_scope()
+        if scope is not None:
+            scope.response_received()
+        return response
+
+
+class _HTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    """HTTPSConnectionPool that can open its connections in advance and keep
+    idle connections alive.
+
+    reconnects counts the connections that had to be established again
+    because the previous connection was closed or failed."""
+
+    ConnectionCls = _HTTPSConnection
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reconnects = 0
+        self.pings = 0
+        self._lost = 0
+        self._counter_lock = threading.Lock()
+
+    def count_reconnect(self):
+        with self._counter_lock:
+            self.reconnects += 1
+
+    def _new_conn(self):
+        conn = super()._new_conn()
+        conn.pool = self
+        with self._counter_lock:
+            # replaces a connection that was discarded after an error
+            if self._lost:
+                self._lost -= 1
+                self.reconnects += 1
+        return conn
+
+    def _put_conn(self, conn):
+        if conn is None:
+            with self._counter_lock:
+                self._lost += 1
+        super()._put_conn(conn)
+
+    def _take_idle(self):
+        """Remove all idle connections and empty slots from the pool without
+        blocking."""
+        items = []
+        while True:
+            try:
+                items.append(self.pool.get(block=False))
+            except (AttributeError, queue.Empty):
+                return items
+
+    def _connect(self, conn):
+        timeout = self.timeout.connect_timeout
+        conn.timeout = urllib3.Timeout.resolve_default_timeout(timeout)
+        conn.connect()
+
+    def _ping(self, conn, url, headers):
+        timeout = self.timeout.read_timeout
+        conn.timeout = urllib3.Timeout.resolve_default_timeout(timeout)
+        conn.request("GET", url, headers=headers)
+        conn.getresponse().read()
+        with self._counter_lock:
+            self.pings += 1
+
+    def warm_up(self, n, url, headers):
+        """Open up to n connections concurrently and return them to the pool.
+
+        A request to url is sent on every new connection: this completes the
+        TLS handshake including the TLS 1.3 session tickets, which would
+        otherwise make urllib3 consider the idle connection as dropped.
+        Returns the number of connections that were opened."""
+        items = self._take_idle()
+        slots = [item for item in items if item is None or item.sock is None]
+        for item in items:
+            if item not in slots:
+                self._put_conn(item)
+        conns = []
+        for conn in slots[:n]:
+            if conn is None:
+                # the connection is opened in advance, so it is no reconnect
+                conn = super()._new_conn()
+                conn.pool = self
+            conns.append(conn)
+        for conn in slots[n:]:
+            super()._put_conn(conn)
+
+        def open(conn):
+            try:
+                self._connect(conn)
+                self._ping(conn, url, headers)
+                return True
+            except (OSError, http.client.HTTPException, urllib3.exceptions.HTTPError):
+                conn.close()
+                return False
+
+        if not conns:
+            return 0
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(conns))
+        with executor:
+            opened = list(executor.map(open, conns))
+        for conn in conns:
+            self._put_conn(conn)
+        return opened.count(True)
+
+    def ping_idle(self, url, headers, idle_time):
+        """Send a request to url on every pooled connection that has been idle
+        for at least idle_time seconds so that it is not closed by the server
+        or by middleboxes.  Connections that were closed anyway are
+        reconnected."""
+        now = time.monotonic()
+        items = self._take_idle()
+        stale = [
+            item
+            for item in items
+            if item is not None
+            and item.sock is not None
+            and now - item.last_used >= idle_time
+        ]
+        for item in items:
+            if item not in stale:
+                self._put_conn(item)
+
+        for conn in stale:
+            try:
+                if is_connection_dropped(conn):
+                    conn.close()
+                    self._connect(conn)
+                self._ping(conn, url, headers)
+            except (OSError, http.client.HTTPException, urllib3.exceptions.HTTPError):
+                # urllib3 reconnects on the next request
+                conn.close()
+            finally:
+                self._put_conn(conn)
+
+
+class _PoolManager(urllib3.PoolManager):
+    """PoolManager that applies the default timeout of its pools also to
+    requests that explicitly set timeout=None, as the generated client does,
+    and that reports request timings to the current stats scope."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_classes_by_scheme = dict(
+            self.pool_classes_by_scheme, https=_HTTPSConnectionPool
+        )
+
+    def urlopen(self, method, url, redirect=True, **kw):
+        if "timeout" in kw and kw["timeout"] is None:
+            del kw["timeout"]
+        scope = current_scope()
+        if scope is None:
+            return super().urlopen(method, url, redirect=redirect, **kw)
+        scope.start_transport(method, url)
+        try:
+            return super().urlopen(method, url, redirect=redirect, **kw)
+        finally:
+            scope.end_transport()
+
+
+class _TimedApi:
+    """Wrapper for the generated API that measures every call."""
+
+    def __init__(self, api, stats):
+        self._api = api
+        self._stats = stats
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self._stats.measure(name):
+                return attr(*args, **kwargs)
+
+        return call
 
 
 class NetHSM:
-    def __init__(self, host, version, username, password, verify_tls=True):
+    def __init__(
+        self,
+        host,
+        version,
+        username,
+        password,
+        verify_tls=True,
+        pool_size=DEFAULT_POOL_SIZE,
+        timeout=None,
+        key_cache=None,
+        stats=None,
+    ):
+        """Connect to the NetHSM API at the given host.
+
+        All requests, including those sent by the generated API client, use
+        one urllib3 connection pool with keep-alive connections.  At most
+        pool_size connections are opened at the same time.  New connections
+        try to resume the TLS session of a previous connection.  The timeout
+        is applied to every request; it is either a number of seconds or a
+        (connect, read) tuple.  If a KeyCache is set, key metadata and public
+        keys are cached.  If a RequestStats object is set, the timings of all
+        API calls are recorded in it."""
         self.host = host
         self.version = version
         self.username = username
         self.password = password
+        self.base_url = f"https://{host}/api/{version}"
+        self.pool_size = pool_size
+        self.key_cache = key_cache
+        self.stats = stats
+        self._keepalive = None
+
+        _import_client()
+
+        pool_kw = {}
+        if timeout is not None:
+            pool_kw["timeout"] = _make_timeout(timeout)
+        ssl_context = _TlsSessionContext(ssl.PROTOCOL_TLS_CLIENT)
+        ssl_context.check_hostname = False
+        if verify_tls:
+            ssl_context.load_verify_locations(certifi.where())
+        self.pool_manager = _PoolManager(
+            maxsize=pool_size,
+            block=True,
+            cert_reqs=ssl.CERT_REQUIRED if verify_tls else ssl.CERT_NONE,
+            ssl_context=ssl_context,
+            **pool_kw,
+        )
+
+        self.headers = {}
+        if username is not None and password is not None:
+            self.headers.update(
+                urllib3.make_headers(basic_auth=f"{username}:{password}")
+            )
 
-        base_url = f"https://{host}/api/{version}"
         config = client.Configuration(
-            host=base_url, username=username, password=password
+            host=self.base_url, username=username, password=password
         )
         config.verify_ssl = verify_tls
+        config.connection_pool_maxsize = pool_size
         self.client = client.ApiClient(configuration=config)
-
-        self.session = requests.Session()
-        self.session.auth = (self.username, self.password)
-        self.session.verify = verify_tls
+        self.client.rest_client.pool_manager = self.pool_manager
 
     def close(self):
+        self.stop_keepalive()
         self.client.close()
-        self.session.close()
+        self.pool_manager.clear()
+
+    def _alive_url(self):
+        return f"/api/{self.version}/health/alive"
+
+    def _pool(self):
+        return self.pool_manager.connection_from_url(self.base_url)
+
+    @property
+    def reconnects(self):
+        """The number of connections that had to be established again because
+        the NetHSM or a middlebox closed them."""
+        return self._pool().reconnects
+
+    def warm_up(self, connections):
+        """Open up to connections connections to the NetHSM concurrently, so
+        that the first requests do not have to wait for the TCP and TLS setup.
+
+        Returns the number of opened connections."""
+        return self._pool().warm_up(
+            min(connections, self.pool_size), self._alive_url(), {}
+        )
+
+    def start_keepalive(self, interval=DEFAULT_KEEPALIVE_INTERVAL):
+        """Ping the health/alive endpoint every interval seconds on every
+        pooled connection that has been idle for interval seconds.
+
+        The pings run in a background thread until stop_keepalive or close is
+        called.  Connections that were closed anyway are reconnected."""
+        if self._keepalive is not None:
+            return
+        stop = threading.Event()
+        url = self._alive_url()
+
+        def run():
+            while not stop.wait(interval):
+                self._pool().ping_idle(url, {}, interval)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self._keepalive = (thread, stop)
+
+    def stop_keepalive(self):
+        if self._keepalive is not None:
+            (thread, stop) = self._keepalive
+            stop.set()
+            thread.join()
+            self._keepalive = None
 
     def request(
-        self, method, endpoint, params=None, data=None, mime_type=None, json=None
+        self,
+        method,
+        endpoint,
+        params=None,
+        data=None,
+        mime_type=None,
+        json=None,
+        timeout=None,
+        stream=False,
+        callback=None,
     ):
-        url = f"https://{self.host}/api/{self.version}/{endpoint}"
-        headers = {}
-        if mime_type:
-            headers["Content-Type"] = mime_type
-        response = self.session.request(
-            method, url, params=params, data=data, headers=headers, json=json
-        )
-        if not response.ok:
-            e = ApiException(status=response.status_code, reason=response.reason)
-            e.body = response.text
-            e.headers = response.headers
-            raise e
-        return response
+        """Send a request to the given endpoint of the NetHSM API.
+
+        data can be bytes, a string or a file object.  File objects are
+        uploaded in chunks; if a callback is set, it is called with the
+        number of bytes sent and the total size.  If stream is set, the
+        response body is not preloaded and has to be read by the caller."""
+        with self._measure(f"{method} {endpoint}"):
+            url = f"{self.base_url}/{endpoint}"
+            if params:
+                url += "?" + urlencode(params)
+            headers = dict(self.headers)
+            if json is not None:
+                data = _json_dumps(json)
+                mime_type = "application/json"
+            if mime_type:
+                headers["Content-Type"] = mime_type
+            if data is not None:
+                length = _content_length(data)
+                if length is not None:
+                    headers["Content-Length"] = str(length)
+                if callback:
+                    data = _ProgressReader(data, length or 0, callback)
+            response = self.pool_manager.urlopen(
+                method,
+                url,
+                body=data,
+                headers=headers,
+                timeout=_make_timeout(timeout),
+                preload_content=not stream,
+            )
+            if not 200 <= response.status < 300:
+                e = ApiException(status=response.status, reason=response.reason)
+                e.body = response.data
+                e.headers = response.headers
+                raise e
+            return response
+
+    def _measure(self, name):
+        if self.stats is None:
+            return contextlib.nullcontext()
+        return self.stats.measure(name)
 
     def get_api(self):
         from .client.apis.tags.default_api import DefaultApi
 
-        return DefaultApi(self.client)
+        api = DefaultApi(self.client)
+        if self.stats is not None:
+            return _TimedApi(api, self.stats)
+        return api
+
+    def map_concurrent(self, func, items, workers=DEFAULT_WORKERS):
+        """Call func for every item with at most workers requests in flight.
+
+        The requests share the connection pool of this instance.  The results
+        are returned in the order of the items.  If a call fails, the pending
+        calls are cancelled and the exception is raised."""
+        items = list(items)
+        if workers <= 1 or len(items) <= 1:
+            return [func(item) for item in items]
+
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(workers, len(items))
+        )
+        try:
+            results = list(executor.map(func, items))
+        except BaseException:
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        executor.shutdown()
+        return results
 
     def get_location(self, headers):
         return headers.get("location")
@@ -269,6 +774,7 @@ class NetHSM:
         return user_id_match[1]
 
     def unlock(self, passphrase):
+        from .client.model.passphrase import Passphrase
         from .client.model.unlock_request_data import UnlockRequestData
 
         request_body = UnlockRequestData(
@@ -296,6 +802,7 @@ class NetHSM:
             )
 
     def provision(self, unlock_passphrase, admin_passphrase, system_time):
+        from .client.model.passphrase import Passphrase
         from .client.model.provision_request_data import ProvisionRequestData
 
         request_body = ProvisionRequestData(
@@ -313,6 +820,8 @@ class NetHSM:
                     400: "Malformed request data -- e. g. weak passphrase",
                 },
             )
+        finally:
+            self._invalidate_keys()
 
     def list_users(self):
         try:
@@ -346,7 +855,11 @@ class NetHSM:
                 },
             )
 
+    def get_users(self, user_ids, workers=DEFAULT_WORKERS):
+        return self.map_concurrent(self.get_user, user_ids, workers)
+
     def add_user(self, real_name, role, passphrase, user_id=None):
+        from .client.model.passphrase import Passphrase
         from .client.model.user_post_data import UserPostData
         from .client.model.user_role import UserRole
         from .client.paths.users_user_id.put import RequestPathParams
@@ -392,6 +905,7 @@ class NetHSM:
             )
 
     def set_passphrase(self, user_id, passphrase):
+        from .client.model.passphrase import Passphrase
         from .client.model.user_passphrase_post_data import UserPassphrasePostData
         from .client.paths.users_user_id_passphrase.post import RequestPathParams
 
@@ -483,6 +997,8 @@ class NetHSM:
                     404: f"Key {key_id} not found",
                 },
             )
+        finally:
+            self._invalidate_keys(key_id)
 
     def delete_key_tag(self, key_id, tag):
         from .client.paths.keys_key_id_restrictions_tags_tag.delete import (
@@ -503,6 +1019,8 @@ class NetHSM:
                     404: f"Key {key_id} or tag {tag} not found",
                 },
             )
+        finally:
+            self._invalidate_keys(key_id)
 
     def get_info(self):
         try:
@@ -518,15 +1036,46 @@ class NetHSM:
         except ApiException as e:
             _handle_api_exception(e)
 
+    def is_ready(self):
+        try:
+            self.request("GET", "health/ready")
+            return True
+        except ApiException:
+            return False
+
     def get_random_data(self, n):
-        from .client.model.random_request_data import RandomRequestData
+        from .codec import decode_random_response, encode_random_request
 
-        body = RandomRequestData(length=n)
-        try:
-            response = self.get_api().random_post(body=body)
-            return response.body["random"]
-        except ApiException as e:
-            _handle_api_exception(e, state=State.OPERATIONAL, roles=[Role.OPERATOR])
+        with self._measure("POST random"):
+            body = encode_random_request(n)
+            try:
+                response = self.request(
+                    "POST", "random", data=body, mime_type="application/json"
+                )
+            except ApiException as e:
+                _handle_api_exception(e, state=State.OPERATIONAL, roles=[Role.OPERATOR])
+            return decode_random_response(response.data)
+
+    def get_random_bytes(self, n, workers=DEFAULT_WORKERS):
+        """Retrieve n random bytes from the NetHSM.
+
+        The data is requested in chunks of at most RANDOM_CHUNK_SIZE bytes,
+        the maximum supported by the NetHSM, with up to workers concurrent
+        requests.  The chunks are decoded into one preallocated bytearray
+        that is returned."""
+        buffer = bytearray(n)
+
+        def fetch(offset):
+            length = min(RANDOM_CHUNK_SIZE, n - offset)
+            data = base64.b64decode(self.get_random_data(length))
+            if len(data) != length:
+                raise NetHSMError(
+                    f"Expected {length} random bytes, received {len(data)} bytes"
+                )
+            buffer[offset : offset + length] = data
+
+        self.map_concurrent(fetch, range(0, n, RANDOM_CHUNK_SIZE), workers)
+        return buffer
 
     def get_metrics(self):
         try:
@@ -552,24 +1101,44 @@ class NetHSM:
                 roles=[Role.ADMINISTRATOR, Role.OPERATOR],
             )
 
+    def _cached(self, key_id, kind, fetch):
+        if self.key_cache is None:
+            return fetch(key_id)
+        value = self.key_cache.get(self.host, key_id, kind)
+        if value is None:
+            value = fetch(key_id)
+            self.key_cache.put(self.host, key_id, kind, value)
+        return value
+
+    def _invalidate_keys(self, key_id=None):
+        if self.key_cache is not None:
+            self.key_cache.invalidate(self.host, key_id)
+
     def get_key(self, key_id):
+        return self._cached(key_id, "key", self._fetch_key)
+
+    def _fetch_key(self, key_id):
         from .client.paths.keys_key_id.get import RequestPathParams
 
         path_params = RequestPathParams({"KeyID": key_id})
         try:
             response = self.get_api().keys_key_id_get(path_params=path_params)
+            # attribute access to the response fails with Python 3.10+
+            # because class annotations are no longer inherited
             key = response.body
+            restrictions = key["restrictions"]
+            public_key = key.get("key", {})
             return Key(
                 key_id=key_id,
-                mechanisms=[mechanism for mechanism in key.mechanisms],
-                type=key.type,
-                operations=key.operations,
-                tags=[tag for tag in key.restrictions["tags"]]
-                if "tags" in key.restrictions.keys()
+                mechanisms=[mechanism for mechanism in key["mechanisms"]],
+                type=key["type"],
+                operations=key["operations"],
+                tags=[tag for tag in restrictions["tags"]]
+                if "tags" in restrictions.keys()
                 else None,
-                modulus=getattr(key.key, "modulus", None),
-                public_exponent=getattr(key.key, "public_exponent", None),
-                data=getattr(key.key, "data", None),
+                modulus=public_key.get("modulus"),
+                public_exponent=public_key.get("publicExponent"),
+                data=public_key.get("data"),
             )
         except ApiException as e:
             _handle_api_exception(
@@ -581,7 +1150,13 @@ class NetHSM:
                 },
             )
 
+    def get_keys(self, key_ids, workers=DEFAULT_WORKERS):
+        return self.map_concurrent(self.get_key, key_ids, workers)
+
     def get_key_public_key(self, key_id):
+        return self._cached(key_id, "public_key", self._fetch_key_public_key)
+
+    def _fetch_key_public_key(self, key_id):
         from .client.paths.keys_key_id_public_pem.get import RequestPathParams
 
         path_params = RequestPathParams({"KeyID": key_id})
@@ -661,6 +1236,9 @@ class NetHSM:
                     409: f"Conflict -- a key with the ID {key_id} already exists",
                 },
             )
+        finally:
+            if key_id:
+                self._invalidate_keys(key_id)
 
     def delete_key(self, key_id):
         from .client.paths.keys_key_id.delete import RequestPathParams
@@ -677,6 +1255,8 @@ class NetHSM:
                     404: f"Key {key_id} not found",
                 },
             )
+        finally:
+            self._invalidate_keys(key_id)
 
     def generate_key(self, type, mechanisms, length, key_id):
         from .client.model.key_generate_request_data import KeyGenerateRequestData
@@ -715,6 +1295,9 @@ class NetHSM:
                     400: "Bad request -- invalid input data",
                 },
             )
+        finally:
+            if key_id:
+                self._invalidate_keys(key_id)
 
     def get_config_logging(self):
         try:
@@ -773,8 +1356,8 @@ class NetHSM:
 
     def get_key_certificate(self, key_id):
         try:
-            response = self.request("GET", f"keys/{key_id}/cert")
-            return response.content.decode("utf-8")
+            response = self.request("GET", _key_endpoint(key_id, "cert"))
+            return response.data.decode("utf-8")
         except ApiException as e:
             _handle_api_exception(
                 e,
@@ -805,7 +1388,9 @@ class NetHSM:
 
     def set_key_certificate(self, key_id, cert, mime_type):
         try:
-            self.request("PUT", f"keys/{key_id}/cert", data=cert, mime_type=mime_type)
+            self.request(
+                "PUT", _key_endpoint(key_id, "cert"), data=cert, mime_type=mime_type
+            )
         except ApiException as e:
             _handle_api_exception(
                 e,
@@ -931,6 +1516,7 @@ class NetHSM:
 
     def set_backup_passphrase(self, passphrase):
         from .client.model.backup_passphrase_config import BackupPassphraseConfig
+        from .client.model.passphrase import Passphrase
 
         body = BackupPassphraseConfig(passphrase=Passphrase(passphrase))
         try:
@@ -946,6 +1532,7 @@ class NetHSM:
             )
 
     def set_unlock_passphrase(self, passphrase):
+        from .client.model.passphrase import Passphrase
         from .client.model.unlock_passphrase_config import UnlockPassphraseConfig
 
         body = UnlockPassphraseConfig(passphrase=Passphrase(passphrase))
@@ -1046,9 +1633,15 @@ class NetHSM:
             )
 
     def backup(self):
+        return b"".join(self.iter_backup())
+
+    def iter_backup(self, callback=None, chunk_size=STREAM_CHUNK_SIZE):
+        """Download a backup and yield it in chunks.
+
+        If a callback is set, it is called with the size of every chunk and
+        the total size of the backup (or 0 if it is unknown)."""
         try:
-            response = self.request("POST", "system/backup")
-            return response.content
+            response = self.request("POST", "system/backup", stream=True)
         except ApiException as e:
             _handle_api_exception(
                 e,
@@ -1056,13 +1649,38 @@ class NetHSM:
                 roles=[Role.BACKUP],
             )
 
-    def restore(self, backup, passphrase, time):
+        completed = False
+        try:
+            total = int(response.headers.get("content-length", 0))
+            if callback:
+                callback(0, total)
+            for chunk in response.stream(chunk_size):
+                if callback:
+                    callback(len(chunk), total)
+                yield chunk
+            completed = True
+        finally:
+            if not completed:
+                response.close()
+            response.release_conn()
+
+    def write_backup(self, f, callback=None):
+        for chunk in self.iter_backup(callback=callback):
+            f.write(chunk)
+
+    def restore(self, backup, passphrase, time, callback=None):
         try:
             params = {
                 "backupPassphrase": passphrase,
                 "systemTime": time.isoformat(),
             }
-            self.request("POST", "system/restore", params=params, data=backup)
+            self.request(
+                "POST",
+                "system/restore",
+                params=params,
+                data=backup,
+                callback=callback,
+            )
         except ApiException as e:
             _handle_api_exception(
                 e,
@@ -1071,11 +1689,15 @@ class NetHSM:
                     400: "Bad request -- backup did not apply",
                 },
             )
+        finally:
+            self._invalidate_keys()
 
-    def update(self, image):
+    def update(self, image, callback=None):
         try:
-            response = self.request("POST", "system/update", data=image)
-            return response.json().get("releaseNotes")
+            response = self.request(
+                "POST", "system/update", data=image, callback=callback
+            )
+            return json.loads(response.data).get("releaseNotes")
         except ApiException as e:
             _handle_api_exception(
                 e,
@@ -1136,86 +1758,164 @@ class NetHSM:
                 state=State.OPERATIONAL,
                 roles=[Role.ADMINISTRATOR],
             )
+        finally:
+            self._invalidate_keys()
 
     def encrypt(self, key_id, data, mode, iv):
-        from .client.model.base64 import Base64
-        from .client.model.encrypt_mode import EncryptMode
-        from .client.model.encrypt_request_data import EncryptRequestData
-        from .client.paths.keys_key_id_encrypt.post import RequestPathParams
+        from .codec import decode_encrypt_response, encode_encrypt_request
+
+        with self._measure("POST keys/{KeyID}/encrypt"):
+            body = encode_encrypt_request(data, mode, iv)
+            try:
+                response = self.request(
+                    "POST",
+                    _key_endpoint(key_id, "encrypt"),
+                    data=body,
+                    mime_type="application/json",
+                )
+            except ApiException as e:
+                _handle_api_exception(
+                    e,
+                    state=State.OPERATIONAL,
+                    roles=[Role.OPERATOR],
+                    messages={
+                        400: "Bad request -- e. g. invalid encryption mode, or wrong padding",
+                        404: f"Key {key_id} not found",
+                    },
+                )
+            return decode_encrypt_response(response.data)
+
+    def decrypt(self, key_id, data, mode, iv=None):
+        from .codec import decode_decrypt_response, encode_decrypt_request
+
+        with self._measure("POST keys/{KeyID}/decrypt"):
+            body = encode_decrypt_request(data, mode, iv)
+            try:
+                response = self.request(
+                    "POST",
+                    _key_endpoint(key_id, "decrypt"),
+                    data=body,
+                    mime_type="application/json",
+                )
+            except ApiException as e:
+                _handle_api_exception(
+                    e,
+                    state=State.OPERATIONAL,
+                    roles=[Role.OPERATOR],
+                    messages={
+                        400: "Bad request -- e. g. invalid encryption mode",
+                        404: f"Key {key_id} not found",
+                    },
+                )
+            return decode_decrypt_response(response.data)
 
-        path_params = RequestPathParams({"KeyID": key_id})
-        body = EncryptRequestData(
-            message=Base64(data), mode=EncryptMode(mode), iv=Base64(iv)
-        )
-        try:
-            response = self.get_api().keys_key_id_encrypt_post(
-                path_params=path_params, body=body
-            )
-            return (response.body.encrypted, response.body.iv)
-        except ApiException as e:
-            _handle_api_exception(
-                e,
-                state=State.OPERATIONAL,
-                roles=[Role.OPERATOR],
-                messages={
-                    400: "Bad request -- e. g. invalid encryption mode, or wrong padding",
-                    404: f"Key {key_id} not found",
-                },
-            )
+    def sign(self, key_id, data, mode):
+        from .codec import decode_sign_response, encode_sign_request
+
+        with self._measure("POST keys/{KeyID}/sign"):
+            body = encode_sign_request(data, mode)
+            try:
+                response = self.request(
+                    "POST",
+                    _key_endpoint(key_id, "sign"),
+                    data=body,
+                    mime_type="application/json",
+                )
+            except ApiException as e:
+                _handle_api_exception(
+                    e,
+                    state=State.OPERATIONAL,
+                    roles=[Role.OPERATOR],
+                    messages={
+                        400: "Bad request -- e. g. invalid sign mode",
+                        404: f"Key {key_id} not found",
+                    },
+                )
+            return decode_sign_response(response.data)
 
-    def decrypt(self, key_id, data, mode, iv):
-        from .client.model.base64 import Base64
-        from .client.model.decrypt_mode import DecryptMode
-        from .client.model.decrypt_request_data import DecryptRequestData
-        from .client.paths.keys_key_id_decrypt.post import RequestPathParams
+    def verify(self, key_id, data, signature, mode):
+        """Verify a Base64 signature for Base64 data locally.
 
-        path_params = RequestPathParams({"KeyID": key_id})
-        body = DecryptRequestData(encrypted=Base64(data), mode=DecryptMode(mode))
-        try:
-            response = self.get_api().keys_key_id_decrypt_post(
-                path_params=path_params, body=body
-            )
-            return response.body.decrypted
-        except ApiException as e:
-            _handle_api_exception(
-                e,
-                state=State.OPERATIONAL,
-                roles=[Role.OPERATOR],
-                messages={
-                    400: "Bad request -- e. g. invalid encryption mode",
-                    404: f"Key {key_id} not found",
-                },
-            )
+        The public key of the key is fetched from the NetHSM, or from the key
+        cache if it is set, and the signature is checked without sending it
+        to the NetHSM.  Returns True if the signature is valid."""
+        from .verify import load_public_key, verify_signature
 
-    def sign(self, key_id, data, mode):
-        from .client.model.base64 import Base64
-        from .client.model.sign_mode import SignMode
-        from .client.model.sign_request_data import SignRequestData
-        from .client.paths.keys_key_id_sign.post import RequestPathParams
+        public_key = self._cached(
+            key_id,
+            "public_key_object",
+            lambda key_id: load_public_key(self.get_key_public_key(key_id)),
+        )
+        return verify_signature(
+            public_key, mode, base64.b64decode(data), base64.b64decode(signature)
+        )
 
-        path_params = RequestPathParams({"KeyID": key_id})
-        body = SignRequestData(message=Base64(data), mode=SignMode(mode))
-        try:
-            response = self.get_api().keys_key_id_sign_post(
-                path_params=path_params, body=body
-            )
-            return response.body.signature
-        except ApiException as e:
-            _handle_api_exception(
-                e,
-                state=State.OPERATIONAL,
-                roles=[Role.OPERATOR],
-                messages={
-                    400: "Bad request -- e. g. invalid sign mode",
-                    404: f"Key {key_id} not found",
-                },
-            )
+    def sign_many(self, key_id, messages, mode, workers=DEFAULT_WORKERS):
+        """Sign an iterable of Base64 messages with one key.
+
+        This is a generator that yields the Base64 signatures in the order of
+        the messages.  Up to workers requests are kept in flight over the
+        keep-alive connections of this instance.  If a message cannot be
+        signed, a NetHSMError with the (one-based) number of the message is
+        raised after the signatures of the previous messages."""
+
+        def result(index, future):
+            try:
+                return future.result()
+            except NetHSMError as e:
+                raise NetHSMError(
+                    f"Failed to sign message {index + 1}: {e}", status=e.status
+                ) from e
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = collections.deque()
+            try:
+                for (index, message) in enumerate(messages):
+                    if len(pending) >= workers:
+                        yield result(*pending.popleft())
+                    future = executor.submit(self.sign, key_id, message, mode)
+                    pending.append((index, future))
+                while pending:
+                    yield result(*pending.popleft())
+            finally:
+                for (_, future) in pending:
+                    future.cancel()
 
 
 @contextlib.contextmanager
-def connect(host, version, username, password, verify_tls=True):
-    nethsm = NetHSM(host, version, username, password, verify_tls)
+def connect(
+    host,
+    version,
+    username,
+    password,
+    verify_tls=True,
+    pool_size=DEFAULT_POOL_SIZE,
+    timeout=None,
+    key_cache=None,
+    stats=None,
+    warm_up=0,
+    keepalive=None,
+):
+    """Create a NetHSM instance and close it at the end of the context.
+
+    If warm_up is set, this number of connections is opened in advance.  If
+    keepalive is set, idle connections are pinged every keepalive seconds."""
+    nethsm = NetHSM(
+        host,
+        version,
+        username,
+        password,
+        verify_tls,
+        pool_size,
+        timeout,
+        key_cache,
+        stats,
+    )
     try:
+        if warm_up:
+            nethsm.warm_up(warm_up)
+        if keepalive:
+            nethsm.start_keepalive(keepalive)
         yield nethsm
     finally:
         nethsm.close()
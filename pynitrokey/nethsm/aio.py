@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""asyncio client for the NetHSM REST API.
+
+This module requires the optional aiohttp dependency that can be installed
+with the nethsm-async extra of pynitrokey."""
+
+import contextlib
+import json
+
+import aiohttp
+
+from . import Key, Role, State, _handle_api_exception, _key_endpoint
+from .client import ApiException
+
+DEFAULT_POOL_SIZE = 100
+
+
+class AsyncNetHSM:
+    """Non-blocking variant of pynitrokey.nethsm.NetHSM.
+
+    All requests share one aiohttp session with HTTP keep-alive.  At most
+    pool_size connections are opened to the NetHSM, additional requests wait
+    for a free connection.  Instances must be created and used within a
+    running event loop, preferably using the connect context manager."""
+
+    def __init__(
+        self,
+        host,
+        version,
+        username,
+        password,
+        verify_tls=True,
+        pool_size=DEFAULT_POOL_SIZE,
+        timeout=None,
+    ):
+        self.host = host
+        self.version = version
+        self.username = username
+        self.password = password
+
+        self.base_url = f"https://{host}/api/{version}"
+        auth = None
+        if username is not None:
+            auth = aiohttp.BasicAuth(username, password or "")
+        connector = aiohttp.TCPConnector(
+            limit=pool_size, ssl=None if verify_tls else False
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            auth=auth,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        )
+
+    async def close(self):
+        await self.session.close()
+
+    async def request(
+        self, method, endpoint, params=None, data=None, mime_type=None, json=None
+    ):
+        url = f"{self.base_url}/{endpoint}"
+        headers = {}
+        if mime_type:
+            headers["Content-Type"] = mime_type
+        async with self.session.request(
+            method, url, params=params, data=data, headers=headers, json=json
+        ) as response:
+            body = await response.read()
+            if not response.ok:
+                e = ApiException(status=response.status, reason=response.reason)
+                e.body = body.decode("utf-8", errors="replace")
+                e.headers = response.headers
+                raise e
+            return body
+
+    async def request_json(self, method, endpoint, **kwargs):
+        return json.loads(await self.request(method, endpoint, **kwargs))
+
+    async def get_random_data(self, n):
+        try:
+            response = await self.request_json("POST", "random", json={"length": n})
+            return response["random"]
+        except ApiException as e:
+            _handle_api_exception(e, state=State.OPERATIONAL, roles=[Role.OPERATOR])
+
+    async def get_metrics(self):
+        try:
+            return await self.request_json("GET", "metrics")
+        except ApiException as e:
+            _handle_api_exception(e, state=State.OPERATIONAL, roles=[Role.METRICS])
+
+    async def list_keys(self, filter):
+        params = {"filter": filter} if filter else None
+        try:
+            response = await self.request_json("GET", "keys", params=params)
+            return [item["key"] for item in response]
+        except ApiException as e:
+            _handle_api_exception(
+                e,
+                state=State.OPERATIONAL,
+                roles=[Role.ADMINISTRATOR, Role.OPERATOR],
+            )
+
+    async def get_key(self, key_id):
+        try:
+            key = await self.request_json("GET", _key_endpoint(key_id))
+            restrictions = key.get("restrictions", {})
+            public_key = key.get("key") or {}
+            return Key(
+                key_id=key_id,
+                mechanisms=key["mechanisms"],
+                type=key["type"],
+                operations=key.get("operations"),
+                tags=restrictions["tags"] if "tags" in restrictions else None,
+                modulus=public_key.get("modulus"),
+                public_exponent=public_key.get("publicExponent"),
+                data=public_key.get("data"),
+            )
+        except ApiException as e:
+            _handle_api_exception(
+                e,
+                state=State.OPERATIONAL,
+                roles=[Role.ADMINISTRATOR, Role.OPERATOR],
+                messages={
+                    404: f"Key {key_id} not found",
+                },
+            )
+
+    async def backup(self):
+        try:
+            return await self.request("POST", "system/backup")
+        except ApiException as e:
+            _handle_api_exception(
+                e,
+                state=State.OPERATIONAL,
+                roles=[Role.BACKUP],
+            )
+
+    async def encrypt(self, key_id, data, mode, iv):
+        body = {"message": data, "mode": mode, "iv": iv}
+        try:
+            response = await self.request_json(
+                "POST", _key_endpoint(key_id, "encrypt"), json=body
+            )
+            return (response["encrypted"], response["iv"])
+        except ApiException as e:
+            _handle_api_exception(
+                e,
+                state=State.OPERATIONAL,
+                roles=[Role.OPERATOR],
+                messages={
+                    400: "Bad request -- e. g. invalid encryption mode, or wrong padding",
+                    404: f"Key {key_id} not found",
+                },
+            )
+
+    async def decrypt(self, key_id, data, mode, iv=None):
+        body = {"encrypted": data, "mode": mode}
+        if iv:
+            body["iv"] = iv
+        try:
+            response = await self.request_json(
+                "POST", _key_endpoint(key_id, "decrypt"), json=body
+            )
+            return response["decrypted"]
+        except ApiException as e:
+            _handle_api_exception(
+                e,
+                state=State.OPERATIONAL,
+                roles=[Role.OPERATOR],
+                messages={
+                    400: "Bad request -- e. g. invalid encryption mode",
+                    404: f"Key {key_id} not found",
+                },
+            )
+
+    async def sign(self, key_id, data, mode):
+        body = {"message": data, "mode": mode}
+        try:
+            response = await self.request_json(
+                "POST", _key_endpoint(key_id, "sign"), json=body
+            )
+            return response["signature"]
+        except ApiException as e:
+            _handle_api_exception(
+                e,
+                state=State.OPERATIONAL,
+                roles=[Role.OPERATOR],
+                messages={
+                    400: "Bad request -- e. g. invalid sign mode",
+                    404: f"Key {key_id} not found",
+                },
+            )
+
+
+@contextlib.asynccontextmanager
+async def connect(
+    host,
+    version,
+    username,
+    password,
+    verify_tls=True,
+    pool_size=DEFAULT_POOL_SIZE,
+    timeout=None,
+):
+    nethsm = AsyncNetHSM(
+        host, version, username, password, verify_tls, pool_size, timeout
+    )
+    try:
+        yield nethsm
+    finally:
+        await nethsm.close()
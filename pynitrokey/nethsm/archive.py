@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""Deduplicating storage for NetHSM backups.
+
+A backup archive is a directory with a chunks and a snapshots directory.
+Every backup is split into chunks with content-defined chunking, so that
+data that is contained in several backups results in the same chunks even
+if it is shifted.  The chunks are compressed and stored once under their
+SHA-256 hash, shared by all backups and hosts in the archive.  Every backup
+is described by a JSON snapshot file that lists its chunks.
+
+The backups are encrypted by the NetHSM; the archive only reduces the
+required storage."""
+
+import bisect
+import datetime
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+import zlib
+
+MIN_CHUNK_SIZE = 4 * 1024
+AVG_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 64 * 1024
+FORMAT_VERSION = 1
+
+_RAW = b"\x00"
+_ZLIB = b"\x01"
+# a chunk boundary can only follow this byte (at the end of a run of it).
+# Searching it with a regular expression skips most of the data in C
+# instead of hashing every byte in Python.
+_ANCHOR = re.compile(rb"\xa5(?!\xa5)")
+_ANCHOR_BITS = 8
+# the number of bytes before a boundary that decide whether it is used
+_WINDOW_SIZE = 48
+
+
+def _cut_mask(avg_size):
+    bits = avg_size.bit_length() - 1
+    if avg_size != 1 << bits or bits < _ANCHOR_BITS:
+        raise ValueError("The average chunk size must be a power of two >= 256")
+    # an anchor occurs every 256 bytes in random data, so only every
+    # (avg_size / 256)th anchor is used as a boundary
+    return (1 << (bits - _ANCHOR_BITS)) - 1
+
+
+def _find_cut(data, min_size, max_size, mask):
+    n = len(data)
+    if n <= min_size:
+        return n
+    end = min(n, max_size)
+    view = memoryview(data)
+    match = _ANCHOR.search(data, min_size - 1, end)
+    while match:
+        cut = match.end()
+        if not zlib.crc32(view[cut - _WINDOW_SIZE : cut]) & mask:
+            return cut
+        match = _ANCHOR.search(data, cut, end)
+    return end
+
+
+def split_chunks(
+    blocks,
+    min_size=MIN_CHUNK_SIZE,
+    avg_size=AVG_CHUNK_SIZE,
+    max_size=MAX_CHUNK_SIZE,
+):
+    """Split a stream of byte blocks into content-defined chunks.
+
+    A chunk boundary follows an anchor byte if the CRC-32 of the preceding
+    window matches a mask, so the boundaries only depend on the preceding
+    bytes.  Every chunk has a size between min_size and max_size except for
+    the last one."""
+    if min_size < _WINDOW_SIZE:
+        raise ValueError(f"The minimum chunk size must be at least {_WINDOW_SIZE}")
+    mask = _cut_mask(avg_size)
+    buffer = bytearray()
+    for block in blocks:
+        buffer += block
+        while len(buffer) >= max_size:
+            cut = _find_cut(buffer, min_size, max_size, mask)
+            yield bytes(buffer[:cut])
+            del buffer[:cut]
+    while buffer:
+        cut = _find_cut(buffer, min_size, max_size, mask)
+        yield bytes(buffer[:cut])
+        del buffer[:cut]
+
+
+def _compress(data):
+    compressed = zlib.compress(data)
+    if len(compressed) < len(data):
+        return _ZLIB + compressed
+    return _RAW + data
+
+
+def _decompress(data):
+    if data[:1] == _ZLIB:
+        return zlib.decompress(data[1:])
+    elif data[:1] == _RAW:
+        return data[1:]
+    raise ValueError("Unknown chunk format")
+
+
+def _write_atomic(path, data, exclusive=False):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    (fd, tmp) = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        if exclusive:
+            # both variants fail with FileExistsError if the file exists
+            try:
+                os.link(tmp, path)
+            except OSError:
+                # e. g. the file system does not support hard links
+                with open(path, "xb") as f:
+                    f.write(data)
+        else:
+            os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def snapshot_name(host, time=None):
+    """Return the default snapshot name for a backup of host."""
+    time = time or datetime.datetime.now(datetime.timezone.utc)
+    host = re.sub(r"[^a-zA-Z0-9.-]", "_", host)
+    return f"{host}-{time.strftime('%Y%m%dT%H%M%SZ')}"
+
+
+class SnapshotInfo:
+    def __init__(self, name, host, created, size, chunks, new_chunks, stored):
+        self.name = name
+        self.host = host
+        self.created = created
+        self.size = size
+        self.chunks = chunks
+        self.new_chunks = new_chunks
+        self.stored = stored
+
+
+class BackupArchive:
+    """A directory that stores deduplicated NetHSM backups.
+
+    Several processes can write into the same archive: chunks and snapshots
+    are written atomically, and an existing snapshot is never replaced."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.path, "chunks", digest[:2], digest)
+
+    def _snapshot_path(self, name):
+        if not re.fullmatch(r"[a-zA-Z0-9._-]+", name) or name.startswith("."):
+            raise ValueError(f"Invalid snapshot name: {name}")
+        return os.path.join(self.path, "snapshots", name + ".json")
+
+    def snapshots(self):
+        """Return the names of the snapshots in the archive."""
+        try:
+            files = os.listdir(os.path.join(self.path, "snapshots"))
+        except FileNotFoundError:
+            return []
+        return sorted(f[:-5] for f in files if f.endswith(".json"))
+
+    def add(self, name, host, blocks):
+        """Store a backup that is read from an iterable of byte blocks as a
+        new snapshot and return a SnapshotInfo instance.
+
+        Raises a FileExistsError if the snapshot already exists."""
+        path = self._snapshot_path(name)
+        if os.path.exists(path):
+            raise FileExistsError(f"Snapshot {name} already exists")
+
+        digest = hashlib.sha256()
+        chunks = []
+        new_chunks = 0
+        stored = 0
+        for chunk in split_chunks(blocks):
+            digest.update(chunk)
+            chunk_digest = hashlib.sha256(chunk).hexdigest()
+            chunk_path = self._chunk_path(chunk_digest)
+            if not os.path.exists(chunk_path):
+                data = _compress(chunk)
+                _write_atomic(chunk_path, data)
+                new_chunks += 1
+                stored += len(data)
+            chunks.append([chunk_digest, len(chunk)])
+
+        created = datetime.datetime.now(datetime.timezone.utc)
+        size = sum(length for (_, length) in chunks)
+        snapshot = {
+            "version": FORMAT_VERSION,
+            "host": host,
+            "created": created.isoformat(),
+            "size": size,
+            "sha256": digest.hexdigest(),
+            "chunks": chunks,
+        }
+        _write_atomic(path, json.dumps(snapshot).encode(), exclusive=True)
+        return SnapshotInfo(name, host, created, size, len(chunks), new_chunks, stored)
+
+    def load(self, name):
+        """Return the snapshot with the given name as a dict."""
+        path = self._snapshot_path(name)
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"Snapshot {name} does not exist")
+        if snapshot.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported version of snapshot {name}")
+        return snapshot
+
+    def read_chunk(self, digest):
+        try:
+            with open(self._chunk_path(digest), "rb") as f:
+                chunk = _decompress(f.read())
+        except FileNotFoundError:
+            raise ValueError(f"Chunk {digest} is missing")
+        if hashlib.sha256(chunk).hexdigest() != digest:
+            raise ValueError(f"Chunk {digest} is corrupted")
+        return chunk
+
+    def open(self, name):
+        """Return a binary file object that reads the backup of a snapshot."""
+        return SnapshotReader(self, self.load(name))
+
+
+class SnapshotReader(io.RawIOBase):
+    """Seekable file object that reassembles a backup from its chunks.
+
+    Only the current chunk is kept in memory.  Every chunk is verified
+    against its hash when it is loaded.  If the backup is read sequentially,
+    it is also verified against the hash of the snapshot before the last
+    bytes are returned, so that a modified chunk list is detected."""
+
+    def __init__(self, archive, snapshot):
+        self.archive = archive
+        self.sha256 = snapshot["sha256"]
+        self._digest = hashlib.sha256()
+        self._hashed = 0
+        self.digests = [digest for (digest, _) in snapshot["chunks"]]
+        self.offsets = [0]
+        for (_, length) in snapshot["chunks"]:
+            self.offsets.append(self.offsets[-1] + length)
+        self.size = self.offsets[-1]
+        if self.size != snapshot["size"]:
+            raise ValueError("The chunks do not match the size of the snapshot")
+        self.position = 0
+        self._index = None
+        self._chunk = b""
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("Negative seek position")
+        self.position = offset
+        return offset
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        index = bisect.bisect_right(self.offsets, self.position) - 1
+        if index != self._index:
+            self._chunk = self.archive.read_chunk(self.digests[index])
+            self._index = index
+        start = self.position - self.offsets[index]
+        data = self._chunk[start : start + len(buffer)]
+        if self.position == self._hashed:
+            self._digest.update(data)
+            self._hashed += len(data)
+            if self._hashed == self.size and self._digest.hexdigest() != self.sha256:
+                raise ValueError("The backup does not match the snapshot hash")
+        buffer[: len(data)] = data
+        self.position += len(data)
+        return len(data)
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""Load generation for the crypto operations of a NetHSM."""
+
+import base64
+import os
+import threading
+import time
+
+import urllib3.exceptions
+
+from . import DecryptMode, EncryptMode, KeyMechanism, KeyType, NetHSMError, SignMode
+from .stats import Histogram
+
+DEFAULT_DURATION = 10
+KEY_PREFIX = "bench"
+
+
+def _b64(data):
+    return base64.b64encode(data).decode()
+
+
+class Benchmark:
+    """A crypto operation with the key it is executed with.
+
+    prepare is called once with the NetHSM and the key ID and returns the
+    function that executes one operation."""
+
+    def __init__(self, name, key_type, length, mechanisms, prepare):
+        self.name = name
+        self.key_type = key_type
+        self.length = length
+        self.mechanisms = mechanisms
+        self.prepare = prepare
+
+    @property
+    def key_id(self):
+        # benchmarks with the same key type share the key; key IDs must be
+        # alphanumeric
+        key_type = "".join(c for c in self.key_type.value if c.isalnum())
+        return f"{KEY_PREFIX}{key_type}{self.length}"
+
+
+def _sign(mode, message_length):
+    def prepare(nethsm, key_id):
+        message = _b64(os.urandom(message_length))
+        return lambda: nethsm.sign(key_id, message, mode.value)
+
+    return prepare
+
+
+def _rsa_decrypt(mode):
+    def prepare(nethsm, key_id):
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+
+        from .verify import load_public_key
+
+        public_key = load_public_key(nethsm.get_key_public_key(key_id))
+        if mode == DecryptMode.PKCS1:
+            pad = padding.PKCS1v15()
+        else:
+            pad = padding.OAEP(
+                mgf=padding.MGF1(hashes.SHA256()), algorithm=hashes.SHA256(), label=None
+            )
+        encrypted = _b64(public_key.encrypt(os.urandom(32), pad))
+        return lambda: nethsm.decrypt(key_id, encrypted, mode.value)
+
+    return prepare
+
+
+def _aes_encrypt(nethsm, key_id):
+    message = _b64(os.urandom(64))
+    iv = _b64(os.urandom(16))
+    return lambda: nethsm.encrypt(key_id, message, EncryptMode.AES_CBC.value, iv)
+
+
+def _aes_decrypt(nethsm, key_id):
+    iv = _b64(os.urandom(16))
+    (encrypted, iv) = nethsm.encrypt(
+        key_id, _b64(os.urandom(64)), EncryptMode.AES_CBC.value, iv
+    )
+    return lambda: nethsm.decrypt(key_id, encrypted, DecryptMode.AES_CBC.value, iv)
+
+
+_RSA_MECHANISMS = [
+    KeyMechanism.RSA_SIGNATURE_PKCS1,
+    KeyMechanism.RSA_SIGNATURE_PSS_SHA256,
+    KeyMechanism.RSA_DECRYPTION_PKCS1,
+    KeyMechanism.RSA_DECRYPTION_OAEP_SHA256,
+]
+_AES_MECHANISMS = [KeyMechanism.AES_ENCRYPTION_CBC, KeyMechanism.AES_DECRYPTION_CBC]
+
+BENCHMARKS = [
+    Benchmark(
+        "sign-rsa2048-pkcs1",
+        KeyType.RSA,
+        2048,
+        _RSA_MECHANISMS,
+        _sign(SignMode.PKCS1, 32),
+    ),
+    Benchmark(
+        "sign-rsa2048-pss-sha256",
+        KeyType.RSA,
+        2048,
+        _RSA_MECHANISMS,
+        _sign(SignMode.PSS_SHA256, 32),
+    ),
+    Benchmark(
+        "sign-p256-ecdsa",
+        KeyType.EC_P256,
+        256,
+        [KeyMechanism.ECDSA_SIGNATURE],
+        _sign(SignMode.ECDSA, 32),
+    ),
+    Benchmark(
+        "sign-p384-ecdsa",
+        KeyType.EC_P384,
+        384,
+        [KeyMechanism.ECDSA_SIGNATURE],
+        _sign(SignMode.ECDSA, 48),
+    ),
+    Benchmark(
+        "sign-p521-ecdsa",
+        KeyType.EC_P521,
+        521,
+        [KeyMechanism.ECDSA_SIGNATURE],
+        _sign(SignMode.ECDSA, 64),
+    ),
+    Benchmark(
+        "sign-ed25519",
+        KeyType.CURVE25519,
+        256,
+        [KeyMechanism.EDDSA_SIGNATURE],
+        _sign(SignMode.EDDSA, 32),
+    ),
+    Benchmark(
+        "decrypt-rsa2048-pkcs1",
+        KeyType.RSA,
+        2048,
+        _RSA_MECHANISMS,
+        _rsa_decrypt(DecryptMode.PKCS1),
+    ),
+    Benchmark(
+        "decrypt-rsa2048-oaep-sha256",
+        KeyType.RSA,
+        2048,
+        _RSA_MECHANISMS,
+        _rsa_decrypt(DecryptMode.OAEP_SHA256),
+    ),
+    Benchmark(
+        "encrypt-aes256-cbc", KeyType.GENERIC, 256, _AES_MECHANISMS, _aes_encrypt
+    ),
+    Benchmark(
+        "decrypt-aes256-cbc", KeyType.GENERIC, 256, _AES_MECHANISMS, _aes_decrypt
+    ),
+]
+BENCHMARK_NAMES = [benchmark.name for benchmark in BENCHMARKS]
+
+
+def get_benchmark(name):
+    for benchmark in BENCHMARKS:
+        if benchmark.name == name:
+            return benchmark
+    raise ValueError(f"Unknown benchmark {name}")
+
+
+def ensure_keys(nethsm, benchmarks):
+    """Generate the keys for the benchmarks that do not exist yet.
+
+    Returns the IDs of the generated keys."""
+    existing = set(nethsm.list_keys(None))
+    generated = []
+    for benchmark in benchmarks:
+        key_id = benchmark.key_id
+        if key_id in existing:
+            continue
+        nethsm.generate_key(
+            benchmark.key_type.value,
+            [mechanism.value for mechanism in benchmark.mechanisms],
+            benchmark.length,
+            key_id,
+        )
+        existing.add(key_id)
+        generated.append(key_id)
+    return generated
+
+
+def run(nethsm, benchmark, workers, duration=DEFAULT_DURATION, key_id=None):
+    """Execute a benchmark with workers threads for duration seconds.
+
+    Returns a dict with the number of operations and errors, the operations
+    per second, the latency percentiles in milliseconds and the number of
+    connections that had to be established again."""
+    key_id = key_id or benchmark.key_id
+    operation = benchmark.prepare(nethsm, key_id)
+    reconnects = nethsm.reconnects
+
+    lock = threading.Lock()
+    latencies = Histogram()
+    errors = {}
+    start = time.perf_counter()
+    deadline = start + duration
+
+    def work():
+        while True:
+            begin = time.perf_counter()
+            if begin >= deadline:
+                return
+            try:
+                operation()
+                error = None
+            except (NetHSMError, urllib3.exceptions.HTTPError) as e:
+                error = type(e).__name__ if not str(e) else str(e).splitlines()[0]
+            end = time.perf_counter()
+            with lock:
+                if error:
+                    errors[error] = errors.get(error, 0) + 1
+                else:
+                    latencies.add(end - begin)
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    n_errors = sum(errors.values())
+    total = latencies.count + n_errors
+
+    def ms(seconds):
+        return round(seconds * 1000, 3) if seconds is not None else None
+
+    return {
+        "benchmark": benchmark.name,
+        "key_id": key_id,
+        "workers": workers,
+        "duration": round(elapsed, 3),
+        "operations": latencies.count,
+        "errors": n_errors,
+        "error_rate": n_errors / total if total else 0.0,
+        "error_messages": errors,
+        "reconnects": nethsm.reconnects - reconnects,
+        "ops_per_second": round(latencies.count / elapsed, 2),
+        "latency_ms": {
+            "mean": ms(latencies.sum / latencies.count) if latencies.count else None,
+            "p50": ms(latencies.percentile(50)),
+            "p95": ms(latencies.percentile(95)),
+            "p99": ms(latencies.percentile(99)),
+        },
+    }
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+import collections
+import threading
+import time
+
+DEFAULT_MAXSIZE = 1024
+DEFAULT_TTL = 300
+
+
+class KeyCache:
+    """Size-bounded LRU cache for key metadata and public keys.
+
+    Entries are stored per host and key ID and expire after ttl seconds; if
+    ttl is None, they are only removed when the cache is full or when they
+    are invalidated.  A NetHSM instance that uses the cache invalidates the
+    entries of a key when it changes the key.  The cache is thread-safe and
+    can be shared by several NetHSM instances.
+
+    The cache is only available to library users.  nitropy nethsm runs a
+    single command per process, so a cache would never be reused there."""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, host, key_id, kind):
+        """Return the cached value or None if it is missing or expired."""
+        cache_key = (host, key_id, kind)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                (expires, value) = entry
+                if expires is None or time.monotonic() < expires:
+                    self._entries.move_to_end(cache_key)
+                    self.hits += 1
+                    return value
+                del self._entries[cache_key]
+            self.misses += 1
+            return None
+
+    def put(self, host, key_id, kind, value):
+        cache_key = (host, key_id, kind)
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[cache_key] = (expires, value)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, host, key_id=None):
+        """Remove the entries for a key or, if key_id is None, for a host."""
+        with self._lock:
+            for cache_key in list(self._entries):
+                if cache_key[0] == host and key_id in (None, cache_key[1]):
+                    del self._entries[cache_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""Client for several NetHSMs that share the same keys and users.
+
+The NetHSMs are expected to be restored from the same backup.  Read-only and
+crypto operations are sent to one of the healthy nodes; write operations are
+not supported as they would have to be applied to every node."""
+
+import contextlib
+import threading
+import time
+
+import urllib3.exceptions
+
+from . import DEFAULT_POOL_SIZE, NetHSM, NetHSMError
+
+# interval in seconds after which an unhealthy node is checked again
+HEALTH_CHECK_INTERVAL = 10
+# API errors that indicate that the request might succeed on another node
+FAILOVER_STATUS = {412, 500, 502, 503, 504}
+
+
+class _Node:
+    def __init__(self, nethsm):
+        self.nethsm = nethsm
+        self.outstanding = 0
+        self.healthy = True
+        self.checked = None
+
+
+def _balanced(name):
+    def method(self, *args, **kwargs):
+        return self.execute(lambda nethsm: getattr(nethsm, name)(*args, **kwargs))
+
+    method.__name__ = name
+    return method
+
+
+class NetHSMCluster:
+    """Spread requests across several NetHSMs.
+
+    Each request is sent to the healthy node with the least outstanding
+    requests.  If the node cannot be reached or is not operational, it is
+    marked as unhealthy and the request is retried on another node.
+    Unhealthy nodes are checked using the health/ready endpoint after
+    health_interval seconds and used again once they are ready."""
+
+    def __init__(
+        self,
+        hosts,
+        version,
+        username,
+        password,
+        verify_tls=True,
+        pool_size=DEFAULT_POOL_SIZE,
+        timeout=None,
+        health_interval=HEALTH_CHECK_INTERVAL,
+        key_cache=None,
+        stats=None,
+    ):
+        if not hosts:
+            raise ValueError("At least one host is required")
+        self.hosts = list(hosts)
+        self.host = ", ".join(self.hosts)
+        self.health_interval = health_interval
+        self.nodes = [
+            _Node(
+                NetHSM(
+                    host,
+                    version,
+                    username,
+                    password,
+                    verify_tls,
+                    pool_size,
+                    timeout,
+                    key_cache,
+                    stats,
+                )
+            )
+            for host in self.hosts
+        ]
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def close(self):
+        for node in self.nodes:
+            node.nethsm.close()
+
+    def check_health(self):
+        """Check all nodes and return the hosts that are ready."""
+        for node in self.nodes:
+            self._check(node)
+        return [node.nethsm.host for node in self.nodes if node.healthy]
+
+    def _check(self, node):
+        try:
+            healthy = node.nethsm.is_ready()
+        except urllib3.exceptions.HTTPError:
+            healthy = False
+        with self._lock:
+            node.healthy = healthy
+            node.checked = time.monotonic()
+        return healthy
+
+    def _acquire(self, tried):
+        now = time.monotonic()
+        with self._lock:
+            # rotate the nodes so that ties are broken round-robin
+            start = self._next
+            self._next = (self._next + 1) % len(self.nodes)
+            nodes = self.nodes[start:] + self.nodes[:start]
+
+            candidates = [
+                node
+                for node in nodes
+                if node not in tried
+                and (node.healthy or now - node.checked >= self.health_interval)
+            ]
+            if not candidates:
+                return None
+            node = min(
+                candidates, key=lambda node: (not node.healthy, node.outstanding)
+            )
+            node.outstanding += 1
+            return node
+
+    def _release(self, node):
+        with self._lock:
+            node.outstanding -= 1
+
+    def execute(self, func):
+        """Call func with the NetHSM instance of the least busy healthy node.
+
+        If the call fails because the node is unavailable, it is repeated on
+        the other nodes.  If all nodes fail, the last error is raised."""
+        tried = []
+        error = None
+        while True:
+            node = self._acquire(tried)
+            if node is None:
+                if error:
+                    raise error
+                raise NetHSMError(f"No NetHSM is available: {self.host}")
+            tried.append(node)
+
+            try:
+                if not node.healthy and not self._check(node):
+                    continue
+                return func(node.nethsm)
+            except NetHSMError as e:
+                if e.status not in FAILOVER_STATUS:
+                    raise
+                error = e
+            except urllib3.exceptions.HTTPError as e:
+                error = e
+            finally:
+                self._release(node)
+
+            with self._lock:
+                node.healthy = False
+                node.checked = time.monotonic()
+
+    list_users = _balanced("list_users")
+    get_user = _balanced("get_user")
+    list_operator_tags = _balanced("list_operator_tags")
+    list_keys = _balanced("list_keys")
+    get_key = _balanced("get_key")
+    get_key_public_key = _balanced("get_key_public_key")
+    get_key_certificate = _balanced("get_key_certificate")
+    get_random_data = _balanced("get_random_data")
+    encrypt = _balanced("encrypt")
+    decrypt = _balanced("decrypt")
+    sign = _balanced("sign")
+    verify = _balanced("verify")
+
+    # these methods only depend on the methods above and map_concurrent
+    map_concurrent = NetHSM.map_concurrent
+    get_users = NetHSM.get_users
+    get_keys = NetHSM.get_keys
+    get_random_bytes = NetHSM.get_random_bytes
+    sign_many = NetHSM.sign_many
+
+
+@contextlib.contextmanager
+def connect(
+    hosts,
+    version,
+    username,
+    password,
+    verify_tls=True,
+    pool_size=DEFAULT_POOL_SIZE,
+    timeout=None,
+    key_cache=None,
+    stats=None,
+    warm_up=0,
+    keepalive=None,
+):
+    """Create a NetHSMCluster and close it at the end of the context.
+
+    warm_up and keepalive are applied to every node, see
+    pynitrokey.nethsm.connect."""
+    cluster = NetHSMCluster(
+        hosts,
+        version,
+        username,
+        password,
+        verify_tls,
+        pool_size,
+        timeout,
+        key_cache=key_cache,
+        stats=stats,
+    )
+    try:
+        for node in cluster.nodes:
+            if warm_up:
+                node.nethsm.warm_up(warm_up)
+            if keepalive:
+                node.nethsm.start_keepalive(keepalive)
+        yield cluster
+    finally:
+        cluster.close()
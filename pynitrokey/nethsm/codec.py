@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""Lean JSON codec for the frequently used NetHSM crypto endpoints.
+
+The generated client validates every request and response with the schema
+classes from the client package, which is more expensive than the round trip
+to the NetHSM for small payloads.  This module builds and parses the bodies
+of the sign, encrypt, decrypt and random endpoints directly.  It applies the
+same checks as the API specification: invalid arguments raise TypeError or
+ValueError, malformed responses raise NetHSMError."""
+
+import json
+import re
+
+from . import RANDOM_CHUNK_SIZE, DecryptMode, EncryptMode, NetHSMError, SignMode
+
+# see Base64 in nethsm-api.yaml
+_BASE64_RE = re.compile(r"^[a-zA-Z0-9+/]+={0,3}$")
+
+_SIGN_MODES = frozenset(mode.value for mode in SignMode)
+_ENCRYPT_MODES = frozenset(mode.value for mode in EncryptMode)
+_DECRYPT_MODES = frozenset(mode.value for mode in DecryptMode)
+
+
+def _check_base64(name, value):
+    if not isinstance(value, str):
+        raise TypeError(f"{name} must be a str, not {type(value).__name__}")
+    if not _BASE64_RE.match(value):
+        raise ValueError(f"{name} must be Base64 encoded")
+    return value
+
+
+def _check_mode(name, value, modes):
+    if not isinstance(value, str):
+        raise TypeError(f"{name} must be a str, not {type(value).__name__}")
+    if value not in modes:
+        raise ValueError(f"Unsupported {name} {value}")
+    return value
+
+
+def _encode(body):
+    return json.dumps(body, separators=(",", ":")).encode("utf-8")
+
+
+def _decode(data, *fields):
+    try:
+        body = json.loads(data)
+    except ValueError as e:
+        raise NetHSMError(f"Invalid response from NetHSM: {e}")
+    if not isinstance(body, dict):
+        raise NetHSMError("Invalid response from NetHSM: expected a JSON object")
+
+    values = []
+    for field in fields:
+        value = body.get(field)
+        if not isinstance(value, str) or not _BASE64_RE.match(value):
+            raise NetHSMError(
+                f"Invalid response from NetHSM: {field} must be a Base64 string"
+            )
+        values.append(value)
+    return values
+
+
+def encode_sign_request(message, mode):
+    return _encode(
+        {
+            "mode": _check_mode("sign mode", mode, _SIGN_MODES),
+            "message": _check_base64("message", message),
+        }
+    )
+
+
+def decode_sign_response(data):
+    (signature,) = _decode(data, "signature")
+    return signature
+
+
+def encode_encrypt_request(message, mode, iv=None):
+    body = {
+        "mode": _check_mode("encrypt mode", mode, _ENCRYPT_MODES),
+        "message": _check_base64("message", message),
+    }
+    if iv is not None:
+        body["iv"] = _check_base64("iv", iv)
+    return _encode(body)
+
+
+def decode_encrypt_response(data):
+    (encrypted, iv) = _decode(data, "encrypted", "iv")
+    return (encrypted, iv)
+
+
+def encode_decrypt_request(encrypted, mode, iv=None):
+    body = {
+        "mode": _check_mode("decrypt mode", mode, _DECRYPT_MODES),
+        "encrypted": _check_base64("encrypted", encrypted),
+    }
+    if iv is not None:
+        body["iv"] = _check_base64("iv", iv)
+    return _encode(body)
+
+
+def decode_decrypt_response(data):
+    (decrypted,) = _decode(data, "decrypted")
+    return decrypted
+
+
+def encode_random_request(length):
+    if not isinstance(length, int) or isinstance(length, bool):
+        raise TypeError(f"length must be an int, not {type(length).__name__}")
+    if not 1 <= length <= RANDOM_CHUNK_SIZE:
+        raise ValueError(f"length must be between 1 and {RANDOM_CHUNK_SIZE}")
+    return _encode({"length": length})
+
+
+def decode_random_response(data):
+    (random,) = _decode(data, "random")
+    return random
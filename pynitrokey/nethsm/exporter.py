@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""OpenMetrics exporter for the metrics of one or more NetHSMs.
+
+The metrics are polled in the background and rendered into the OpenMetrics
+text format, so that serving a scrape never waits for a NetHSM."""
+
+import decimal
+import http.server
+import logging
+import random
+import re
+import threading
+import time
+
+import urllib3.exceptions
+
+from . import NetHSMError
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+DEFAULT_INTERVAL = 15
+DEFAULT_JITTER = 0.1
+PREFIX = "nethsm_"
+
+logger = logging.getLogger(__name__)
+
+
+def metric_name(name):
+    return PREFIX + re.sub(r"[^a-zA-Z0-9_]", "_", name).lower()
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    return ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels)
+
+
+def _is_number(value):
+    # the generated client returns numbers as Decimal instances
+    return isinstance(value, (int, float, decimal.Decimal)) and not isinstance(
+        value, bool
+    )
+
+
+class _Target:
+    def __init__(self, nethsm):
+        self.nethsm = nethsm
+        self.up = False
+        self.metrics = {}
+        self.duration = None
+
+
+class MetricsExporter:
+    """Poll the metrics of NetHSM instances and render them as OpenMetrics.
+
+    Every NetHSM is polled by its own thread every interval seconds; the
+    interval varies randomly by up to jitter times the interval so that
+    several exporters do not poll at the same time.  Numeric metrics are
+    exported as gauges, all other metrics as info metrics with the value as a
+    label.  Every sample has a host label.  The number of connections the
+    exporter had to establish again is exported as the counter
+    nethsm_client_reconnects."""
+
+    def __init__(self, nethsms, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER):
+        self.targets = [_Target(nethsm) for nethsm in nethsms]
+        self.interval = interval
+        self.jitter = jitter
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._text = self._render()
+
+    def poll(self, target):
+        start = time.monotonic()
+        try:
+            metrics = dict(target.nethsm.get_metrics())
+            up = True
+        except (NetHSMError, urllib3.exceptions.HTTPError) as e:
+            logger.info(f"Failed to poll the metrics of {target.nethsm.host}: {e}")
+            metrics = {}
+            up = False
+        except Exception:
+            # e. g. an invalid response or a TLS error; the polling thread
+            # must keep running so that the target is reported as down
+            logger.warning(
+                f"Failed to poll the metrics of {target.nethsm.host}", exc_info=True
+            )
+            metrics = {}
+            up = False
+        with self._lock:
+            target.up = up
+            target.metrics = metrics
+            target.duration = time.monotonic() - start
+            self._text = self._render()
+
+    def _run(self, target):
+        while not self._stop.is_set():
+            self.poll(target)
+            delay = self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+            self._stop.wait(delay)
+
+    def start(self):
+        for target in self.targets:
+            thread = threading.Thread(target=self._run, args=(target,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    def render(self):
+        with self._lock:
+            return self._text
+
+    def _render(self):
+        families = {}
+
+        def add(name, type, labels, value):
+            family = families.setdefault(name, (type, []))
+            family[1].append((labels, value))
+
+        for target in self.targets:
+            host = ("host", target.nethsm.host)
+            add(PREFIX + "up", "gauge", [host], int(target.up))
+            if target.duration is not None:
+                add(PREFIX + "poll_duration_seconds", "gauge", [host], target.duration)
+            reconnects = target.nethsm.reconnects
+            add(PREFIX + "client_reconnects", "counter", [host], reconnects)
+            for key, value in target.metrics.items():
+                name = metric_name(key)
+                if _is_number(value):
+                    add(name, "gauge", [host], value)
+                else:
+                    add(name, "info", [host, ("value", str(value))], 1)
+
+        lines = []
+        for name, (type, samples) in sorted(families.items()):
+            lines.append(f"# TYPE {name} {type}")
+            suffix = {"info": "_info", "counter": "_total"}.get(type, "")
+            for labels, value in samples:
+                lines.append(f"{name}{suffix}{{{_labels(labels)}}} {value}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, address):
+        """Create an HTTP server that serves the metrics on /metrics.
+
+        address is a (host, port) tuple.  The caller has to call
+        serve_forever on the returned server."""
+        exporter = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return http.server.ThreadingHTTPServer(address, Handler)
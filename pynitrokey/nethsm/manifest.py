@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""Declarative key provisioning for a NetHSM.
+
+A manifest is a YAML or JSON document with a list of keys:
+
+    keys:
+      - id: webserver
+        type: EC_P256
+        mechanisms: [ECDSA_Signature]
+        length: 256
+        tags: [web]
+        certificate: webserver.pem
+      - id: imported
+        mechanisms: [RSA_Signature_PKCS1]
+        private_key: imported.key
+
+Keys without private_key are generated on the NetHSM, keys with
+private_key are imported from an unencrypted PEM file; their type is derived
+from the private key.  Relative file names are resolved relative to the
+manifest.  Existing keys are not regenerated: only missing tags and a
+missing certificate are added."""
+
+import base64
+import mimetypes
+import os
+import re
+
+from . import KEY_CERTIFICATE_MIME_TYPES, KeyMechanism, KeyType, NetHSMError
+
+_FIELDS = {
+    "id",
+    "type",
+    "mechanisms",
+    "length",
+    "tags",
+    "certificate",
+    "certificate_mime_type",
+    "private_key",
+}
+
+
+class KeySpec:
+    def __init__(
+        self,
+        key_id,
+        type,
+        mechanisms,
+        length=None,
+        tags=[],
+        certificate=None,
+        certificate_mime_type=None,
+        private_key=None,
+    ):
+        self.key_id = key_id
+        self.type = type
+        self.mechanisms = mechanisms
+        self.length = length
+        self.tags = tags
+        self.certificate = certificate
+        self.certificate_mime_type = certificate_mime_type
+        self.private_key = private_key
+
+
+class KeyResult:
+    def __init__(self, key_id):
+        self.key_id = key_id
+        self.actions = []
+        self.error = None
+
+    @property
+    def status(self):
+        if self.error:
+            return "failed"
+        return "changed" if self.actions else "unchanged"
+
+
+def _b64_int(n):
+    return base64.b64encode(n.to_bytes((n.bit_length() + 7) // 8, "big")).decode()
+
+
+def _read_private_key(path):
+    """Return the key type and the arguments for NetHSM.add_key for a PEM
+    private key."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+    with open(path, "rb") as f:
+        private_key = serialization.load_pem_private_key(f.read(), password=None)
+
+    args = dict(prime_p=None, prime_q=None, public_exponent=None, data=None)
+    if isinstance(private_key, rsa.RSAPrivateKey):
+        numbers = private_key.private_numbers()
+        args["prime_p"] = _b64_int(numbers.p)
+        args["prime_q"] = _b64_int(numbers.q)
+        args["public_exponent"] = _b64_int(numbers.public_numbers.e)
+        return (KeyType.RSA, args)
+    elif isinstance(private_key, ec.EllipticCurvePrivateKey):
+        types = {
+            "secp224r1": KeyType.EC_P224,
+            "secp256r1": KeyType.EC_P256,
+            "secp384r1": KeyType.EC_P384,
+            "secp521r1": KeyType.EC_P521,
+        }
+        curve = private_key.curve
+        if curve.name not in types:
+            raise ValueError(f"Unsupported curve {curve.name} in {path}")
+        size = (curve.key_size + 7) // 8
+        value = private_key.private_numbers().private_value.to_bytes(size, "big")
+        args["data"] = base64.b64encode(value).decode()
+        return (types[curve.name], args)
+    elif isinstance(private_key, ed25519.Ed25519PrivateKey):
+        value = private_key.private_bytes(
+            serialization.Encoding.Raw,
+            serialization.PrivateFormat.Raw,
+            serialization.NoEncryption(),
+        )
+        args["data"] = base64.b64encode(value).decode()
+        return (KeyType.CURVE25519, args)
+    else:
+        raise ValueError(f"Unsupported private key type in {path}")
+
+
+def _parse_key(entry, base_dir):
+    if not isinstance(entry, dict):
+        raise ValueError("Every key must be a mapping")
+    key_id = entry.get("id")
+    # the pattern of the ID type of the NetHSM API; str.isalnum would also
+    # accept non-ASCII letters and digits
+    if not isinstance(key_id, str) or not re.fullmatch(r"[a-zA-Z0-9]+", key_id):
+        raise ValueError(f"Missing or invalid key ID: {key_id!r}")
+    unknown = set(entry) - _FIELDS
+    if unknown:
+        raise ValueError(f"Unknown fields for key {key_id}: {', '.join(unknown)}")
+
+    def path(name):
+        value = entry.get(name)
+        return os.path.join(base_dir, value) if value else None
+
+    try:
+        type = KeyType(entry["type"]) if "type" in entry else None
+        mechanisms = [KeyMechanism(m) for m in entry.get("mechanisms", [])]
+    except ValueError as e:
+        raise ValueError(f"Invalid key {key_id}: {e}")
+    if not mechanisms:
+        raise ValueError(f"Missing mechanisms for key {key_id}")
+
+    private_key = path("private_key")
+    if private_key:
+        if "length" in entry:
+            raise ValueError(f"length must not be set for imported key {key_id}")
+    else:
+        if not type:
+            raise ValueError(f"Missing type for key {key_id}")
+        if not isinstance(entry.get("length"), int):
+            raise ValueError(f"Missing or invalid length for key {key_id}")
+
+    certificate = path("certificate")
+    mime_type = entry.get("certificate_mime_type")
+    if certificate and not mime_type:
+        (mime_type, _) = mimetypes.guess_type(certificate)
+    if certificate and mime_type not in KEY_CERTIFICATE_MIME_TYPES:
+        raise ValueError(
+            f"Unsupported or unknown certificate MIME type for key {key_id}: "
+            f"{mime_type}"
+        )
+
+    return KeySpec(
+        key_id=key_id,
+        type=type,
+        mechanisms=mechanisms,
+        length=entry.get("length"),
+        tags=[str(tag) for tag in entry.get("tags", [])],
+        certificate=certificate,
+        certificate_mime_type=mime_type,
+        private_key=private_key,
+    )
+
+
+def load_manifest(path):
+    """Read a manifest file and return a list of KeySpec instances.
+
+    Raises a ValueError if the manifest is invalid."""
+    with open(path) as f:
+        if path.endswith(".json"):
+            import json
+
+            data = json.load(f)
+        else:
+            from ruamel.yaml import YAML, YAMLError
+
+            try:
+                data = YAML(typ="safe").load(f)
+            except YAMLError as e:
+                raise ValueError(f"Invalid YAML: {e}")
+
+    if not isinstance(data, dict) or not isinstance(data.get("keys"), list):
+        raise ValueError("The manifest must contain a list of keys")
+    base_dir = os.path.dirname(os.path.abspath(path))
+    specs = [_parse_key(entry, base_dir) for entry in data["keys"]]
+
+    key_ids = [spec.key_id for spec in specs]
+    duplicates = {key_id for key_id in key_ids if key_ids.count(key_id) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate key IDs: {', '.join(sorted(duplicates))}")
+    return specs
+
+
+def _has_certificate(nethsm, key_id):
+    try:
+        nethsm.get_key_certificate(key_id)
+        return True
+    except NetHSMError as e:
+        if e.status == 404:
+            return False
+        raise
+
+
+def _apply(nethsm, spec, exists, dry_run):
+    result = KeyResult(spec.key_id)
+    try:
+        if exists:
+            key = nethsm.get_key(spec.key_id)
+            if spec.type and str(key.type) != spec.type.value:
+                raise ValueError(
+                    f"Existing key has type {key.type} instead of {spec.type.value}"
+                )
+            missing = {m.value for m in spec.mechanisms} - {
+                str(m) for m in key.mechanisms
+            }
+            if missing:
+                raise ValueError(
+                    f"Existing key lacks the mechanisms {', '.join(sorted(missing))}"
+                )
+            present_tags = {str(tag) for tag in key.tags or []}
+            has_certificate = spec.certificate and _has_certificate(nethsm, spec.key_id)
+        elif spec.private_key:
+            (type, args) = _read_private_key(spec.private_key)
+            if spec.type and spec.type != type:
+                raise ValueError(
+                    f"The private key has type {type.value} instead of "
+                    f"{spec.type.value}"
+                )
+            if not dry_run:
+                nethsm.add_key(
+                    key_id=spec.key_id,
+                    type=type.value,
+                    mechanisms=[m.value for m in spec.mechanisms],
+                    tags=spec.tags,
+                    **args,
+                )
+            result.actions.append("imported")
+            present_tags = set(spec.tags)
+            has_certificate = False
+        else:
+            if not dry_run:
+                nethsm.generate_key(
+                    spec.type.value,
+                    [m.value for m in spec.mechanisms],
+                    spec.length,
+                    spec.key_id,
+                )
+            result.actions.append("generated")
+            present_tags = set()
+            has_certificate = False
+
+        for tag in spec.tags:
+            if tag not in present_tags:
+                if not dry_run:
+                    nethsm.add_key_tag(spec.key_id, tag)
+                result.actions.append(f"tag {tag} added")
+
+        if spec.certificate and not has_certificate:
+            if not dry_run:
+                with open(spec.certificate, "rb") as f:
+                    nethsm.set_key_certificate(
+                        spec.key_id, f, spec.certificate_mime_type
+                    )
+            result.actions.append("certificate set")
+    except (NetHSMError, OSError, ValueError) as e:
+        result.error = str(e)
+    return result
+
+
+def apply_manifest(nethsm, specs, workers=1, dry_run=False):
+    """Create the keys of a manifest that do not exist yet and add missing
+    tags and certificates.
+
+    The keys are processed with at most workers requests in flight.  Errors
+    are reported per key instead of aborting the other keys.  If dry_run is
+    set, the changes are determined but not applied.  Returns a list of
+    KeyResult instances in the order of the specs."""
+    existing = set(nethsm.list_keys(None))
+    return nethsm.map_concurrent(
+        lambda spec: _apply(nethsm, spec, spec.key_id in existing, dry_run),
+        specs,
+        workers=workers,
+    )
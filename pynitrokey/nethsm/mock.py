@@ -0,0 +1,893 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""Mock NetHSM server for tests and benchmarks without hardware.
+
+The server implements the users, keys, crypto, metrics, backup and restore
+endpoints of the NetHSM API with software keys.  The routes are taken from
+the client generated from nethsm-api.yaml; endpoints of the API that are not
+implemented return 501 Not Implemented.  The server is always provisioned
+and unlocked and has the users from DEFAULT_USERS.
+
+Latency and errors can be injected to test and benchmark the client-side
+connection handling, batching and failover:
+
+    with serve(latency=0.01, error_rate=0.05) as server:
+        with pynitrokey.nethsm.connect(
+            server.host, "v1", "operator", "operatorPassphrase", verify_tls=False
+        ) as nethsm:
+            ...
+
+The server can also be started as a separate process:
+
+    python -m pynitrokey.nethsm.mock --port 8443"""
+
+import base64
+import contextlib
+import datetime
+import http.server
+import json
+import os
+import random
+import re
+import ssl
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, urlparse
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from . import KeyType, Role, State
+from .client.paths import PathValues
+
+VERSION = "v1"
+DEFAULT_USERS = {
+    "admin": (Role.ADMINISTRATOR, "adminPassphrase"),
+    "operator": (Role.OPERATOR, "operatorPassphrase"),
+    "metrics": (Role.METRICS, "metricsPassphrase"),
+    "backup": (Role.BACKUP, "backupPassphrase"),
+}
+DEFAULT_ERROR_STATUS = 503
+
+_HASHES = {
+    "MD5": hashes.MD5,
+    "SHA1": hashes.SHA1,
+    "SHA224": hashes.SHA224,
+    "SHA256": hashes.SHA256,
+    "SHA384": hashes.SHA384,
+    "SHA512": hashes.SHA512,
+}
+_ECDSA_HASHES = {
+    algorithm.digest_size: algorithm
+    for algorithm in [
+        hashes.SHA1,
+        hashes.SHA224,
+        hashes.SHA256,
+        hashes.SHA384,
+        hashes.SHA512,
+    ]
+}
+_CURVES = {
+    KeyType.EC_P224: ec.SECP224R1,
+    KeyType.EC_P256: ec.SECP256R1,
+    KeyType.EC_P384: ec.SECP384R1,
+    KeyType.EC_P521: ec.SECP521R1,
+}
+
+
+class MockError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode()
+
+
+def _b64decode(data):
+    try:
+        return base64.b64decode(data, validate=True)
+    except (TypeError, ValueError):
+        raise MockError(400, "Invalid base64 data")
+
+
+def _int_to_b64(n):
+    return _b64encode(n.to_bytes((n.bit_length() + 7) // 8, "big"))
+
+
+def _b64_to_int(data):
+    return int.from_bytes(_b64decode(data), "big")
+
+
+def _rsa_private_key(p, q, e):
+    d = pow(e, -1, (p - 1) * (q - 1))
+    numbers = rsa.RSAPrivateNumbers(
+        p=p,
+        q=q,
+        d=d,
+        dmp1=rsa.rsa_crt_dmp1(d, p),
+        dmq1=rsa.rsa_crt_dmq1(d, q),
+        iqmp=rsa.rsa_crt_iqmp(p, q),
+        public_numbers=rsa.RSAPublicNumbers(e, p * q),
+    )
+    return numbers.private_key()
+
+
+class MockKey:
+    """A key stored on the mock NetHSM.
+
+    private is a cryptography private key object or, for generic keys, the
+    raw key as bytes."""
+
+    def __init__(self, type, mechanisms, private, tags=[]):
+        self.type = type
+        self.mechanisms = list(mechanisms)
+        self.private = private
+        self.tags = list(tags)
+        self.certificate = None
+        self.operations = 0
+
+    @staticmethod
+    def generate(type, mechanisms, length, tags=[]):
+        if type == KeyType.RSA:
+            private = rsa.generate_private_key(65537, length or 2048)
+        elif type in _CURVES:
+            private = ec.generate_private_key(_CURVES[type]())
+        elif type == KeyType.CURVE25519:
+            private = ed25519.Ed25519PrivateKey.generate()
+        else:
+            if length not in (128, 192, 256):
+                raise MockError(400, "Invalid length for generic key")
+            private = os.urandom(length // 8)
+        return MockKey(type, mechanisms, private, tags)
+
+    @staticmethod
+    def from_private_data(type, mechanisms, data, tags=[]):
+        try:
+            if type == KeyType.RSA:
+                private = _rsa_private_key(
+                    _b64_to_int(data["primeP"]),
+                    _b64_to_int(data["primeQ"]),
+                    _b64_to_int(data["publicExponent"]),
+                )
+            elif type in _CURVES:
+                private = ec.derive_private_key(
+                    _b64_to_int(data["data"]), _CURVES[type]()
+                )
+            elif type == KeyType.CURVE25519:
+                private = ed25519.Ed25519PrivateKey.from_private_bytes(
+                    _b64decode(data["data"])
+                )
+            else:
+                private = _b64decode(data["data"])
+        except (KeyError, ValueError) as e:
+            raise MockError(400, f"Invalid key data: {e}")
+        return MockKey(type, mechanisms, private, tags)
+
+    def public_data(self):
+        if self.type == KeyType.RSA:
+            numbers = self.private.public_key().public_numbers()
+            return {
+                "modulus": _int_to_b64(numbers.n),
+                "publicExponent": _int_to_b64(numbers.e),
+            }
+        elif self.type == KeyType.GENERIC:
+            return {}
+        elif self.type == KeyType.CURVE25519:
+            encoding = serialization.Encoding.Raw
+            format = serialization.PublicFormat.Raw
+        else:
+            encoding = serialization.Encoding.X962
+            format = serialization.PublicFormat.UncompressedPoint
+        data = self.private.public_key().public_bytes(encoding, format)
+        return {"data": _b64encode(data)}
+
+    def public_pem(self):
+        if self.type == KeyType.GENERIC:
+            raise MockError(400, "Generic keys do not have a public key")
+        return self.private.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+
+    def private_pem(self):
+        if self.type == KeyType.GENERIC:
+            return _b64encode(self.private)
+        return self.private.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ).decode()
+
+    @staticmethod
+    def from_private_pem(type, mechanisms, pem, tags):
+        if type == KeyType.GENERIC:
+            private = base64.b64decode(pem)
+        else:
+            private = serialization.load_pem_private_key(pem.encode(), password=None)
+        return MockKey(type, mechanisms, private, tags)
+
+    def _check_mechanism(self, mechanism):
+        if mechanism not in self.mechanisms:
+            raise MockError(400, f"Key does not support the mechanism {mechanism}")
+        self.operations += 1
+
+    def sign(self, mode, message):
+        if mode == "EdDSA":
+            self._check_mechanism("EdDSA_Signature")
+            return self.private.sign(message)
+        elif mode == "ECDSA":
+            self._check_mechanism("ECDSA_Signature")
+            if len(message) not in _ECDSA_HASHES:
+                raise MockError(400, "Invalid hash length for ECDSA")
+            algorithm = _ECDSA_HASHES[len(message)]()
+            return self.private.sign(message, ec.ECDSA(Prehashed(algorithm)))
+        elif mode == "PKCS1":
+            self._check_mechanism("RSA_Signature_PKCS1")
+            # PKCS #1 v1.5 signature of the message as is, i. e. without
+            # adding a DigestInfo structure
+            numbers = self.private.private_numbers()
+            size = (numbers.public_numbers.n.bit_length() + 7) // 8
+            if len(message) > size - 11:
+                raise MockError(400, "Message too long")
+            padded = b"\x00\x01" + b"\xff" * (size - 3 - len(message)) + b"\x00"
+            m = int.from_bytes(padded + message, "big")
+            s = pow(m, numbers.d, numbers.public_numbers.n)
+            return s.to_bytes(size, "big")
+        elif mode.startswith("PSS_") and mode[4:] in _HASHES:
+            self._check_mechanism(f"RSA_Signature_{mode}")
+            algorithm = _HASHES[mode[4:]]()
+            if len(message) != algorithm.digest_size:
+                raise MockError(400, "Invalid hash length")
+            return self.private.sign(
+                message,
+                padding.PSS(
+                    mgf=padding.MGF1(algorithm), salt_length=padding.PSS.DIGEST_LENGTH
+                ),
+                Prehashed(algorithm),
+            )
+        raise MockError(400, f"Invalid sign mode {mode}")
+
+    def decrypt(self, mode, encrypted, iv):
+        if mode == "AES_CBC":
+            self._check_mechanism("AES_Decryption_CBC")
+            return self._aes_cbc(encrypted, iv, decrypt=True)
+        elif mode == "RAW":
+            self._check_mechanism("RSA_Decryption_RAW")
+            numbers = self.private.private_numbers()
+            size = (numbers.public_numbers.n.bit_length() + 7) // 8
+            m = pow(
+                int.from_bytes(encrypted, "big"), numbers.d, numbers.public_numbers.n
+            )
+            return m.to_bytes(size, "big")
+        elif mode == "PKCS1":
+            self._check_mechanism("RSA_Decryption_PKCS1")
+            pad = padding.PKCS1v15()
+        elif mode.startswith("OAEP_") and mode[5:] in _HASHES:
+            self._check_mechanism(f"RSA_Decryption_{mode}")
+            algorithm = _HASHES[mode[5:]]()
+            pad = padding.OAEP(
+                mgf=padding.MGF1(algorithm), algorithm=algorithm, label=None
+            )
+        else:
+            raise MockError(400, f"Invalid decrypt mode {mode}")
+        try:
+            return self.private.decrypt(encrypted, pad)
+        except ValueError:
+            raise MockError(400, "Decryption failed")
+
+    def encrypt(self, mode, message, iv):
+        if mode != "AES_CBC":
+            raise MockError(400, f"Invalid encrypt mode {mode}")
+        self._check_mechanism("AES_Encryption_CBC")
+        iv = iv or os.urandom(16)
+        return (self._aes_cbc(message, iv, decrypt=False), iv)
+
+    def _aes_cbc(self, data, iv, decrypt):
+        if not iv or len(iv) != 16:
+            raise MockError(400, "Invalid IV")
+        if len(data) % 16:
+            raise MockError(400, "The data length must be a multiple of 16")
+        cipher = Cipher(algorithms.AES(self.private), modes.CBC(iv))
+        context = cipher.decryptor() if decrypt else cipher.encryptor()
+        return context.update(data) + context.finalize()
+
+
+class MockUser:
+    def __init__(self, real_name, role, passphrase):
+        self.real_name = real_name
+        self.role = role
+        self.passphrase = passphrase
+        self.tags = []
+
+
+class _Request:
+    def __init__(self, params, query, headers, body):
+        self.params = params
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+
+_ROUTES = {}
+
+
+def _route(method, path, roles=None, concurrent=False):
+    """Register a handler for an API endpoint.
+
+    If roles is None, the endpoint does not require authentication.  Handlers
+    are executed with the lock of the MockNetHSM held unless concurrent is
+    set; concurrent handlers must not modify the users or keys."""
+
+    def decorator(func):
+        _ROUTES[(method, path)] = (roles, func, concurrent)
+        return func
+
+    return decorator
+
+
+def _pattern(path):
+    return re.compile(
+        "^" + re.sub(r"\\\{(\w+)\\\}", r"(?P<\1>[^/]+)", re.escape(path)) + "$"
+    )
+
+
+_PATTERNS = [(path, _pattern(path.value)) for path in PathValues]
+
+_ADMIN = [Role.ADMINISTRATOR]
+_OPERATOR = [Role.OPERATOR]
+_ADMIN_OPERATOR = [Role.ADMINISTRATOR, Role.OPERATOR]
+
+
+class MockNetHSM:
+    """State and request handling of a mock NetHSM.
+
+    Every request is delayed by latency seconds plus a random value of up to
+    jitter seconds.  With the probability error_rate, a request fails with
+    the HTTP status error_status.  The instance is thread-safe."""
+
+    def __init__(
+        self,
+        users=DEFAULT_USERS,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        error_status=DEFAULT_ERROR_STATUS,
+        seed=None,
+    ):
+        self.users = {
+            user_id: MockUser(user_id, role, passphrase)
+            for user_id, (role, passphrase) in users.items()
+        }
+        self.keys = {}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+        self.started = time.monotonic()
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+
+    def handle(self, method, url, headers, body):
+        """Handle an API request and return a (status, content type, body)
+        tuple."""
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+
+        try:
+            if fail:
+                raise MockError(self.error_status, "Injected error")
+            (roles, func, concurrent, params) = self._resolve(method, url)
+            if roles is not None:
+                self._authenticate(headers.get("Authorization"), roles)
+            query = {
+                key: values[0] for key, values in parse_qs(urlparse(url).query).items()
+            }
+            request = _Request(params, query, headers, body)
+            if concurrent:
+                result = func(self, request)
+            else:
+                with self._lock:
+                    result = func(self, request)
+        except MockError as e:
+            with self._lock:
+                self.errors += 1
+            data = json.dumps({"message": str(e)}).encode()
+            return (e.status, "application/json", data)
+
+        if result is None:
+            return (204, None, b"")
+        elif isinstance(result, tuple):
+            return result
+        return (200, "application/json", json.dumps(result).encode())
+
+    def _resolve(self, method, url):
+        prefix = f"/api/{VERSION}"
+        path = urlparse(url).path
+        if not path.startswith(prefix + "/"):
+            raise MockError(404, "Not found")
+        path = path[len(prefix) :]
+        for path_value, pattern in _PATTERNS:
+            match = pattern.match(path)
+            if match:
+                if (method, path_value) not in _ROUTES:
+                    raise MockError(501, f"{method} {path_value.value} not implemented")
+                return _ROUTES[(method, path_value)] + (match.groupdict(),)
+        raise MockError(404, "Not found")
+
+    def _authenticate(self, authorization, roles):
+        try:
+            (scheme, credentials) = authorization.split(" ", 1)
+            if scheme != "Basic":
+                raise ValueError()
+            (user_id, passphrase) = base64.b64decode(credentials).decode().split(":", 1)
+        except (AttributeError, ValueError):
+            raise MockError(401, "Authentication required")
+        with self._lock:
+            user = self.users.get(user_id)
+        if not user or user.passphrase != passphrase:
+            raise MockError(401, "Invalid credentials")
+        if user.role not in roles:
+            raise MockError(403, "Access denied")
+
+    def _json(self, body, *required):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise MockError(400, "Invalid JSON")
+        if not isinstance(data, dict) or any(key not in data for key in required):
+            raise MockError(400, f"Missing fields, required: {', '.join(required)}")
+        return data
+
+    def _key(self, key_id):
+        if key_id not in self.keys:
+            raise MockError(404, f"Key {key_id} not found")
+        return self.keys[key_id]
+
+    def _user(self, user_id):
+        if user_id not in self.users:
+            raise MockError(404, f"User {user_id} not found")
+        return self.users[user_id]
+
+    def _new_key_id(self):
+        return uuid.uuid4().hex[:20]
+
+    def _key_spec(self, data):
+        try:
+            type = KeyType(data["type"])
+        except ValueError:
+            raise MockError(400, f"Invalid key type {data['type']}")
+        tags = data.get("restrictions", {}).get("tags", [])
+        return (type, data["mechanisms"], tags)
+
+    @_route("GET", PathValues.INFO)
+    def _info(self, request):
+        return {"vendor": "Nitrokey GmbH", "product": "NetHSM (mock)"}
+
+    @_route("GET", PathValues.HEALTH_ALIVE)
+    @_route("GET", PathValues.HEALTH_READY)
+    def _health(self, request):
+        return None
+
+    @_route("GET", PathValues.HEALTH_STATE)
+    def _state(self, request):
+        return {"state": State.OPERATIONAL.value}
+
+    @_route("GET", PathValues.METRICS, [Role.METRICS])
+    def _metrics(self, request):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "keys": len(self.keys),
+            "users": len(self.users),
+            "uptime": int(time.monotonic() - self.started),
+        }
+
+    @_route("POST", PathValues.RANDOM, _OPERATOR, concurrent=True)
+    def _random_data(self, request):
+        length = self._json(request.body, "length")["length"]
+        if not isinstance(length, int) or not 1 <= length <= 1024:
+            raise MockError(400, "Invalid length")
+        return {"random": _b64encode(os.urandom(length))}
+
+    @_route("GET", PathValues.KEYS, _ADMIN_OPERATOR)
+    def _list_keys(self, request):
+        tags = (
+            set(request.query["filter"].split(","))
+            if request.query.get("filter")
+            else set()
+        )
+        return [
+            {"key": key_id}
+            for key_id, key in sorted(self.keys.items())
+            if tags.issubset(key.tags)
+        ]
+
+    @_route("POST", PathValues.KEYS_GENERATE, _ADMIN)
+    def _generate_key(self, request):
+        data = self._json(request.body, "type", "mechanisms")
+        key_id = data.get("id") or self._new_key_id()
+        if key_id in self.keys:
+            raise MockError(400, f"Key {key_id} already exists")
+        (type, mechanisms, tags) = self._key_spec(data)
+        self.keys[key_id] = MockKey.generate(type, mechanisms, data.get("length"), tags)
+        return self._created(f"keys/{key_id}")
+
+    @_route("POST", PathValues.KEYS, _ADMIN)
+    def _add_key(self, request):
+        request.params["KeyID"] = self._new_key_id()
+        return self._put_key(request)
+
+    @_route("PUT", PathValues.KEYS_KEY_ID, _ADMIN)
+    def _put_key(self, request):
+        key_id = request.params["KeyID"]
+        if key_id in self.keys:
+            raise MockError(409, f"Key {key_id} already exists")
+        data = self._json(request.body, "type", "mechanisms", "key")
+        (type, mechanisms, tags) = self._key_spec(data)
+        self.keys[key_id] = MockKey.from_private_data(
+            type, mechanisms, data["key"], tags
+        )
+        return self._created(f"keys/{key_id}")
+
+    @_route("GET", PathValues.KEYS_KEY_ID, _ADMIN_OPERATOR, concurrent=True)
+    def _get_key(self, request):
+        key = self._key(request.params["KeyID"])
+        restrictions = {"tags": key.tags} if key.tags else {}
+        return {
+            "mechanisms": key.mechanisms,
+            "type": key.type.value,
+            "restrictions": restrictions,
+            "key": key.public_data(),
+            "operations": key.operations,
+        }
+
+    @_route("DELETE", PathValues.KEYS_KEY_ID, _ADMIN)
+    def _delete_key(self, request):
+        self._key(request.params["KeyID"])
+        del self.keys[request.params["KeyID"]]
+
+    @_route("GET", PathValues.KEYS_KEY_ID_PUBLIC_PEM, _ADMIN_OPERATOR, concurrent=True)
+    def _get_public_key(self, request):
+        pem = self._key(request.params["KeyID"]).public_pem()
+        return (200, "application/x-pem-file", pem)
+
+    @_route("POST", PathValues.KEYS_KEY_ID_SIGN, _OPERATOR, concurrent=True)
+    def _sign(self, request):
+        key = self._key(request.params["KeyID"])
+        data = self._json(request.body, "mode", "message")
+        signature = key.sign(data["mode"], _b64decode(data["message"]))
+        return {"signature": _b64encode(signature)}
+
+    @_route("POST", PathValues.KEYS_KEY_ID_DECRYPT, _OPERATOR, concurrent=True)
+    def _decrypt(self, request):
+        key = self._key(request.params["KeyID"])
+        data = self._json(request.body, "mode", "encrypted")
+        iv = _b64decode(data["iv"]) if data.get("iv") else None
+        decrypted = key.decrypt(data["mode"], _b64decode(data["encrypted"]), iv)
+        return {"decrypted": _b64encode(decrypted)}
+
+    @_route("POST", PathValues.KEYS_KEY_ID_ENCRYPT, _OPERATOR, concurrent=True)
+    def _encrypt(self, request):
+        key = self._key(request.params["KeyID"])
+        data = self._json(request.body, "mode", "message")
+        iv = _b64decode(data["iv"]) if data.get("iv") else None
+        (encrypted, iv) = key.encrypt(data["mode"], _b64decode(data["message"]), iv)
+        return {"encrypted": _b64encode(encrypted), "iv": _b64encode(iv)}
+
+    @_route("GET", PathValues.KEYS_KEY_ID_CERT, _ADMIN_OPERATOR)
+    def _get_key_certificate(self, request):
+        key = self._key(request.params["KeyID"])
+        if not key.certificate:
+            raise MockError(404, "Certificate not found")
+        (mime_type, data) = key.certificate
+        return (200, mime_type, data)
+
+    @_route("PUT", PathValues.KEYS_KEY_ID_CERT, _ADMIN)
+    def _set_key_certificate(self, request):
+        key = self._key(request.params["KeyID"])
+        if key.certificate:
+            raise MockError(409, "Certificate already exists")
+        key.certificate = (request.headers.get("Content-Type"), request.body)
+        return (201, None, b"")
+
+    @_route("DELETE", PathValues.KEYS_KEY_ID_CERT, _ADMIN)
+    def _delete_key_certificate(self, request):
+        key = self._key(request.params["KeyID"])
+        if not key.certificate:
+            raise MockError(404, "Certificate not found")
+        key.certificate = None
+
+    @_route("PUT", PathValues.KEYS_KEY_ID_RESTRICTIONS_TAGS_TAG, _ADMIN)
+    def _add_key_tag(self, request):
+        key = self._key(request.params["KeyID"])
+        if request.params["Tag"] in key.tags:
+            return (304, None, b"")
+        key.tags.append(request.params["Tag"])
+
+    @_route("DELETE", PathValues.KEYS_KEY_ID_RESTRICTIONS_TAGS_TAG, _ADMIN)
+    def _delete_key_tag(self, request):
+        key = self._key(request.params["KeyID"])
+        if request.params["Tag"] not in key.tags:
+            raise MockError(404, f"Tag {request.params['Tag']} not found")
+        key.tags.remove(request.params["Tag"])
+
+    @_route("GET", PathValues.USERS, _ADMIN)
+    def _list_users(self, request):
+        return [{"user": user_id} for user_id in sorted(self.users)]
+
+    @_route("POST", PathValues.USERS, _ADMIN)
+    def _add_user(self, request):
+        request.params["UserID"] = self._new_key_id()
+        return self._put_user(request)
+
+    @_route("PUT", PathValues.USERS_USER_ID, _ADMIN)
+    def _put_user(self, request):
+        user_id = request.params["UserID"]
+        if user_id in self.users:
+            raise MockError(409, f"User {user_id} already exists")
+        data = self._json(request.body, "realName", "role", "passphrase")
+        try:
+            role = Role(data["role"])
+        except ValueError:
+            raise MockError(400, f"Invalid role {data['role']}")
+        if len(data["passphrase"]) < 10:
+            raise MockError(400, "Passphrase too short")
+        self.users[user_id] = MockUser(data["realName"], role, data["passphrase"])
+        return self._created(f"users/{user_id}")
+
+    @_route("GET", PathValues.USERS_USER_ID, _ADMIN_OPERATOR)
+    def _get_user(self, request):
+        user = self._user(request.params["UserID"])
+        return {"realName": user.real_name, "role": user.role.value}
+
+    @_route("DELETE", PathValues.USERS_USER_ID, _ADMIN)
+    def _delete_user(self, request):
+        self._user(request.params["UserID"])
+        del self.users[request.params["UserID"]]
+
+    @_route("POST", PathValues.USERS_USER_ID_PASSPHRASE, _ADMIN_OPERATOR)
+    def _set_passphrase(self, request):
+        user = self._user(request.params["UserID"])
+        passphrase = self._json(request.body, "passphrase")["passphrase"]
+        if len(passphrase) < 10:
+            raise MockError(400, "Passphrase too short")
+        user.passphrase = passphrase
+
+    @_route("GET", PathValues.USERS_USER_ID_TAGS, _ADMIN)
+    def _list_user_tags(self, request):
+        return self._user(request.params["UserID"]).tags
+
+    @_route("PUT", PathValues.USERS_USER_ID_TAGS_TAG, _ADMIN)
+    def _add_user_tag(self, request):
+        user = self._user(request.params["UserID"])
+        if request.params["Tag"] in user.tags:
+            return (304, None, b"")
+        user.tags.append(request.params["Tag"])
+
+    @_route("DELETE", PathValues.USERS_USER_ID_TAGS_TAG, _ADMIN)
+    def _delete_user_tag(self, request):
+        user = self._user(request.params["UserID"])
+        if request.params["Tag"] not in user.tags:
+            raise MockError(404, f"Tag {request.params['Tag']} not found")
+        user.tags.remove(request.params["Tag"])
+
+    @_route("POST", PathValues.SYSTEM_BACKUP, [Role.BACKUP])
+    def _backup(self, request):
+        # the backup of the mock is not encrypted
+        data = {
+            "users": {
+                user_id: [user.real_name, user.role.value, user.passphrase, user.tags]
+                for user_id, user in self.users.items()
+            },
+            "keys": {
+                key_id: [key.type.value, key.mechanisms, key.private_pem(), key.tags]
+                for key_id, key in self.keys.items()
+            },
+        }
+        return (200, "application/octet-stream", json.dumps(data).encode())
+
+    @_route("POST", PathValues.SYSTEM_RESTORE)
+    def _restore(self, request):
+        try:
+            data = json.loads(request.body)
+            users = {}
+            for user_id, (real_name, role, passphrase, tags) in data["users"].items():
+                users[user_id] = MockUser(real_name, Role(role), passphrase)
+                users[user_id].tags = tags
+            keys = {
+                key_id: MockKey.from_private_pem(KeyType(type), mechanisms, pem, tags)
+                for key_id, (type, mechanisms, pem, tags) in data["keys"].items()
+            }
+        except (KeyError, TypeError, ValueError):
+            raise MockError(400, "Invalid backup")
+        self.users = users
+        self.keys = keys
+
+    def _created(self, path):
+        headers = {"Location": f"/api/{VERSION}/{path}"}
+        return (201, None, b"", headers)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # the headers and the body are written separately, so with Nagle's
+    # algorithm, every response would be delayed by the delayed ACK timeout
+    disable_nagle_algorithm = True
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    # skip trailers
+                    while self.rfile.readline().strip():
+                        pass
+                    return b"".join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length)
+
+    def _handle(self):
+        body = self._read_body()
+        result = self.server.nethsm.handle(self.command, self.path, self.headers, body)
+        (status, mime_type, data) = result[:3]
+        headers = result[3] if len(result) > 3 else {}
+        self.send_response(status)
+        if mime_type:
+            self.send_header("Content-Type", mime_type)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _self_signed_certificate(directory):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(x509.NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.utcnow()
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=365))
+        .sign(key, hashes.SHA256())
+    )
+    cert_file = os.path.join(directory, "cert.pem")
+    key_file = os.path.join(directory, "key.pem")
+    with open(cert_file, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_file, "wb") as f:
+        f.write(
+            key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            )
+        )
+    return (cert_file, key_file)
+
+
+class MockServer(http.server.ThreadingHTTPServer):
+    """HTTPS server for a MockNetHSM with a self-signed certificate.
+
+    Port 0 selects a free port; the address of the server is available as
+    host, e. g. 127.0.0.1:44321."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, nethsm, address=("127.0.0.1", 0)):
+        super().__init__(address, _Handler)
+        self.nethsm = nethsm
+        self._context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        with tempfile.TemporaryDirectory() as directory:
+            self._context.load_cert_chain(*_self_signed_certificate(directory))
+        self._thread = None
+
+    def finish_request(self, request, client_address):
+        # the TLS handshake is performed in the request thread so that a slow
+        # client does not block the other connections
+        try:
+            request = self._context.wrap_socket(request, server_side=True)
+        except (OSError, ssl.SSLError):
+            return
+        try:
+            super().finish_request(request, client_address)
+        finally:
+            request.close()
+
+    @property
+    def host(self):
+        (host, port) = self.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+@contextlib.contextmanager
+def serve(address=("127.0.0.1", 0), **kwargs):
+    """Run a mock NetHSM in a background thread.
+
+    The keyword arguments are passed to MockNetHSM.  Yields the started
+    MockServer; the MockNetHSM is available as its nethsm attribute."""
+    server = MockServer(MockNetHSM(**kwargs), address)
+    server.start()
+    try:
+        yield server
+    finally:
+        server.stop()
+
+
+def main():
+    import click
+
+    @click.command()
+    @click.option("--host", default="127.0.0.1", show_default=True)
+    @click.option("--port", type=int, default=8443, show_default=True)
+    @click.option("--latency", type=float, default=0.0, help="Delay in seconds")
+    @click.option("--jitter", type=float, default=0.0, help="Random extra delay")
+    @click.option("--error-rate", type=float, default=0.0, help="Error probability")
+    @click.option("--error-status", type=int, default=DEFAULT_ERROR_STATUS)
+    def run(host, port, latency, jitter, error_rate, error_status):
+        """Run a mock NetHSM server."""
+        nethsm = MockNetHSM(
+            latency=latency,
+            jitter=jitter,
+            error_rate=error_rate,
+            error_status=error_status,
+        )
+        server = MockServer(nethsm, (host, port))
+        print(f"Mock NetHSM listening on https://{server.host}/api/{VERSION}")
+        for user_id, (role, passphrase) in DEFAULT_USERS.items():
+            print(f"  {role.value}: {user_id} / {passphrase}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+    run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""Client-side timing statistics for NetHSM API calls.
+
+A NetHSM instance with a RequestStats object measures every API call and
+records the durations of these phases per endpoint:
+
+- connect: establishing the TCP connection (only for new connections)
+- tls: the TLS handshake (only for new connections)
+- ttfb: the time between sending the request and receiving the response
+  headers, i. e. the processing time on the NetHSM plus the network latency
+- serialize: the time spent before the request is sent
+- deserialize: the time spent after the response is received
+- total: the total duration of the call"""
+
+import contextlib
+import math
+import random
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+PHASES = ["connect", "tls", "ttfb", "serialize", "deserialize", "total"]
+RESERVOIR_SIZE = 10000
+
+_ENDPOINT_PATTERNS = [
+    (re.compile(r"^keys/(?!generate(/|$))[^/]+"), "keys/{KeyID}"),
+    (re.compile(r"^users/[^/]+"), "users/{UserID}"),
+    (re.compile(r"/tags/[^/]+$"), "/tags/{Tag}"),
+]
+
+_local = threading.local()
+
+
+def endpoint_name(method, url):
+    """Return the endpoint for a request URL with the IDs replaced."""
+    path = re.sub(r"^/api/[^/]+/", "", urlparse(url).path)
+    for pattern, replacement in _ENDPOINT_PATTERNS:
+        path = pattern.sub(replacement, path)
+    return f"{method} {path}"
+
+
+def current_scope():
+    return getattr(_local, "scope", None)
+
+
+class Histogram:
+    """Collect samples and calculate percentiles.
+
+    At most RESERVOIR_SIZE samples are stored; if more samples are added,
+    a uniform random subset is kept."""
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.samples = []
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(value)
+        else:
+            i = random.randrange(self.count)
+            if i < RESERVOIR_SIZE:
+                self.samples[i] = value
+
+    def percentile(self, p):
+        if not self.samples:
+            return None
+        # nearest-rank method
+        samples = sorted(self.samples)
+        rank = math.ceil(p / 100 * len(samples))
+        return samples[min(len(samples), max(rank, 1)) - 1]
+
+
+class EndpointStats:
+    def __init__(self):
+        self.histograms = {}
+        self.errors = 0
+        self.first = None
+        self.last = None
+
+    @property
+    def count(self):
+        return self.histograms["total"].count if "total" in self.histograms else 0
+
+    @property
+    def throughput(self):
+        """The number of calls per second between the first and last call."""
+        if self.count < 2 or self.last <= self.first:
+            return None
+        return self.count / (self.last - self.first)
+
+
+class _Scope:
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.transport_start = None
+        self.transport_end = None
+        self.sent = None
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def start_transport(self, method, url):
+        if self.transport_start is None:
+            self.name = endpoint_name(method, url)
+            self.transport_start = time.perf_counter()
+
+    def end_transport(self):
+        self.transport_end = time.perf_counter()
+
+    def request_sent(self):
+        self.sent = time.perf_counter()
+
+    def response_received(self):
+        if self.sent is not None:
+            self.add("ttfb", time.perf_counter() - self.sent)
+
+
+class RequestStats:
+    """Thread-safe collection of timing statistics per endpoint."""
+
+    def __init__(self):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        """Measure an API call in this thread.
+
+        name is used if the call does not send a request.  Nested calls are
+        measured as part of the outer call."""
+        if current_scope() is not None:
+            yield current_scope()
+            return
+
+        scope = _Scope(name)
+        _local.scope = scope
+        failed = False
+        try:
+            yield scope
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            _local.scope = None
+            self._record(scope, time.perf_counter(), failed)
+
+    def _record(self, scope, end, failed):
+        phases = dict(scope.phases)
+        phases["total"] = end - scope.start
+        if scope.transport_start is not None:
+            phases["serialize"] = scope.transport_start - scope.start
+            if scope.transport_end is not None:
+                phases["deserialize"] = end - scope.transport_end
+
+        with self._lock:
+            endpoint = self.endpoints.setdefault(scope.name, EndpointStats())
+            for phase, seconds in phases.items():
+                endpoint.histograms.setdefault(phase, Histogram()).add(seconds)
+            if failed:
+                endpoint.errors += 1
+            if endpoint.first is None:
+                endpoint.first = scope.start
+            endpoint.last = end
+
+    def summary(self, percentiles=(50, 95, 99)):
+        """Return a dict that maps endpoint names to dicts mapping the phases
+        to (count, [percentiles...]) tuples; durations are in seconds."""
+        with self._lock:
+            return {
+                name: {
+                    phase: (
+                        endpoint.histograms[phase].count,
+                        [endpoint.histograms[phase].percentile(p) for p in percentiles],
+                    )
+                    for phase in PHASES
+                    if phase in endpoint.histograms
+                }
+                for name, endpoint in sorted(self.endpoints.items())
+            }
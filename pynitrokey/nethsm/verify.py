@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""Local verification of signatures created by the NetHSM.
+
+The message has to be passed in the same form as to the sign endpoint: the
+raw message for EdDSA and the hash of the message for all other modes."""
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+
+from . import SignMode
+
+_PSS_HASHES = {
+    SignMode.PSS_MD5: hashes.MD5,
+    SignMode.PSS_SHA1: hashes.SHA1,
+    SignMode.PSS_SHA224: hashes.SHA224,
+    SignMode.PSS_SHA256: hashes.SHA256,
+    SignMode.PSS_SHA384: hashes.SHA384,
+    SignMode.PSS_SHA512: hashes.SHA512,
+}
+# the NetHSM does not know the hash algorithm used for ECDSA, so it is
+# derived from the length of the hash
+_ECDSA_HASHES = {
+    algorithm.digest_size: algorithm
+    for algorithm in [
+        hashes.SHA1,
+        hashes.SHA224,
+        hashes.SHA256,
+        hashes.SHA384,
+        hashes.SHA512,
+    ]
+}
+
+
+def load_public_key(public_key_pem):
+    if isinstance(public_key_pem, str):
+        public_key_pem = public_key_pem.encode("utf-8")
+    return serialization.load_pem_public_key(public_key_pem)
+
+
+def verify_signature(public_key, mode, message, signature):
+    """Check a signature with a public key as returned by load_public_key.
+
+    The mode is a SignMode or its value, message and signature are bytes.
+    Returns True if the signature is valid and False otherwise."""
+    mode = SignMode(mode)
+    try:
+        if mode == SignMode.PKCS1:
+            if not isinstance(public_key, rsa.RSAPublicKey):
+                raise ValueError(f"{mode.value} requires an RSA key")
+            data = public_key.recover_data_from_signature(
+                signature, padding.PKCS1v15(), None
+            )
+            return data == message
+        elif mode in _PSS_HASHES:
+            if not isinstance(public_key, rsa.RSAPublicKey):
+                raise ValueError(f"{mode.value} requires an RSA key")
+            algorithm = _PSS_HASHES[mode]()
+            public_key.verify(
+                signature,
+                message,
+                padding.PSS(mgf=padding.MGF1(algorithm), salt_length=padding.PSS.AUTO),
+                Prehashed(algorithm),
+            )
+        elif mode == SignMode.EDDSA:
+            if not isinstance(public_key, ed25519.Ed25519PublicKey):
+                raise ValueError(f"{mode.value} requires a Curve25519 key")
+            public_key.verify(signature, message)
+        else:
+            if not isinstance(public_key, ec.EllipticCurvePublicKey):
+                raise ValueError(f"{mode.value} requires an EC key")
+            if len(message) not in _ECDSA_HASHES:
+                raise ValueError(f"Unsupported hash length {len(message)}")
+            algorithm = _ECDSA_HASHES[len(message)]()
+            public_key.verify(signature, message, ec.ECDSA(Prehashed(algorithm)))
+    except InvalidSignature:
+        return False
+    return True
@@ -11,11 +11,18 @@ import enum
 import logging
 import platform
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import List, Optional
+from typing import TYPE_CHECKING, Collection, List, Optional
 
 from fido2.ctap import CtapError
-from fido2.hid import CtapHidDevice, open_device
+from fido2.hid import (
+    CtapHidDevice,
+    HidDescriptor,
+    list_descriptors,
+    open_connection,
+    open_device,
+)
 
 from pynitrokey.fido2 import device_path_to_str
 
@@ -23,9 +30,14 @@ from .base import Nitrokey3Base
 from .exceptions import TimeoutException
 from .utils import Uuid, Version
 
+if TYPE_CHECKING:
+    from .admin_app import Status
+
 RNG_LEN = 57
 UUID_LEN = 16
 VERSION_LEN = 4
+# the maximum number of devices that are opened concurrently by list()
+MAX_PROBE_WORKERS = 16
 
 logger = logging.getLogger(__name__)
 
@@ -70,7 +82,7 @@ class Nitrokey3Device(Nitrokey3Base):
         self.logger = logger.getChild(self._path)
 
         self.admin = AdminApp(self)
-        self.admin.status()
+        self._status: Optional["Status"] = None
 
     @property
     def path(self) -> str:
@@ -83,6 +95,12 @@ class Nitrokey3Device(Nitrokey3Base):
     def close(self) -> None:
         self.device.close()
 
+    def status(self) -> "Status":
+        """Return the status of the admin app, queried on first use."""
+        if self._status is None:
+            self._status = self.admin.status()
+        return self._status
+
     def reboot(self, mode: BootMode = BootMode.FIRMWARE) -> bool:
         try:
             if mode == BootMode.FIRMWARE:
@@ -139,15 +157,39 @@ class Nitrokey3Device(Nitrokey3Base):
         return response
 
     @staticmethod
-    def list() -> List["Nitrokey3Device"]:
-        devices = []
-        for device in CtapHidDevice.list_devices():
-            try:
-                devices.append(Nitrokey3Device(device))
-            except ValueError:
-                # not a Nitrokey 3 device, skip
-                pass
-        return devices
+    def _probe(descriptor: HidDescriptor) -> Optional["Nitrokey3Device"]:
+        try:
+            device = CtapHidDevice(descriptor, open_connection(descriptor))
+        except Exception:
+            path = device_path_to_str(descriptor.path)
+            logger.warn(f"Failed to open device at path {path}", exc_info=True)
+            return None
+        return Nitrokey3Device(device)
+
+    @staticmethod
+    def list(exclude: Collection[str] = ()) -> List["Nitrokey3Device"]:
+        """
+        List the connected Nitrokey 3 devices.  Devices with a path in exclude
+        are not opened, for example because they are in use by another thread.
+        """
+        from . import PID_NITROKEY3_DEVICE, VID_NITROKEY
+
+        # only open the devices with a matching VID:PID
+        descriptors = [
+            descriptor
+            for descriptor in list_descriptors()
+            if (descriptor.vid, descriptor.pid) == (VID_NITROKEY, PID_NITROKEY3_DEVICE)
+            and device_path_to_str(descriptor.path) not in exclude
+        ]
+        if len(descriptors) <= 1:
+            probed = [Nitrokey3Device._probe(d) for d in descriptors]
+        else:
+            # opening a device requires a CTAPHID round trip, so probe the
+            # devices concurrently
+            workers = min(len(descriptors), MAX_PROBE_WORKERS)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                probed = list(executor.map(Nitrokey3Device._probe, descriptors))
+        return [device for device in probed if device]
 
     @staticmethod
     def open(path: str) -> Optional["Nitrokey3Device"]:
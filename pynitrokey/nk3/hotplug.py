@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""
+Notifications about new device nodes so that waiting for a device that is
+rebooted does not have to poll.  Only Linux is supported (using inotify);
+on other systems, or if inotify is not available, watch() returns None and
+the caller falls back to polling.
+"""
+
+import ctypes
+import fnmatch
+import logging
+import os
+import platform
+import select
+import struct
+import time
+from types import TracebackType
+from typing import Iterator, Optional, Sequence, Type
+
+# the device nodes of the CTAPHID devices, the LPC55 bootloader (hidraw) and
+# the NRF52 bootloader (serial)
+DEFAULT_PATTERNS = ["hidraw*", "ttyACM*", "ttyUSB*"]
+DEV_PATH = "/dev"
+
+IN_ATTRIB = 0x00000004
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+logger = logging.getLogger(__name__)
+
+
+class HotplugWatcher:
+    """
+    Watches a directory for device nodes that are created or whose
+    permissions are changed (by udev after the node has been created).
+    """
+
+    def __init__(self, fd: int, patterns: Sequence[str]) -> None:
+        self.fd = fd
+        self.patterns = patterns
+
+    def _matches(self, name: str) -> bool:
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns)
+
+    def _read_events(self) -> Iterator[str]:
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            (_, _, _, length) = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            yield name.decode(errors="replace")
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Wait until a matching device node appears or the timeout expires.
+        :return: True if a matching device node appeared
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            (readable, _, _) = select.select([self.fd], [], [], remaining)
+            if not readable:
+                return False
+            names = [name for name in self._read_events() if self._matches(name)]
+            if names:
+                logger.debug(f"Device nodes changed: {', '.join(names)}")
+                return True
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    def __enter__(self) -> "HotplugWatcher":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+
+def watch(
+    path: str = DEV_PATH, patterns: Sequence[str] = DEFAULT_PATTERNS
+) -> Optional[HotplugWatcher]:
+    """
+    Start watching path for device nodes matching one of the patterns.
+    :return: The watcher, or None if hotplug events are not supported
+    """
+    if platform.system() != "Linux":
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CREATE | IN_ATTRIB | IN_MOVED_TO
+        if libc.inotify_add_watch(fd, os.fsencode(path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, f"inotify_add_watch failed for {path}")
+    except (AttributeError, OSError):
+        logger.debug("Hotplug events not available, polling", exc_info=True)
+        return None
+    return HotplugWatcher(fd, patterns)
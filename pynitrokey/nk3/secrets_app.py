@@ -7,6 +7,7 @@ Can be used directly over CCID as well.
 import dataclasses
 import hmac
 import logging
+import os
 import typing
 from enum import Enum, IntEnum
 from hashlib import pbkdf2_hmac
@@ -208,7 +209,7 @@ class Instruction(Enum):
     List = 0xA1
     Calculate = 0xA2
     Validate = 0xA3
-    CalculateAll = 0xA4  # 0xA4 is Select as well # Unused
+    CalculateAll = 0xA4  # 0xA4 is Select as well, distinguished by P1
     SendRemaining = 0xA5
     VerifyCode = 0xB1
     # Place extending commands in 0xBx space
@@ -225,6 +226,8 @@ class Tag(Enum):
     Key = 0x73
     Challenge = 0x74
     Response = 0x75
+    TruncatedResponse = 0x76
+    NoResponse = 0x77
     Properties = 0x78
     InitialCounter = 0x7A
     Version = 0x79
@@ -285,6 +288,9 @@ ALGORITHM_TO_KIND = {
 }
 
 
+TRACE_ENVVAR = "NITROPY_SECRETS_TRACE"
+
+
 class SecretsApp:
     """
     This is a Secrets App client
@@ -293,19 +299,39 @@ class SecretsApp:
 
     log: logging.Logger
     logfn: typing.Callable
+    trace: bool
     dev: Nitrokey3Device
     write_corpus_fn: Optional[typing.Callable]
     _cache_status: Optional[SelectResponse]
+    _calculate_all_supported: bool
     _metadata: dict
 
-    def __init__(self, dev: Nitrokey3Device, logfn: Optional[typing.Callable] = None):
+    def __init__(
+        self,
+        dev: Nitrokey3Device,
+        logfn: Optional[typing.Callable] = None,
+        trace: Optional[bool] = None,
+    ):
+        """
+        :param logfn: Function to log messages with, defaults to the info level of the otpapp logger
+        :param trace: Log every exchanged APDU and its decoded payload.
+            Defaults to True if logfn is set or the NITROPY_SECRETS_TRACE
+            environment variable is set, False otherwise. The trace is only
+            formatted if it is enabled.
+        """
         self._cache_status = None
+        self._calculate_all_supported = True
         self.write_corpus_fn = None
         self.log = logging.getLogger("otpapp")
         if logfn is not None:
             self.logfn = logfn  # type: ignore [assignment]
         else:
             self.logfn = self.log.info  # type: ignore [assignment]
+        if trace is None:
+            trace = logfn is not None or bool(os.environ.get(TRACE_ENVVAR))
+        self.trace = trace and (
+            logfn is not None or self.log.isEnabledFor(logging.INFO)
+        )
         self.dev = dev
         self._metadata = {}
 
@@ -339,12 +365,15 @@ class SecretsApp:
         bytes_data = iso7816_compose(ins_b, p1, p2, data=encoded_structure)
         if self.write_corpus_fn:
             self.write_corpus_fn(ins, bytes_data)
-        return self._send_receive_inner(bytes_data, log_info=f"{ins}")
+        log_info = f"{ins}" if self.trace else ""
+        return self._send_receive_inner(bytes_data, log_info=log_info)
 
     def _send_receive_inner(self, data: bytes, log_info: str = "") -> bytes:
-        self.logfn(
-            f"Sending {log_info if log_info else ''} {data.hex() if data else data!r}"
-        )
+        trace = self.trace
+        if trace:
+            self.logfn(
+                f"Sending {log_info if log_info else ''} {data.hex() if data else data!r}"
+            )
 
         try:
             result = self.dev.otp(data=data)
@@ -353,15 +382,16 @@ class SecretsApp:
             raise
 
         status_bytes, result = result[:2], result[2:]
-        self.logfn(
-            f"Received [{status_bytes.hex()}] {result.hex() if result else result!r}"
-        )
+        if trace:
+            self.logfn(
+                f"Received [{status_bytes.hex()}] {result.hex() if result else result!r}"
+            )
 
         log_multipacket = False
         data_final = result
         MORE_DATA_STATUS_BYTE = 0x61
         while status_bytes[0] == MORE_DATA_STATUS_BYTE:
-            if log_multipacket:
+            if log_multipacket and trace:
                 self.logfn(
                     f"Got RemainingData status: [{status_bytes.hex()}] {result.hex() if result else result!r}"
                 )
@@ -375,21 +405,22 @@ class SecretsApp:
                 raise
             # Data order is different here than in APDU - SW is first, then the data if any
             status_bytes, result = result[:2], result[2:]
-            self.logfn(
-                f"Received [{status_bytes.hex()}] {result.hex() if result else result!r}"
-            )
+            if trace:
+                self.logfn(
+                    f"Received [{status_bytes.hex()}] {result.hex() if result else result!r}"
+                )
             if status_bytes[0] in [0x90, MORE_DATA_STATUS_BYTE]:
                 data_final += result
 
         if status_bytes != b"\x90\x00" and status_bytes[0] != MORE_DATA_STATUS_BYTE:
             raise SecretsAppException(status_bytes.hex(), "Received error")
 
-        if log_multipacket:
+        if log_multipacket and trace:
             self.logfn(
                 f"Received final data: [{status_bytes.hex()}] {data_final.hex() if data_final else data_final!r}"
             )
 
-        if data_final:
+        if data_final and trace:
             try:
                 self.logfn(
                     f"Decoded received: {[e.data for e in tlv8.decode(data_final)]}"
@@ -474,11 +505,13 @@ class SecretsApp:
         raw_res = self._send_receive(Instruction.GetCredential, structure=structure)
         resd: tlv8.EntryList = tlv8.decode(raw_res)
         res = {}
-        self.logfn("Per field dissection:")
+        if self.trace:
+            self.logfn("Per field dissection:")
         for e in resd:
             # e: tlv8.Entry
             res[e.type_id] = e.data
-            self.logfn(f"{hex(e.type_id)} {hex(len(e.data))}  {e.data.hex()}")
+            if self.trace:
+                self.logfn(f"{hex(e.type_id)} {hex(len(e.data))}  {e.data.hex()}")
         p = PasswordSafeEntry(
             login=res.get(Tag.PwsLogin.value),
             password=res.get(Tag.PwsPassword.value),
@@ -659,13 +692,72 @@ class SecretsApp:
         assert header.hex() in ["7605", "7700"]
         digits = res[2]
         digest = res[3:]
+        codes = self._truncated_code(digits, digest)
+        if self.trace:
+            self.logfn(
+                f"Received digest: {digest.hex()}, for challenge {challenge}, digits: {digits},"
+                f" final code: {codes!r}"
+            )
+        return codes
+
+    @classmethod
+    def _truncated_code(cls, digits: int, digest: bytes) -> bytes:
         truncated_code = int.from_bytes(digest, byteorder="big", signed=False)
         code = (truncated_code & 0x7FFFFFFF) % pow(10, digits)
-        codes: bytes = str(code).zfill(digits).encode()
-        self.logfn(
-            f"Received digest: {digest.hex()}, for challenge {challenge}, digits: {digits}, truncated code: {truncated_code!r}, pre-code: {code!r},"
-            f" final code: {codes!r}"
-        )
+        return str(code).zfill(digits).encode()
+
+    def calculate_all(
+        self, challenge: Optional[int] = None
+    ) -> typing.Dict[bytes, Optional[bytes]]:
+        """
+        Calculate the OTP codes of all credentials with a single request.
+        If the device does not support the CalculateAll instruction, one
+        Calculate request is sent for every TOTP credential instead.
+        :param challenge: Challenge for the calculations (TOTP only).
+            Should be equal to: timestamp/period. The commonly used period value is 30.
+        :return: Dictionary of the credential names and their OTP codes as byte strings.
+            Credentials without a code, e.g. HOTP credentials, are mapped to None.
+        """
+        if challenge is None:
+            challenge = 0
+        if self._calculate_all_supported:
+            structure = [tlv8.Entry(Tag.Challenge.value, pack(">Q", challenge))]
+            try:
+                res = self._send_receive(Instruction.CalculateAll, structure=structure)
+            except SecretsAppException as e:
+                if e.to_id() not in [
+                    SecretsAppExceptionID.InstructionNotSupportedOrInvalid,
+                    SecretsAppExceptionID.IncorrectDataParameter,
+                    SecretsAppExceptionID.IncorrectP1OrP2Parameter,
+                ]:
+                    raise
+                self.logfn(f"CalculateAll is not supported: {e}")
+                self._calculate_all_supported = False
+            else:
+                return self._decode_calculate_all(res)
+
+        codes: typing.Dict[bytes, Optional[bytes]] = {}
+        for item in self.list_with_properties():
+            if item.kind == Kind.Totp:
+                codes[item.label] = self.calculate(item.label, challenge)
+            elif item.kind in [Kind.Hotp, Kind.HotpReverse]:
+                codes[item.label] = None
+        return codes
+
+    @classmethod
+    def _decode_calculate_all(cls, res: bytes) -> typing.Dict[bytes, Optional[bytes]]:
+        # the response is a sequence of name and response entries
+        codes: typing.Dict[bytes, Optional[bytes]] = {}
+        name = None
+        for e in tlv8.decode(res):
+            if e.type_id == Tag.CredentialId.value:
+                name = e.data
+            elif name is not None:
+                if e.type_id == Tag.TruncatedResponse.value:
+                    codes[name] = cls._truncated_code(e.data[0], e.data[1:])
+                else:
+                    codes[name] = None
+                name = None
         return codes
 
     def verify_code(self, cred_id: bytes, code: int) -> bool:
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""
+Reading OTP credentials from files for a bulk import into the Secrets App.
+
+Supported formats are lists of otpauth:// URIs (one per line), CSV files with
+a header and JSON files with a list of objects.  CSV and JSON use the fields
+name, issuer, secret (base32), kind (TOTP or HOTP), algorithm (SHA1 or
+SHA256), digits, counter, period, touch_button and protect_with_pin; only
+name and secret are required.  Other fields, for example from the export of
+another authenticator, are ignored.
+"""
+
+import base64
+import csv
+import dataclasses
+import io
+import json
+import typing
+import urllib.parse
+from typing import Any, Dict, List, Set, Tuple
+
+from pynitrokey.nk3.secrets_app import STRING_TO_KIND, Algorithm, Kind, ListItem
+
+FORMATS = ["uri", "csv", "json"]
+DEFAULT_PERIOD = 30
+FIELDS = [
+    "name",
+    "issuer",
+    "secret",
+    "kind",
+    "algorithm",
+    "digits",
+    "counter",
+    "period",
+    "touch_button",
+    "protect_with_pin",
+]
+EXPORT_FIELDS = ["name", "kind", "touch_button", "protect_with_pin", "pws_data"]
+
+_KINDS = {"TOTP": Kind.Totp, "HOTP": Kind.Hotp}
+_ALGORITHMS = {"SHA1": Algorithm.Sha1, "SHA256": Algorithm.Sha256}
+
+
+@dataclasses.dataclass
+class CredentialEntry:
+    name: str
+    secret: bytes
+    kind: Kind = Kind.Totp
+    algorithm: Algorithm = Algorithm.Sha1
+    digits: int = 6
+    counter: int = 0
+    touch_button: bool = False
+    protect_with_pin: bool = False
+
+
+@dataclasses.dataclass
+class ParseError:
+    # the line number or position of the entry in the file
+    position: int
+    message: str
+
+
+def _decode_secret(secret: str) -> bytes:
+    secret = secret.replace(" ", "").upper()
+    # base32 secrets are often given without padding
+    secret += "=" * (-len(secret) % 8)
+    try:
+        return base64.b32decode(secret)
+    except ValueError:
+        raise ValueError("The secret is not base32 encoded")
+
+
+def _parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in ["1", "true", "yes", "y"]:
+        return True
+    if str(value).strip().lower() in ["", "0", "false", "no", "n"]:
+        return False
+    raise ValueError(f"Invalid boolean value: {value}")
+
+
+def _parse_int(value: Any, field: str) -> int:
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid {field}: {value}")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid {field}: {value!r}")
+
+
+def _parse_str(value: Any, field: str) -> str:
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid {field}: {value!r}")
+    return value
+
+
+def _make_entry(fields: Dict[str, Any]) -> CredentialEntry:
+    # empty CSV cells use the default value
+    fields = {k: v for (k, v) in fields.items() if v is not None and v != ""}
+
+    name = _parse_str(fields.get("name", ""), "name")
+    if not name:
+        raise ValueError("Missing name")
+    issuer = _parse_str(fields.get("issuer", ""), "issuer")
+    if issuer and ":" not in name:
+        name = f"{issuer}:{name}"
+    if "secret" not in fields:
+        raise ValueError("Missing secret")
+
+    kind = _parse_str(fields.get("kind", "TOTP"), "kind").upper()
+    if kind not in _KINDS:
+        raise ValueError(f"Unsupported kind: {kind}")
+    algorithm = _parse_str(fields.get("algorithm", "SHA1"), "algorithm").upper()
+    if algorithm not in _ALGORITHMS:
+        raise ValueError(f"Unsupported algorithm: {algorithm}")
+    digits = _parse_int(fields.get("digits", 6), "digits")
+    if digits not in [6, 8]:
+        raise ValueError(f"Unsupported number of digits: {digits}")
+    # the period is not stored on the device, get-otp assumes 30 seconds
+    period = _parse_int(fields.get("period", DEFAULT_PERIOD), "period")
+    if period != DEFAULT_PERIOD:
+        raise ValueError(f"Unsupported period: {period}")
+    counter = _parse_int(fields.get("counter", 0), "counter")
+    if not 0 <= counter <= 0xFFFFFFFF:
+        raise ValueError(f"Invalid counter: {counter}")
+
+    return CredentialEntry(
+        name=name,
+        secret=_decode_secret(_parse_str(fields["secret"], "secret")),
+        kind=_KINDS[kind],
+        algorithm=_ALGORITHMS[algorithm],
+        digits=digits,
+        counter=counter,
+        touch_button=_parse_bool(fields.get("touch_button", False)),
+        protect_with_pin=_parse_bool(fields.get("protect_with_pin", False)),
+    )
+
+
+def parse_otpauth_uri(uri: str) -> CredentialEntry:
+    """Parse an otpauth://TYPE/LABEL?PARAMETERS URI."""
+    url = urllib.parse.urlsplit(uri)
+    if url.scheme != "otpauth":
+        raise ValueError("Not an otpauth:// URI")
+    params = dict(urllib.parse.parse_qsl(url.query))
+    fields = {
+        "name": urllib.parse.unquote(url.path.lstrip("/")),
+        "issuer": params.get("issuer"),
+        "secret": params.get("secret"),
+        "kind": url.netloc,
+        "algorithm": params.get("algorithm"),
+        "digits": params.get("digits"),
+        "counter": params.get("counter"),
+        "period": params.get("period"),
+    }
+    return _make_entry(fields)
+
+
+def guess_format(filename: str) -> str:
+    if filename.lower().endswith(".csv"):
+        return "csv"
+    if filename.lower().endswith(".json"):
+        return "json"
+    return "uri"
+
+
+def read_credentials(
+    f: typing.TextIO, format: str
+) -> Tuple[List[CredentialEntry], List[ParseError], List[str]]:
+    """
+    Read the credentials from a file in the given format.
+    Invalid entries do not stop the parsing but are returned as errors.
+    Unknown fields are ignored and reported as warnings.
+    :return: The valid entries, the errors for the invalid ones and warnings
+    """
+    entries = []
+    errors = []
+    unknown: Set[str] = set()
+    items: List[Tuple[int, Any]]
+    if format == "uri":
+        items = [
+            (i, line.strip())
+            for (i, line) in enumerate(f, start=1)
+            if line.strip() and not line.strip().startswith("#")
+        ]
+    elif format == "csv":
+        reader = csv.DictReader(f)
+        # the line of the header is 1
+        items = [(i, row) for (i, row) in enumerate(reader, start=2)]
+    elif format == "json":
+        data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get("credentials")
+        if not isinstance(data, list):
+            raise ValueError("The JSON file must contain a list of credentials")
+        items = [(i, item) for (i, item) in enumerate(data, start=1)]
+    else:
+        raise ValueError(f"Unknown format: {format}")
+
+    for (position, item) in items:
+        try:
+            if format == "uri":
+                entries.append(parse_otpauth_uri(item))
+            elif isinstance(item, dict):
+                # csv.DictReader stores the cells without a header under None
+                if None in item:
+                    raise ValueError(
+                        f"The row has {len(item[None])} more cell(s) than the header"
+                    )
+                unknown.update(str(key) for key in item if key not in FIELDS)
+                fields = {k: v for (k, v) in item.items() if k in FIELDS}
+                entries.append(_make_entry(fields))
+            else:
+                raise ValueError("The credential must be an object")
+        except (TypeError, ValueError) as e:
+            errors.append(ParseError(position, str(e)))
+
+    warnings = []
+    if unknown:
+        warnings.append(f"Ignored unknown fields: {', '.join(sorted(unknown))}")
+    return (entries, errors, warnings)
+
+
+def _export_row(item: ListItem) -> Dict[str, Any]:
+    kinds = {kind: name for (name, kind) in STRING_TO_KIND.items()}
+    return {
+        "name": item.label.decode(errors="replace"),
+        "kind": kinds.get(item.kind, "PWS"),
+        "touch_button": item.properties.touch_required,
+        "protect_with_pin": item.properties.secret_encryption,
+        "pws_data": item.properties.pws_data_exist,
+    }
+
+
+def write_credentials(items: List[ListItem], format: str) -> str:
+    """
+    Return the labels and properties of credentials as CSV or JSON.
+    The secrets cannot be read from the device and are never exported.
+    """
+    rows = [_export_row(item) for item in items]
+    if format == "json":
+        return json.dumps(rows, indent=2) + "\n"
+    elif format == "csv":
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+        return output.getvalue()
+    raise ValueError(f"Unsupported export format: {format}")
@@ -175,6 +175,23 @@ class Updater:
             device.version() if isinstance(device, Nitrokey3Device) else None
         )
         logger.info(f"Firmware version before update: {current_version or ''}")
+        container = self.prepare_update(
+            image, update_version, current_version, ignore_pynitrokey_version
+        )
+        self.ui.confirm_update(current_version, container.version)
+        return self.install_update(device, container, current_version)
+
+    def prepare_update(
+        self,
+        image: Optional[str],
+        update_version: Optional[str],
+        current_version: Optional[Version] = None,
+        ignore_pynitrokey_version: bool = False,
+    ) -> FirmwareContainer:
+        """
+        Load the firmware container from the given image or download it.  If
+        current_version is set, it is checked against the new version.
+        """
         container = self._prepare_update(image, update_version, current_version)
 
         if container.pynitrokey:
@@ -189,8 +206,18 @@ class Updater:
                         current=pynitrokey_version, required=container.pynitrokey
                     )
 
-        self.ui.confirm_update(current_version, container.version)
+        return container
 
+    def install_update(
+        self,
+        device: Nitrokey3Base,
+        container: FirmwareContainer,
+        current_version: Optional[Version],
+    ) -> Version:
+        """
+        Install a prepared firmware container on the device and wait until
+        it has rebooted into the new firmware.
+        """
         with self._get_bootloader(device) as bootloader:
             if bootloader.variant not in container.images:
                 raise self.ui.error(
@@ -237,7 +264,7 @@ class Updater:
                 container = FirmwareContainer.parse(image)
             except Exception as e:
                 raise self.ui.error("Failed to parse firmware container", e)
-            self._validate_version(current_version, container.version)
+            self.validate_version(current_version, container.version)
             return container
         else:
             if version:
@@ -257,7 +284,7 @@ class Updater:
                 release_version = Version.from_v_str(release.tag)
             except ValueError as e:
                 raise self.ui.error("Failed to parse version from release tag", e)
-            self._validate_version(current_version, release_version)
+            self.validate_version(current_version, release_version)
             self.ui.confirm_download(current_version, release_version)
             return self._download_update(release)
 
@@ -295,7 +322,7 @@ class Updater:
 
         return container
 
-    def _validate_version(
+    def validate_version(
         self,
         current_version: Optional[Version],
         new_version: Version,
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+import subprocess
+import sys
+
+# maximum share of the import time of pynitrokey.cli that may be spent on
+# the NetHSM subcommands
+NETHSM_IMPORT_BUDGET = 0.05
+
+
+def _import_times(module: str) -> dict[str, int]:
+    """Return the cumulative import time in microseconds per module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_nethsm_client_not_imported() -> None:
+    times = _import_times("pynitrokey.cli")
+    assert "pynitrokey.cli.nethsm" in times
+    assert "pynitrokey.nethsm.client" not in times
+
+
+def test_nethsm_import_budget() -> None:
+    times = _import_times("pynitrokey.cli")
+    share = times["pynitrokey.cli.nethsm"] / times["pynitrokey.cli"]
+    assert share < NETHSM_IMPORT_BUDGET
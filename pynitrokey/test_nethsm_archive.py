@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""
+Tests for the deduplicating NetHSM backup archive.
+"""
+
+import os
+import random
+from pathlib import Path
+
+import pytest
+
+from pynitrokey.nethsm.archive import (
+    MAX_CHUNK_SIZE,
+    MIN_CHUNK_SIZE,
+    BackupArchive,
+    SnapshotReader,
+    _write_atomic,
+    split_chunks,
+)
+
+
+def _data(n: int, seed: int = 0) -> bytes:
+    return random.Random(seed).randbytes(n)
+
+
+def _blocks(data: bytes, size: int = 10000) -> list[bytes]:
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+def test_split_chunks() -> None:
+    data = _data(500000)
+    chunks = list(split_chunks(_blocks(data)))
+    assert b"".join(chunks) == data
+    assert all(MIN_CHUNK_SIZE <= len(c) <= MAX_CHUNK_SIZE for c in chunks[:-1])
+
+    # the boundaries do not depend on the block size or on inserted data
+    assert list(split_chunks([data])) == chunks
+    shifted = list(split_chunks([b"inserted" + data]))
+    assert len(set(chunks) - set(shifted)) <= 1
+
+
+def test_archive(tmp_path: Path) -> None:
+    archive = BackupArchive(str(tmp_path))
+    backup1 = _data(200000)
+    backup2 = backup1[:100000] + b"changed" + backup1[100000:]
+
+    info1 = archive.add("one", "host1", _blocks(backup1))
+    assert info1.new_chunks == info1.chunks
+    info2 = archive.add("two", "host2", _blocks(backup2))
+    assert info2.new_chunks <= 2
+    assert archive.snapshots() == ["one", "two"]
+
+    with pytest.raises(FileExistsError):
+        archive.add("one", "host1", [])
+
+    for (name, backup) in [("one", backup1), ("two", backup2)]:
+        with archive.open(name) as f:
+            assert f.read() == backup
+            f.seek(150000)
+            assert f.read(10) == backup[150000:150010]
+
+
+def test_archive_corrupted(tmp_path: Path) -> None:
+    archive = BackupArchive(str(tmp_path))
+    archive.add("one", "host1", [_data(1000)])
+    [digest] = [digest for (digest, _) in archive.load("one")["chunks"]]
+    path = os.path.join(tmp_path, "chunks", digest[:2], digest)
+    with open(path, "wb") as f:
+        f.write(b"\x00" + _data(1000, seed=1))
+
+    with pytest.raises(ValueError):
+        with archive.open("one") as f:
+            f.read()
+
+
+def test_archive_missing_chunk(tmp_path: Path) -> None:
+    archive = BackupArchive(str(tmp_path))
+    archive.add("one", "host1", [_data(1000)])
+    [digest] = [digest for (digest, _) in archive.load("one")["chunks"]]
+    os.remove(os.path.join(tmp_path, "chunks", digest[:2], digest))
+
+    with pytest.raises(ValueError, match="missing"):
+        with archive.open("one") as f:
+            f.read()
+
+
+def test_archive_modified_snapshot(tmp_path: Path) -> None:
+    archive = BackupArchive(str(tmp_path))
+    backup = _data(100000)
+    archive.add("one", "host1", [backup])
+    snapshot = archive.load("one")
+    chunks = snapshot["chunks"]
+    assert len(chunks) > 2
+
+    # the chunks are valid, but not in the order of the backup
+    snapshot["chunks"] = [chunks[1], chunks[0]] + chunks[2:]
+    with pytest.raises(ValueError, match="snapshot hash"):
+        with SnapshotReader(archive, snapshot) as f:
+            f.read()
+
+    # a truncated chunk list does not match the size
+    snapshot["chunks"] = chunks[:-1]
+    with pytest.raises(ValueError):
+        SnapshotReader(archive, snapshot)
+
+
+def test_archive_without_hard_links(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def link(src: str, dst: str) -> None:
+        raise PermissionError("hard links not supported")
+
+    monkeypatch.setattr(os, "link", link)
+    archive = BackupArchive(str(tmp_path))
+    backup = _data(20000)
+    archive.add("one", "host1", [backup])
+    with pytest.raises(FileExistsError):
+        archive.add("one", "host1", [backup])
+    with archive.open("one") as f:
+        assert f.read() == backup
+
+
+@pytest.mark.parametrize("hard_links", [True, False])
+def test_write_exclusive(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, hard_links: bool
+) -> None:
+    def link(src: str, dst: str) -> None:
+        raise PermissionError("hard links not supported")
+
+    if not hard_links:
+        monkeypatch.setattr(os, "link", link)
+    path = str(tmp_path / "snapshot.json")
+    _write_atomic(path, b"one", exclusive=True)
+    with pytest.raises(FileExistsError):
+        _write_atomic(path, b"two", exclusive=True)
+    with open(path, "rb") as f:
+        assert f.read() == b"one"
+    # the temporary files are removed
+    assert os.listdir(tmp_path) == ["snapshot.json"]
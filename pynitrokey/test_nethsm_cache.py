@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""
+Tests for the key cache of the NetHSM client, placed in nethsm/cache.py.
+"""
+
+import time
+
+import pytest
+
+from pynitrokey.conftest import _connect
+from pynitrokey.nethsm import NetHSMError
+from pynitrokey.nethsm.cache import KeyCache
+from pynitrokey.nethsm.mock import MockServer
+
+
+def test_lru() -> None:
+    cache = KeyCache(maxsize=2)
+    cache.put("host", "a", "key", 1)
+    cache.put("host", "b", "key", 2)
+    assert cache.get("host", "a", "key") == 1
+    cache.put("host", "c", "key", 3)
+    assert len(cache) == 2
+    assert cache.get("host", "b", "key") is None
+    assert cache.get("host", "a", "key") == 1
+    assert cache.get("host", "c", "key") == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+
+    with pytest.raises(ValueError):
+        KeyCache(maxsize=0)
+
+
+def test_ttl() -> None:
+    cache = KeyCache(ttl=0.05)
+    cache.put("host", "a", "key", 1)
+    assert cache.get("host", "a", "key") == 1
+    time.sleep(0.1)
+    assert cache.get("host", "a", "key") is None
+    assert len(cache) == 0
+
+    cache = KeyCache(ttl=None)
+    cache.put("host", "a", "key", 1)
+    time.sleep(0.1)
+    assert cache.get("host", "a", "key") == 1
+
+
+def test_invalidate() -> None:
+    cache = KeyCache()
+    for host in ["host1", "host2"]:
+        for key_id in ["a", "b"]:
+            for kind in ["key", "public_key"]:
+                cache.put(host, key_id, kind, (host, key_id, kind))
+
+    cache.invalidate("host1", "a")
+    assert cache.get("host1", "a", "key") is None
+    assert cache.get("host1", "a", "public_key") is None
+    assert cache.get("host1", "b", "key") is not None
+    assert cache.get("host2", "a", "key") is not None
+
+    cache.invalidate("host2")
+    assert cache.get("host2", "a", "key") is None
+    assert cache.get("host2", "b", "public_key") is None
+    assert cache.get("host1", "b", "public_key") is not None
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_nethsm_invalidate(server: MockServer) -> None:
+    cache = KeyCache()
+    with _connect(server.host, "admin", key_cache=cache) as nethsm, _connect(
+        server.host, "admin"
+    ) as other:
+        nethsm.generate_key("Curve25519", ["EdDSA_Signature"], 256, "a")
+        nethsm.generate_key("Curve25519", ["EdDSA_Signature"], 256, "b")
+        public_key_a = nethsm.get_key_public_key("a")
+        public_key_b = nethsm.get_key_public_key("b")
+
+        # changes by another client are not seen until the key is invalidated
+        requests = server.nethsm.requests
+        other.delete_key("a")
+        other.generate_key("Curve25519", ["EdDSA_Signature"], 256, "a")
+        assert nethsm.get_key_public_key("a") == public_key_a
+        assert server.nethsm.requests == requests + 2
+
+        # generate_key invalidates the entries of the key
+        other.delete_key("a")
+        nethsm.generate_key("Curve25519", ["EdDSA_Signature"], 256, "a")
+        public_key = nethsm.get_key_public_key("a")
+        assert public_key != public_key_a
+        assert nethsm.get_key_public_key("a") == public_key
+
+        # delete_key invalidates the entries of the key, but not of other keys
+        requests = server.nethsm.requests
+        nethsm.delete_key("a")
+        with pytest.raises(NetHSMError) as e:
+            nethsm.get_key_public_key("a")
+        assert e.value.status == 404
+        assert nethsm.get_key_public_key("b") == public_key_b
+        assert server.nethsm.requests == requests + 2
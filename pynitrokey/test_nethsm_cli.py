@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""
+Tests for the nitropy nethsm commands against the mock NetHSM server.
+"""
+
+import base64
+import importlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+from click.testing import CliRunner, Result
+
+import pynitrokey.nethsm
+from pynitrokey.cli.nethsm import nethsm
+from pynitrokey.nethsm import NetHSMError
+from pynitrokey.nethsm.mock import DEFAULT_USERS, MockServer, serve
+
+# the module is shadowed by the nethsm command in pynitrokey.cli
+cli_nethsm = importlib.import_module("pynitrokey.cli.nethsm")
+
+
+def _run(server: MockServer, *args: str, user: str = "admin") -> Result:
+    (_, passphrase) = DEFAULT_USERS[user]
+    options = ["-h", server.host, "--no-verify-tls", "-u", user, "-p", passphrase]
+    return CliRunner().invoke(nethsm, options + list(args), input="")
+
+
+def test_restore_archive(server: MockServer, tmp_path: Path) -> None:
+    server.nethsm.keys.clear()
+    archive = str(tmp_path / "archive")
+    result = _run(
+        server, "generate-key", "-t", "Curve25519", "-m", "EdDSA_Signature", "-l", "256"
+    )
+    assert result.exit_code == 0, result.output
+    result = _run(server, "backup", "--archive", archive, "one", user="backup")
+    assert result.exit_code == 0, result.output
+
+    path = os.path.join(archive, "snapshots", "one.json")
+    with open(path) as f:
+        snapshot = json.load(f)
+    snapshot["sha256"] = "0" * 64
+    with open(os.path.join(archive, "snapshots", "two.json"), "w") as f:
+        json.dump(snapshot, f)
+
+    server.nethsm.keys.clear()
+    result = _run(server, "restore", "-p", "passphrase", "--archive", archive, "two")
+    assert result.exit_code != 0
+    assert "Could not read snapshot" in result.output
+    assert not server.nethsm.keys
+
+    result = _run(server, "restore", "-p", "passphrase", "--archive", archive, "one")
+    assert result.exit_code == 0, result.output
+    assert len(server.nethsm.keys) == 1
+
+
+def test_backup_file(
+    server: MockServer, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    filename = tmp_path / "backup"
+    with serve(error_rate=1.0) as failing:
+        result = _run(failing, "backup", str(filename), user="backup")
+    assert result.exit_code != 0
+    assert not filename.exists()
+
+    # the file is created after the check whether it exists
+    filename.write_bytes(b"previous")
+    monkeypatch.setattr(os.path, "exists", lambda path: False)
+    result = _run(server, "backup", str(filename), user="backup")
+    assert result.exit_code != 0
+    assert "already exists" in result.output
+    assert filename.read_bytes() == b"previous"
+
+
+def test_apply_keys(server: MockServer, tmp_path: Path) -> None:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ed25519
+
+    server.nethsm.keys.clear()
+    for key_id in ["existing", "wrongtype"]:
+        result = _run(
+            server,
+            "generate-key",
+            *("-t", "Curve25519", "-m", "EdDSA_Signature", "-l", "256"),
+            *("-k", key_id),
+        )
+        assert result.exit_code == 0, result.output
+
+    private_key = ed25519.Ed25519PrivateKey.generate().private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    (tmp_path / "imported.key").write_bytes(private_key)
+    keys: List[Dict[str, Any]] = [
+        {
+            "id": "existing",
+            "type": "Curve25519",
+            "mechanisms": ["EdDSA_Signature"],
+            "length": 256,
+            "tags": ["web"],
+        },
+        {
+            "id": "generated",
+            "type": "EC_P256",
+            "mechanisms": ["ECDSA_Signature"],
+            "length": 256,
+        },
+        {
+            "id": "imported",
+            "mechanisms": ["EdDSA_Signature"],
+            "private_key": "imported.key",
+        },
+        {
+            "id": "wrongtype",
+            "type": "EC_P256",
+            "mechanisms": ["ECDSA_Signature"],
+            "length": 256,
+        },
+    ]
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(json.dumps({"keys": keys}))
+
+    ids = [key["id"] for key in keys]
+
+    def status(output: str) -> Dict[str, str]:
+        rows = [line.split(None, 2) for line in output.splitlines()]
+        return {row[0]: row[1] for row in rows if len(row) > 1 and row[0] in ids}
+
+    result = _run(server, "apply-keys", "--dry-run", str(manifest))
+    assert result.exit_code != 0
+    assert status(result.output) == {
+        "existing": "changed",
+        "generated": "changed",
+        "imported": "changed",
+        "wrongtype": "failed",
+    }
+    assert "tag web added" in result.output
+    assert "Existing key has type Curve25519 instead of EC_P256" in result.output
+    assert sorted(server.nethsm.keys) == ["existing", "wrongtype"]
+    assert not server.nethsm.keys["existing"].tags
+
+    result = _run(server, "apply-keys", str(manifest))
+    assert result.exit_code != 0
+    assert "Failed to provision 1 key(s)" in result.output
+    assert status(result.output)["wrongtype"] == "failed"
+    assert sorted(server.nethsm.keys) == [
+        "existing",
+        "generated",
+        "imported",
+        "wrongtype",
+    ]
+    assert server.nethsm.keys["existing"].tags == ["web"]
+
+    # the existing keys are skipped
+    manifest.write_text(json.dumps({"keys": keys[:3]}))
+    result = _run(server, "apply-keys", str(manifest))
+    assert result.exit_code == 0, result.output
+    assert status(result.output) == {
+        "existing": "unchanged",
+        "generated": "unchanged",
+        "imported": "unchanged",
+    }
+
+
+def test_fan_out(server: MockServer) -> None:
+    with serve(error_rate=1.0) as failing:
+        hosts = [server.host, failing.host]
+        options = ["--json", "--no-verify-tls"]
+        for host in hosts:
+            options += ["-h", host]
+        result = CliRunner().invoke(nethsm, options + ["state"], input="")
+        table = CliRunner().invoke(nethsm, options[1:] + ["state"], input="")
+
+    assert table.exit_code != 0
+    assert "state failed on 1 of 2 hosts" in table.output
+    rows = [line.split() for line in table.output.splitlines()]
+    status = {row[0]: row[1] for row in rows if row and row[0] in hosts}
+    assert status == {server.host: "ok", failing.host: "failed:"}
+
+    assert result.exit_code != 0
+    assert "state failed on 1 of 2 hosts" in result.output
+    output = result.output[: result.output.rindex("]") + 1]
+    data = json.loads(output)
+    assert [item["host"] for item in data] == hosts
+    assert data[0]["status"] == "ok"
+    assert data[0]["error"] is None
+    assert data[0]["result"] == {"State": "Operational"}
+    assert data[1]["status"] == "failed"
+    assert data[1]["error"]
+    assert data[1]["result"] == {}
+
+    result = _run(server, "state")
+    assert result.exit_code == 0, result.output
+    assert "Operational" in result.output
+
+
+def test_random(server: MockServer) -> None:
+    result = _run(server, "random", "32", user="operator")
+    assert result.exit_code == 0, result.output
+    # stdout and stderr are mixed by CliRunner
+    [line] = result.output.splitlines()
+    assert len(base64.b64decode(line, validate=True)) == 32
+
+    result = _run(server, "--stats", "random", "32", user="operator")
+    assert result.exit_code == 0, result.output
+    assert "Retrieved 32 bytes" in result.output
+
+
+def test_restore_connect_error(
+    server: MockServer, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    opened = []
+
+    def connect(*args: Any, **kwargs: Any) -> None:
+        raise NetHSMError("Connection failed")
+
+    def open_file(*args: Any, **kwargs: Any) -> None:
+        opened.append(args)
+
+    monkeypatch.setattr(pynitrokey.nethsm, "connect", connect)
+    monkeypatch.setattr(cli_nethsm, "open", open_file, raising=False)
+    filename = tmp_path / "backup"
+    filename.write_bytes(b"backup")
+    result = _run(server, "restore", "-p", "passphrase", str(filename))
+    assert isinstance(result.exception, NetHSMError)
+    assert not opened
+
+
+def test_bench_admin_password(server: MockServer) -> None:
+    server.nethsm.keys.clear()
+    (_, passphrase) = DEFAULT_USERS["admin"]
+    args = ["bench", "-b", "sign-ed25519", "-d", "0.1", "--admin-password", passphrase]
+    result = _run(server, *args, user="operator")
+    assert result.exit_code == 2
+    assert "--admin-password requires --admin-username" in result.output
+    assert not server.nethsm.keys
+
+    result = _run(server, *args, "--admin-username", "admin", user="operator")
+    assert result.exit_code == 0, result.output
+    assert len(server.nethsm.keys) == 1
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""
+Tests for the parsing of key manifests, placed in nethsm/manifest.py.
+"""
+
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from pynitrokey.nethsm.manifest import load_manifest
+
+
+def _write(tmp_path: Path, key_id: Any) -> str:
+    path = tmp_path / "manifest.json"
+    key = {
+        "id": key_id,
+        "type": "Curve25519",
+        "mechanisms": ["EdDSA_Signature"],
+        "length": 256,
+    }
+    path.write_text(json.dumps({"keys": [key]}))
+    return str(path)
+
+
+@pytest.mark.parametrize("key_id", ["a", "Key1", "0123456789abcdefXYZ"])
+def test_key_id(tmp_path: Path, key_id: str) -> None:
+    [spec] = load_manifest(_write(tmp_path, key_id))
+    assert spec.key_id == key_id
+
+
+@pytest.mark.parametrize(
+    "key_id", [None, 1, "", "my-key", "a b", "a/b", "ключ", "١٢٣", "ａ"]
+)
+def test_invalid_key_id(tmp_path: Path, key_id: Any) -> None:
+    with pytest.raises(ValueError) as e:
+        load_manifest(_write(tmp_path, key_id))
+    assert "invalid key ID" in str(e.value)
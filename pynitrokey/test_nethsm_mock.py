@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""
+Tests for the NetHSM client against the mock NetHSM server.
+"""
+
+import asyncio
+import base64
+import datetime
+import hashlib
+import socket
+import threading
+import time
+import urllib.request
+from typing import Any
+
+import pytest
+
+from pynitrokey.conftest import _connect
+from pynitrokey.nethsm import NetHSMError
+from pynitrokey.nethsm.cluster import connect as connect_cluster
+from pynitrokey.nethsm.exporter import CONTENT_TYPE, MetricsExporter
+from pynitrokey.nethsm.mock import DEFAULT_USERS, VERSION, MockServer, serve
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+@pytest.mark.parametrize(
+    "type,mechanism,length,mode,message",
+    [
+        ("RSA", "RSA_Signature_PKCS1", 1024, "PKCS1", hashlib.sha256(b"a").digest()),
+        (
+            "RSA",
+            "RSA_Signature_PSS_SHA256",
+            1024,
+            "PSS_SHA256",
+            hashlib.sha256(b"a").digest(),
+        ),
+        ("EC_P256", "ECDSA_Signature", 256, "ECDSA", hashlib.sha256(b"a").digest()),
+        ("Curve25519", "EdDSA_Signature", 256, "EdDSA", b"message"),
+    ],
+)
+def test_sign(
+    server: MockServer,
+    type: str,
+    mechanism: str,
+    length: int,
+    mode: str,
+    message: bytes,
+) -> None:
+    with _connect(server.host, "admin") as nethsm:
+        nethsm.generate_key(type, [mechanism], length, "test")
+    with _connect(server.host, "operator") as nethsm:
+        signature = nethsm.sign("test", _b64(message), mode)
+        assert nethsm.verify("test", _b64(message), signature, mode)
+        assert not nethsm.verify("test", _b64(b"x" * len(message)), signature, mode)
+
+
+def test_encrypt_decrypt(server: MockServer) -> None:
+    with _connect(server.host, "admin") as nethsm:
+        nethsm.generate_key(
+            "Generic", ["AES_Encryption_CBC", "AES_Decryption_CBC"], 256, "aes"
+        )
+    with _connect(server.host, "operator") as nethsm:
+        message = _b64(b"m" * 32)
+        (encrypted, iv) = nethsm.encrypt("aes", message, "AES_CBC", _b64(b"i" * 16))
+        assert encrypted != message
+        assert nethsm.decrypt("aes", encrypted, "AES_CBC", iv) == message
+
+
+def test_random(server: MockServer) -> None:
+    with _connect(server.host, "operator") as nethsm:
+        assert len(nethsm.get_random_bytes(3000)) == 3000
+
+
+def test_access_denied(server: MockServer) -> None:
+    with _connect(server.host, "operator") as nethsm:
+        with pytest.raises(NetHSMError) as e:
+            nethsm.generate_key("Curve25519", ["EdDSA_Signature"], 256, "test")
+        assert e.value.status == 403
+
+
+def test_backup_restore(server: MockServer) -> None:
+    with _connect(server.host, "admin") as nethsm:
+        nethsm.generate_key("Curve25519", ["EdDSA_Signature"], 256, "test")
+    with _connect(server.host, "backup") as nethsm:
+        backup = nethsm.backup()
+
+    server.nethsm.keys.clear()
+    with _connect(server.host, "admin") as nethsm:
+        assert nethsm.list_keys(None) == []
+        nethsm.restore(backup, "passphrase", datetime.datetime.now())
+        assert nethsm.list_keys(None) == ["test"]
+
+
+def test_failover() -> None:
+    (_, passphrase) = DEFAULT_USERS["operator"]
+    with serve(error_rate=1.0) as failing, serve() as working:
+        hosts = [failing.host, working.host]
+        with connect_cluster(hosts, VERSION, "operator", passphrase, False) as cluster:
+            assert len(cluster.get_random_bytes(5000)) == 5000
+        assert working.nethsm.requests > 0
+        assert failing.nethsm.errors == failing.nethsm.requests
+
+
+def test_warm_up_reconnect(server: MockServer) -> None:
+    with _connect(server.host, "operator") as nethsm:
+        assert nethsm.warm_up(4) == 4
+        nethsm.get_random_bytes(10)
+        assert nethsm.reconnects == 0
+
+        # simulate connections that were closed by a middlebox
+        for conn in nethsm._pool().pool.queue:
+            if conn is not None:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+        nethsm.get_random_bytes(10)
+        assert nethsm.reconnects == 1
+
+
+def test_metrics_exporter(server: MockServer) -> None:
+    polls = []
+
+    with serve(error_rate=1.0) as failing, serve() as invalid:
+        with _connect(server.host, "metrics") as nethsm1, _connect(
+            failing.host, "metrics"
+        ) as nethsm2, _connect(invalid.host, "metrics") as nethsm3:
+            get_metrics = nethsm3.get_metrics
+
+            def get_invalid_metrics() -> Any:
+                # the first poll succeeds, then the responses are invalid
+                polls.append(time.monotonic())
+                if len(polls) > 1:
+                    raise ValueError("invalid response")
+                return get_metrics()
+
+            nethsm3.get_metrics = get_invalid_metrics  # type: ignore[assignment]
+            exporter = MetricsExporter([nethsm1, nethsm2, nethsm3], interval=0.05)
+            http_server = exporter.serve(("127.0.0.1", 0))
+            thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+            thread.start()
+            exporter.start()
+            try:
+                time.sleep(0.3)
+                assert all(thread.is_alive() for thread in exporter._threads)
+                port = http_server.server_address[1]
+                url = f"http://127.0.0.1:{port}/metrics"
+                with urllib.request.urlopen(url) as response:
+                    assert response.headers["Content-Type"] == CONTENT_TYPE
+                    text = response.read().decode()
+            finally:
+                exporter.stop()
+                http_server.shutdown()
+                http_server.server_close()
+
+    lines = text.splitlines()
+    assert lines[-1] == "# EOF"
+    assert "# TYPE nethsm_up gauge" in lines
+    assert f'nethsm_up{{host="{server.host}"}} 1' in lines
+    assert f'nethsm_up{{host="{failing.host}"}} 0' in lines
+    assert f'nethsm_up{{host="{invalid.host}"}} 0' in lines
+    assert f'nethsm_client_reconnects_total{{host="{server.host}"}} 0' in lines
+    # the metrics of the mock are only exported for the working host
+    host_lines = [line for line in lines if f'host="{server.host}"' in line]
+    assert len(host_lines) > 3
+    assert len(polls) > 2
+
+
+def test_async_client(server: MockServer) -> None:
+    pytest.importorskip("aiohttp")
+    from pynitrokey.nethsm.aio import connect as connect_async
+
+    with _connect(server.host, "admin") as nethsm:
+        nethsm.generate_key("Curve25519", ["EdDSA_Signature"], 256, "ed")
+        nethsm.generate_key(
+            "Generic", ["AES_Encryption_CBC", "AES_Decryption_CBC"], 256, "aes"
+        )
+
+    async def run() -> None:
+        (_, passphrase) = DEFAULT_USERS["operator"]
+        async with connect_async(
+            server.host, VERSION, "operator", passphrase, verify_tls=False
+        ) as nethsm:
+            key = await nethsm.get_key("ed")
+            assert key.type == "Curve25519"
+
+            message = _b64(b"message")
+            signature = await nethsm.sign("ed", message, "EdDSA")
+            with _connect(server.host, "operator") as sync_nethsm:
+                assert sync_nethsm.verify("ed", message, signature, "EdDSA")
+
+            message = _b64(b"m" * 32)
+            (encrypted, iv) = await nethsm.encrypt(
+                "aes", message, "AES_CBC", _b64(b"i" * 16)
+            )
+            assert encrypted != message
+            assert await nethsm.decrypt("aes", encrypted, "AES_CBC", iv) == message
+
+            with pytest.raises(NetHSMError) as e:
+                await nethsm.sign("a/b", message, "EdDSA")
+            assert e.value.status == 404
+
+    asyncio.run(run())
+
+
+def test_key_certificate(server: MockServer) -> None:
+    certificate = b"-----BEGIN CERTIFICATE-----\n...\n-----END CERTIFICATE-----\n"
+    with _connect(server.host, "admin") as nethsm:
+        nethsm.generate_key("Curve25519", ["EdDSA_Signature"], 256, "a")
+        nethsm.set_key_certificate("a", certificate, "application/x-pem-file")
+        assert nethsm.get_key_certificate("a") == certificate.decode()
+
+        # the key ID must not be interpreted as a part of the URL
+        with pytest.raises(NetHSMError) as e:
+            nethsm.get_key_certificate("a?")
+        assert e.value.status == 404
+        with pytest.raises(NetHSMError) as e:
+            nethsm.set_key_certificate("a?", certificate, "application/x-pem-file")
+        assert e.value.status == 404
+
+
+def test_sign_many(server: MockServer) -> None:
+    with _connect(server.host, "admin") as nethsm:
+        nethsm.generate_key("EC_P256", ["ECDSA_Signature"], 256, "test")
+    messages = [_b64(hashlib.sha256(bytes([i])).digest()) for i in range(20)]
+    with _connect(server.host, "operator") as nethsm:
+        signatures = list(nethsm.sign_many("test", messages, "ECDSA", workers=4))
+        assert len(signatures) == len(messages)
+        for (message, signature) in zip(messages, signatures):
+            assert nethsm.verify("test", message, signature, "ECDSA")
+
+        # the signatures before the invalid message are yielded
+        messages[5] = _b64(b"invalid")
+        signatures = []
+        with pytest.raises(NetHSMError) as e:
+            for signature in nethsm.sign_many("test", messages, "ECDSA", workers=4):
+                signatures.append(signature)
+        assert len(signatures) == 5
+        assert "Failed to sign message 6" in str(e.value)
+        assert e.value.status == 400
+
+
+def test_map_concurrent(server: MockServer) -> None:
+    calls = []
+
+    def func(i: int) -> int:
+        calls.append(i)
+        if i == 0:
+            raise NetHSMError("Injected error", status=500)
+        # finish in a different order than the items
+        time.sleep(0.01 * (i % 3))
+        return i * i
+
+    with _connect(server.host, "operator") as nethsm:
+        items = range(1, 50)
+        assert nethsm.map_concurrent(func, items, workers=4) == [i * i for i in items]
+        assert nethsm.map_concurrent(func, [], workers=4) == []
+
+        # the pending calls are cancelled after an error
+        calls.clear()
+        with pytest.raises(NetHSMError):
+            nethsm.map_concurrent(func, range(50), workers=4)
+        assert len(calls) < 50
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 Nitrokey Developers
+#
+# Licensed under the Apache License, Version 2.0, <LICENSE-APACHE or
+# http://apache.org/licenses/LICENSE-2.0> or the MIT license <LICENSE-MIT or
+# http://opensource.org/licenses/MIT>, at your option. This file may not be
+# copied, modified, or distributed except according to those terms.
+
+"""
+Tests for the timing statistics of the NetHSM client, placed in
+nethsm/stats.py.
+"""
+
+import pytest
+
+from pynitrokey.conftest import _connect
+from pynitrokey.nethsm import NetHSMError
+from pynitrokey.nethsm import stats as stats_module
+from pynitrokey.nethsm.mock import MockServer
+from pynitrokey.nethsm.stats import Histogram, RequestStats, endpoint_name
+
+
+@pytest.mark.parametrize(
+    "method,path,endpoint",
+    [
+        ("GET", "keys", "GET keys"),
+        ("GET", "keys?filter=web", "GET keys"),
+        ("POST", "keys/generate", "POST keys/generate"),
+        ("GET", "keys/generated", "GET keys/{KeyID}"),
+        ("POST", "keys/myKey/sign", "POST keys/{KeyID}/sign"),
+        ("GET", "keys/my%2FKey/public.pem", "GET keys/{KeyID}/public.pem"),
+        (
+            "PUT",
+            "keys/myKey/restrictions/tags/web",
+            "PUT keys/{KeyID}/restrictions/tags/{Tag}",
+        ),
+        ("GET", "users/operator", "GET users/{UserID}"),
+        ("DELETE", "users/operator/tags/web", "DELETE users/{UserID}/tags/{Tag}"),
+        ("POST", "system/backup", "POST system/backup"),
+    ],
+)
+def test_endpoint_name(method: str, path: str, endpoint: str) -> None:
+    assert endpoint_name(method, f"https://nethsm:8443/api/v1/{path}") == endpoint
+
+
+def test_histogram(monkeypatch: pytest.MonkeyPatch) -> None:
+    histogram = Histogram()
+    assert histogram.percentile(50) is None
+    for value in reversed(range(1, 101)):
+        histogram.add(value)
+    percentiles = [histogram.percentile(p) for p in [0, 1, 50, 95, 99, 100]]
+    assert percentiles == [1, 1, 50, 95, 99, 100]
+
+    histogram = Histogram()
+    histogram.add(7)
+    assert [histogram.percentile(p) for p in [0, 50, 100]] == [7, 7, 7]
+
+    monkeypatch.setattr(stats_module, "RESERVOIR_SIZE", 10)
+    histogram = Histogram()
+    for value in range(1000):
+        histogram.add(value)
+    assert histogram.count == 1000
+    assert histogram.sum == sum(range(1000))
+    assert len(histogram.samples) == 10
+
+
+def test_request_stats(server: MockServer) -> None:
+    stats = RequestStats()
+    with _connect(server.host, "admin", stats=stats) as nethsm:
+        nethsm.generate_key("Curve25519", ["EdDSA_Signature"], 256, "a")
+        nethsm.get_key_public_key("a")
+        nethsm.get_key_public_key("a")
+        with pytest.raises(NetHSMError):
+            nethsm.get_key_public_key("b")
+
+    summary = stats.summary(percentiles=(50, 100))
+    assert set(summary) == {"POST keys/generate", "GET keys/{KeyID}/public.pem"}
+    public_key = summary["GET keys/{KeyID}/public.pem"]
+    (count, [p50, p100]) = public_key["total"]
+    assert count == 3
+    assert 0 < p50 <= p100
+    assert stats.endpoints["GET keys/{KeyID}/public.pem"].errors == 1
+    assert stats.endpoints["POST keys/generate"].errors == 0
+    # only the first request opens a connection
+    assert summary["POST keys/generate"]["connect"][0] == 1
+    assert "connect" not in public_key
+
+    # nested calls are measured as part of the outer call
+    with stats.measure("outer"):
+        with stats.measure("inner"):
+            pass
+    assert "outer" in stats.endpoints
+    assert "inner" not in stats.endpoints
@@ -0,0 +1,47 @@
+"""
+Tests for the hotplug watcher, placed in nk3/hotplug.py, and its use with
+Retries.  Uses a temporary directory instead of /dev, so it does not require
+a device.
+"""
+
+import platform
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from pynitrokey.helpers import Retries
+from pynitrokey.nk3 import hotplug
+
+pytestmark = pytest.mark.skipif(
+    platform.system() != "Linux", reason="hotplug events require Linux"
+)
+
+
+def test_watch(tmp_path: Path) -> None:
+    watcher = hotplug.watch(str(tmp_path))
+    assert watcher is not None
+    with watcher:
+        assert not watcher.wait(0.05)
+        (tmp_path / "ttyS0").touch()
+        assert not watcher.wait(0.05)
+        (tmp_path / "hidraw3").touch()
+        assert watcher.wait(0.05)
+        # udev changes the permissions after creating the node
+        (tmp_path / "hidraw3").chmod(0o600)
+        assert watcher.wait(0.05)
+
+
+def test_retries_wake_up(tmp_path: Path) -> None:
+    watcher = hotplug.watch(str(tmp_path))
+    assert watcher is not None
+    timer = threading.Timer(0.2, (tmp_path / "ttyACM0").touch)
+    timer.start()
+    start = time.monotonic()
+    with watcher:
+        for t in Retries(3, timeout=5, wait=watcher.wait):
+            if (tmp_path / "ttyACM0").exists():
+                break
+    timer.join()
+    assert time.monotonic() - start < 2
@@ -0,0 +1,209 @@
+"""
+Tests for updating several Nitrokey 3 devices at once, placed in
+cli/nk3/update.py.  Uses fake devices and does not require a device.
+"""
+
+import importlib
+from typing import Any, Callable, Collection, Dict, List, Optional, Set, Tuple
+
+import pytest
+from click import Abort
+
+from pynitrokey.cli.exceptions import CliException
+from pynitrokey.cli.nk3 import Context
+from pynitrokey.nk3.bootloader import FirmwareContainer, Nitrokey3Bootloader, Variant
+from pynitrokey.nk3.device import Nitrokey3Device
+from pynitrokey.nk3.utils import Uuid, Version
+
+# the module is shadowed by the update command in pynitrokey.cli.nk3
+update = importlib.import_module("pynitrokey.cli.nk3.update")
+
+
+class FakeDevices:
+    """The connected devices, indexed by their UUID.  A device is either in
+    firmware mode at /dev/hidrawN or in bootloader mode at /dev/hidraw1N.
+    The paths of all opened devices are recorded, and on_list is called
+    when the firmware devices are enumerated."""
+
+    def __init__(self, *uuids: int) -> None:
+        self.bootloader: Dict[int, bool] = {uuid: False for uuid in uuids}
+        self.opened: List[str] = []
+        self.closed: Set[str] = set()
+        self.on_list: Optional[Callable[[], None]] = None
+
+    def path(self, uuid: int) -> str:
+        return f"/dev/hidraw{uuid + 10 if self.bootloader[uuid] else uuid}"
+
+    def list_devices(self, exclude: Collection[str] = ()) -> List[Nitrokey3Device]:
+        if self.on_list:
+            self.on_list()
+        devices: List[Nitrokey3Device] = []
+        for (uuid, bootloader) in self.bootloader.items():
+            if not bootloader and self.path(uuid) not in exclude:
+                self.opened.append(self.path(uuid))
+                devices.append(FakeDevice(self, uuid))
+        return devices
+
+    def list_bootloaders(self) -> List[Nitrokey3Bootloader]:
+        return [
+            FakeBootloader(self, uuid)
+            for (uuid, bootloader) in self.bootloader.items()
+            if bootloader
+        ]
+
+
+class FakeDevice(Nitrokey3Device):
+    def __init__(self, devices: FakeDevices, uuid: int) -> None:
+        self.devices = devices
+        self._uuid = uuid
+        self._path = devices.path(uuid)
+
+    def uuid(self) -> Uuid:
+        return Uuid(self._uuid)
+
+    def version(self) -> Version:
+        return Version(1, 4, 0)
+
+    def close(self) -> None:
+        self.devices.closed.add(self.path)
+
+
+class FakeBootloader(Nitrokey3Bootloader):
+    def __init__(self, devices: FakeDevices, uuid: int) -> None:
+        self.devices = devices
+        self._uuid = uuid
+        self._path = devices.path(uuid)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def name(self) -> str:
+        return "Nitrokey 3 Bootloader"
+
+    @property
+    def variant(self) -> Variant:
+        return Variant.LPC55
+
+    def __enter__(self) -> "FakeBootloader":
+        # the LPC55 bootloader is opened to query the UUID
+        self.devices.opened.append(self.path)
+        return self
+
+    def close(self) -> None:
+        self.devices.closed.add(self.path)
+
+    def reboot(self) -> bool:
+        return True
+
+    def uuid(self) -> Uuid:
+        return Uuid(self._uuid)
+
+    def update(self, image: bytes, callback: Any = None) -> None:
+        pass
+
+
+class FakeContext(Context):
+    def __init__(self, devices: FakeDevices) -> None:
+        super().__init__(None)
+        self.devices = devices
+
+    def list(self) -> List[Any]:
+        return self.devices.list_bootloaders() + self.devices.list_devices()
+
+
+@pytest.fixture
+def devices(monkeypatch: pytest.MonkeyPatch) -> FakeDevices:
+    devices = FakeDevices(1, 2, 3)
+    monkeypatch.setattr(update.bootloader, "list", devices.list_bootloaders)
+    monkeypatch.setattr(Nitrokey3Device, "list", staticmethod(devices.list_devices))
+    return devices
+
+
+def _list(devices: FakeDevices, claims: Any, uuid: int) -> Tuple[List[str], List[str]]:
+    """List the devices for a worker and return their paths and the paths
+    opened while listing."""
+    devices.opened.clear()
+    ctx = update.UuidContext(Uuid(uuid), claims)
+    return ([device.path for device in ctx.list()], devices.opened)
+
+
+def test_uuid_context(devices: FakeDevices) -> None:
+    claims = update.DeviceClaims()
+    claims.paths[Uuid(2)] = "/dev/hidraw2"
+
+    (paths, opened) = _list(devices, claims, 1)
+    assert paths == ["/dev/hidraw1"]
+    assert "/dev/hidraw2" not in opened
+    # the unclaimed device that was opened while listing is closed
+    assert devices.closed == {"/dev/hidraw3"}
+    assert claims.paths == {Uuid(1): "/dev/hidraw1", Uuid(2): "/dev/hidraw2"}
+
+    # the claim follows the devices to their bootloader paths
+    devices.bootloader[1] = True
+    devices.bootloader[2] = True
+    claims.paths[Uuid(2)] = "/dev/hidraw12"
+    (paths, opened) = _list(devices, claims, 1)
+    assert paths == ["/dev/hidraw11"]
+    assert "/dev/hidraw12" not in opened
+    assert claims.paths[Uuid(1)] == "/dev/hidraw11"
+
+    (paths, opened) = _list(devices, claims, 3)
+    assert paths == ["/dev/hidraw3"]
+    assert not set(opened) & {"/dev/hidraw11", "/dev/hidraw12"}
+
+    # and back to the firmware path after the update
+    devices.bootloader[1] = False
+    (paths, _) = _list(devices, claims, 1)
+    assert paths == ["/dev/hidraw1"]
+    assert claims.paths[Uuid(1)] == "/dev/hidraw1"
+
+    # a device is not found while it is used by another worker
+    claims.paths[Uuid(1)] = "/dev/hidraw1"
+    (paths, opened) = _list(devices, claims, 4)
+    assert paths == []
+    assert "/dev/hidraw1" not in opened
+
+
+def test_uuid_context_lock(devices: FakeDevices) -> None:
+    claims = update.DeviceClaims()
+    locked = []
+
+    def on_list() -> None:
+        locked.append(claims.lock.locked())
+        # another worker claims the path while this worker is probing
+        claims.paths[Uuid(2)] = "/dev/hidraw1"
+
+    devices.on_list = on_list
+    (paths, _) = _list(devices, claims, 1)
+    # the other workers are not blocked during the enumeration
+    assert locked == [False]
+    assert paths == []
+    assert "/dev/hidraw1" in devices.closed
+    assert Uuid(1) not in claims.paths
+
+
+def test_update_all_closes_devices(
+    devices: FakeDevices, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    container = FirmwareContainer(version=Version(1, 5, 0), pynitrokey=None, images={})
+
+    def prepare_update(*args: Any, **kwargs: Any) -> FirmwareContainer:
+        if error:
+            raise CliException("Failed to download the firmware")
+        return container
+
+    monkeypatch.setattr(update.Updater, "prepare_update", prepare_update)
+    monkeypatch.setattr(update, "confirm", lambda *args, **kwargs: False)
+
+    error = True
+    with pytest.raises(CliException):
+        update.update_all(FakeContext(devices), None, None, False)
+    assert devices.closed == {"/dev/hidraw1", "/dev/hidraw2", "/dev/hidraw3"}
+
+    devices.closed.clear()
+    error = False
+    with pytest.raises(Abort):
+        update.update_all(FakeContext(devices), None, None, False)
+    assert devices.closed == {"/dev/hidraw1", "/dev/hidraw2", "/dev/hidraw3"}
@@ -82,6 +82,21 @@ def test_calculate(secretsAppResetLogin):
     print(code)
 
 
+def test_calculate_all(secretsAppResetLogin):
+    """
+    Run calculation of all codes. TOTP credentials should give the same codes as the single calculation,
+    HOTP credentials should not be calculated.
+    """
+    secretsAppResetLogin.register(CREDID, SECRET, DIGITS, kind=Kind.Totp)
+    secretsAppResetLogin.verify_pin_raw(PIN)
+    secretsAppResetLogin.register(CREDID2, SECRET, DIGITS, kind=Kind.Hotp)
+    secretsAppResetLogin.verify_pin_raw(PIN)
+    codes = secretsAppResetLogin.calculate_all(CHALLENGE)
+    secretsAppResetLogin.verify_pin_raw(PIN)
+    assert codes[CREDID.encode()] == secretsAppResetLogin.calculate(CREDID, CHALLENGE)
+    assert codes[CREDID2.encode()] is None
+
+
 def test_delete(secretsAppResetLogin):
     """
     Remove credential with the given id. Simple test.
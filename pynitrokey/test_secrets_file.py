@@ -0,0 +1,69 @@
+"""
+Tests for reading Secrets App credentials from files, placed in secrets_file.py.
+Does not require a device.
+"""
+
+import io
+import json
+
+from pynitrokey.nk3.secrets_app import Algorithm, Kind
+from pynitrokey.nk3.secrets_file import parse_otpauth_uri, read_credentials
+
+
+def test_parse_otpauth_uri() -> None:
+    entry = parse_otpauth_uri(
+        "otpauth://hotp/alice%40example.com?secret=JBSWY3DPEHPK3PXP"
+        "&issuer=Example&algorithm=SHA256&digits=8&counter=5"
+    )
+    assert entry.name == "Example:alice@example.com"
+    assert entry.secret == b"Hello!\xde\xad\xbe\xef"
+    assert entry.kind == Kind.Hotp
+    assert entry.algorithm == Algorithm.Sha256
+    assert entry.digits == 8
+    assert entry.counter == 5
+
+
+def test_read_credentials_errors() -> None:
+    data = (
+        "name,secret,kind,protect_with_pin\n"
+        "one,JBSWY3DPEHPK3PXP,TOTP,yes\n"
+        "two,,TOTP,\n"
+        "three,JBSWY3DPEHPK3PXP,HMAC,\n"
+    )
+    (entries, errors, warnings) = read_credentials(io.StringIO(data), "csv")
+    assert [entry.name for entry in entries] == ["one"]
+    assert entries[0].protect_with_pin
+    assert [error.position for error in errors] == [3, 4]
+    assert not warnings
+
+
+def test_read_credentials_csv_columns() -> None:
+    data = (
+        "name,issuer,secret,icon\n"
+        "alice,Example,JBSWY3DPEHPK3PXP,example.png\n"
+        "bob,,JBSWY3DPEHPK3PXP,,surplus\n"
+    )
+    (entries, errors, warnings) = read_credentials(io.StringIO(data), "csv")
+    assert [entry.name for entry in entries] == ["Example:alice"]
+    assert [(error.position, error.message) for error in errors] == [
+        (3, "The row has 1 more cell(s) than the header")
+    ]
+    assert warnings == ["Ignored unknown fields: icon"]
+
+
+def test_read_credentials_json_types() -> None:
+    secret = "JBSWY3DPEHPK3PXP"
+    data = json.dumps(
+        [
+            {"name": "one", "secret": secret, "digits": 8.0},
+            {"name": "two", "secret": secret, "digits": [6]},
+            {"name": "three", "secret": secret, "counter": {}},
+            {"name": "four", "secret": secret, "digits": 6.9},
+            {"name": ["five"], "secret": secret},
+            {"name": "six", "secret": 1234},
+        ]
+    )
+    (entries, errors, _) = read_credentials(io.StringIO(data), "json")
+    assert [(entry.name, entry.digits) for entry in entries] == [("one", 8)]
+    assert [error.position for error in errors] == [2, 3, 4, 5, 6]
+    assert all(error.message.startswith("Invalid") for error in errors)
@@ -0,0 +1,152 @@
+"""
+Tests for the Secrets App shell, placed in cli/nk3/secrets.py.
+Uses a fake SecretsApp and does not require a device.
+"""
+
+from typing import Any, List
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from pynitrokey.cli.nk3 import Context
+from pynitrokey.cli.nk3 import secrets as secrets_cli
+from pynitrokey.cli.nk3.secrets import (
+    PIN_ENVVAR,
+    SecretsSession,
+    repeat_if_pin_needed,
+    run_in_session,
+    secrets,
+)
+from pynitrokey.nk3.secrets_app import (
+    SecretsAppException,
+    SecretsAppExceptionID,
+    SelectResponse,
+)
+
+PIN = "1234"
+
+
+class FakeDevice:
+    def __enter__(self) -> "FakeDevice":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+
+class FakeApp:
+    """Stores the names of deleted credentials.  Deleting a credential
+    starting with "locked" requires the PIN."""
+
+    def __init__(self, device: Any) -> None:
+        self.deleted: List[bytes] = []
+        self.pins: List[str] = []
+
+    def _require_pin(self) -> None:
+        if PIN not in self.pins:
+            raise SecretsAppException(
+                hex(SecretsAppExceptionID.SecurityStatusNotSatisfied)[2:], ""
+            )
+
+    def select(self) -> SelectResponse:
+        return SelectResponse(b"\x04\x0b\x00", 8, None, None, None, None)
+
+    def protocol_v2_confirm_all_requests_with_pin(self) -> bool:
+        return False
+
+    def feature_challenge_response_support(self) -> bool:
+        return False
+
+    def feature_old_application_version(self) -> bool:
+        return False
+
+    def is_pin_healthy(self) -> bool:
+        return True
+
+    def verify_pin_raw(self, pin: str) -> None:
+        self.pins.append(pin)
+
+    def list_with_properties(self) -> List[Any]:
+        return []
+
+    def delete(self, name: bytes) -> None:
+        if name.startswith(b"locked"):
+            self._require_pin()
+        self.deleted.append(name)
+
+    def reset(self) -> None:
+        self.deleted.append(b"*")
+
+
+class FakeContext(Context):
+    def __init__(self) -> None:
+        super().__init__(None)
+
+    def connect_device(self) -> Any:
+        return FakeDevice()
+
+
+@pytest.fixture(autouse=True)
+def fake_app(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(secrets_cli, "SecretsApp", FakeApp)
+    monkeypatch.setattr(repeat_if_pin_needed, "cached_PIN", None, raising=False)
+    monkeypatch.delenv(PIN_ENVVAR, raising=False)
+
+
+def _session(interactive: bool) -> SecretsSession:
+    return SecretsSession(None, FakeDevice(), interactive)  # type: ignore[arg-type]
+
+
+def _run(session: SecretsSession, name: str, *args: str) -> bool:
+    ctx = click.Context(secrets, obj=FakeContext())
+    command = secrets.get_command(ctx, name)
+    assert command is not None
+    with ctx:
+        return run_in_session(ctx, session, name, command, list(args))
+
+
+def test_run_in_session() -> None:
+    session = _session(interactive=False)
+    app: FakeApp = session.app  # type: ignore[assignment]
+    assert _run(session, "remove", "one")
+    assert not _run(session, "remove", "locked")
+    assert not _run(session, "reset")
+    assert not _run(session, "set-pin")
+    assert not _run(session, "remove")
+    assert app.deleted == [b"one"]
+    assert app.pins == []
+
+
+def test_run_in_session_pin_envvar(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv(PIN_ENVVAR, PIN)
+    session = _session(interactive=False)
+    app: FakeApp = session.app  # type: ignore[assignment]
+    assert _run(session, "remove", "locked")
+    assert _run(session, "reset", "--force")
+    assert not _run(session, "set-pin")
+    assert app.deleted == [b"locked", b"*"]
+    assert app.pins == [PIN]
+
+
+def test_shell_failures() -> None:
+    script = "\n".join(
+        [
+            "# comment",
+            "remove one",
+            "remove locked",
+            "unknown",
+            "reset",
+            "list",
+            "remove two",
+        ]
+    )
+    result = CliRunner().invoke(secrets, ["shell"], input=script, obj=FakeContext())
+    assert result.exit_code == 1
+    assert "3 command(s) failed" in result.output
+
+    result = CliRunner().invoke(
+        secrets, ["shell", "--stop-on-error"], input=script, obj=FakeContext()
+    )
+    assert result.exit_code == 1
+    assert "1 command(s) failed" in result.output